@@ -51,9 +51,31 @@ class PerfConfigurator(Configuration):
         ('results_urls', {'help': 'URL of graphserver or file:// url for local output',
                          'flags': ['--results_url'],
                          'type': list}),
+        ('results_gzip', {'help': 'gzip the posts to the graphserver, if it accepts gzip Content-Encoding',
+                          'type': bool,
+                          'flags': ['--results-gzip']}),
+        ('results_batch', {'help': 'number of results posted per request to a graphserver that collects several',
+                           'type': int,
+                           'flags': ['--results-batch']}),
         ('datazilla_urls', {'help': 'URL of datazilla server of file:// url for local output',
                             'flags': ['--datazilla-url'],
                             'type': list}),
+        ('datazilla_no_log', {'help': "don't log the datazilla datasets on the TALOSDATA line",
+                              'type': bool,
+                              'flags': ['--datazilla-no-log']}),
+        ('perfherder_urls', {'help': 'URL to post a perfherder JSON document of the results to, or file:// url for local output',
+                             'flags': ['--perfherder-url'],
+                             'type': list}),
+        ('perfherder_gzip', {'help': 'gzip the perfherder JSON document',
+                             'type': bool,
+                             'flags': ['--perfherder-gzip']}),
+        ('replicates_urls', {'help': 'file:// url of a file, or of a directory, to write the raw replicates and counters of the results to in binary columns',
+                             'flags': ['--replicates-url'],
+                             'type': list}),
+        ('results_spool', {'help': 'directory to always keep a local copy of the results of each output format in',
+                           'flags': ['--resultsSpool']}),
+        ('results_store', {'help': 'SQLite database to record the results in, for compare.py --store',
+                           'flags': ['--resultsStore']}),
         ('authfile', {'help': """File of the form
 http://hg.mozilla.org/build/buildbot-configs/file/default/mozilla/passwords.py.template
 for datazilla auth.  Should have keys 'oauthSecret' and 'oauthKey'"""}),
@@ -71,6 +93,9 @@ for datazilla auth.  Should have keys 'oauthSecret' and 'oauthKey'"""}),
                  'type': bool}),
         ('mainthread', {'help': "Collect mainthread IO data from the browser by setting an environment variable",
                  'type': bool}),
+        ('mainthread_tail', {'help': "Read the mainthread IO log while the browser is running",
+                             'type': bool,
+                             'flags': ['--mainthreadTail']}),
         ('tpmozafterpaint', {'help': 'wait for MozAfterPaint event before recording the time',
                              'type': bool,
                              'flags': ['--mozAfterPaint']}),
@@ -83,6 +108,9 @@ for datazilla auth.  Should have keys 'oauthSecret' and 'oauthKey'"""}),
         ('sps_profile_entries', {'help': 'How many samples to take with the profiler',
                              'type': int,
                              'flags': ['--spsProfileEntries']}),
+        ('sps_profile_compression_level', {'help': 'zlib compression level (-1 to 9) of the profile archive; 0 stores the profiles uncompressed, which is fastest, and 1 deflates them fastest',
+                             'type': int,
+                             'flags': ['--spsProfileCompressionLevel']}),
         ('extensions', {'help': 'Extension to install while running',
                         'default': ['${talos}/pageloader'],
                         'flags': ['--extension']}),
@@ -351,8 +379,10 @@ the highest value.
                         'sps_profile',
                         'sps_profile_interval',
                         'sps_profile_entries',
+                        'sps_profile_compression_level',
                         'rss',
                         'mainthread',
+                        'mainthread_tail',
                         'shutdown',
                         'tpcycles',
                         'tpdelay',
@@ -473,6 +503,11 @@ the highest value.
         if not 'print_tests' in self.parsed and not self.config.get('browser_path'):
             self.error(msg)
 
+        # ensure the profile archive can be written
+        compression_level = self.config.get('sps_profile_compression_level')
+        if compression_level is not None and compression_level not in range(-1, 10):
+            raise ConfigurationError("sps_profile_compression_level must be a zlib compression level from -1 to 9, not %s" % compression_level)
+
         # BBB: (resultsServer, resultsLink) -> results_url
         resultsServer = self.config.pop('resultsServer', None)
         resultsLink = self.config.pop('resultsLink', None)
@@ -887,11 +922,13 @@ the highest value.
         - a dictionary of options for each format
         """
 
-        outputs = ['results_urls', 'datazilla_urls']
+        outputs = ['results_urls', 'datazilla_urls', 'perfherder_urls', 'replicates_urls']
         results_urls = dict([(key, self.config[key]) for key in outputs
                              if key in self.config])
         results_options = {}
-        options = {'datazilla_urls': ['authfile']}
+        options = {'datazilla_urls': ['authfile', 'datazilla_no_log'],
+                   'perfherder_urls': ['perfherder_gzip'],
+                   'results_urls': ['results_gzip', 'results_batch']}
         for key, values in options.items():
             for item in values:
                 value = self.config.get(item)
@@ -917,6 +954,8 @@ the highest value.
                     'port': self.config.get('deviceport', ''), # XXX names should match!
                     'process': '',
                     'remote': False,
+                    'results_spool': None,
+                    'results_store': None,
                     'fennecIDs': '',
                     'repository': None,
                     'sourcestamp': None,
@@ -2,17 +2,26 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
-import json, urllib, httplib
+import json, httplib
 import datetime, time
 from argparse import ArgumentParser
 import sys
 import os
 import filter
+import graphfetch
+import resultstore
+import test
 
 SERVER = 'graphs.mozilla.org'
 selector = '/api/test/runs'
 debug = 1
 
+# fetches graph server data concurrently, each series once; main() sets up its parallelism and cache
+fetcher = graphfetch.GraphFetcher(SERVER, selector, debug=debug)
+
+# how old, in seconds, the graph server data in a results store may get before it is fetched again
+SYNC_AGE = 6 * 60 * 60
+
 branch_map = {}
 branch_map['Try']     = {'pgo':    {'id': 23, 'name': 'Try'},
                          'nonpgo': {'id': 113, 'name': 'Try'}}
@@ -28,7 +37,7 @@ branch_map['UX']      = {'pgo':    {'id': 59, 'name': 'UX'},
                          'nonpgo': {'id': 137, 'name': 'UX-Non-PGO'}}
 branches = ['Try', 'Firefox', 'Inbound', 'Aurora', 'Beta', 'Cedar', 'UX']
 
-# TODO: pull test names and reverse_tests from test.py in the future
+# TODO: pull test names from test.py in the future
 test_map = {}
 test_map['dromaeo_css'] = {'id': 72, 'tbplname': 'dromaeo_css'}
 test_map['dromaeo_dom'] = {'id': 73, 'tbplname': 'dromaeo_dom'}
@@ -59,7 +68,13 @@ test_map['remote-tp4m_nochrome'] = {'id': 85, 'tbplname': 'tp4m'}
 
 tests = ['tresize', 'kraken', 'v8_7', 'dromaeo_css', 'dromaeo_dom', 'a11yr', 'ts_paint', 'tpaint', 'tsvgr_opacity', 'tp5n', 'tp5o', 'tart', 'tcanvasmark', 'tsvgx', 'tscrollx', 'sessionrestore', 'sessionrestore_no_auto_restore', 'glterrain', 'cart', 'tp5o_scroll', 'media_tests' ]
 android_tests = ['remote-trobocheck2', 'remote-trobopan', 'remote-troboprovider', 'remote-tsvgx', 'remote-tp4m_nochrome']
-reverse_tests = ['dromaeo_css', 'dromaeo_dom', 'v8', 'canvasmark']
+
+def lowerIsBetter(name):
+    """whether lower results of the test |name| are better, as test.py defines it"""
+    test_class = test.test_dict.get(name) or test.test_dict.get(test_map.get(name, {}).get('tbplname'))
+    return test_class is None or test_class.lower_is_better
+
+reverse_tests = [name for name in test_map if not lowerIsBetter(name)]
 
 platform_map = {}
 platform_map['Linux'] = 33 #14 - 14 is the old fedora, we are now on Ubuntu slaves
@@ -104,27 +119,83 @@ def getListOfTests(platform, tests):
                 tests.remove(t)
     return tests
 
-def getGraphData(testid, branchid, platformid):
-    body = {"id": testid, "branchid": branchid, "platformid": platformid}
-    if debug >= 3:
-        print "Querying graph server for: %s" % body
-    params = urllib.urlencode(body)
-    headers = {"Content-type": "application/x-www-form-urlencoded", "Accept": "text/plain"}
-    conn = httplib.HTTPConnection(SERVER)
-    conn.request("POST", selector, params, headers)
-    response = conn.getresponse()
-    data = response.read()
-
-    if data:
-        try:
-            data = json.loads(data)
-        except:
-            print "NOT JSON: %s" % data
+def platformTests(platform, tests):
+    if platform == "Android":
+        return android_tests
+    return getListOfTests(platform, tests)
+
+def branchIds(platform, branch, masterbranch, pgo=False):
+    """the graph server ids of the tested |branch| and of the |masterbranch| on |platform|"""
+    ids = []
+    for b in (branch, masterbranch):
+        if platform.startswith('OSX') or platform.startswith('Android') or pgo:
+            bid = branch_map[b]['pgo']['id']
+            # Hack for talos on Android Firefox, since we use different
+            # numbers for pgo and android builds.
+            if platform.startswith('Android') and b == 'Firefox':
+                bid = 11
+        else:
+            bid = branch_map[b]['nonpgo']['id']
+        ids.append(bid)
+    return tuple(ids)
+
+def prefetchGraphData(branch, masterbranch, platforms, tests, pgo=False, compare_e10s=False, store=None, maxAge=SYNC_AGE):
+    """
+    fetch the graph server data compareResults needs, all at once; with a
+    results |store|, only the series it hasn't synced in the last |maxAge|
+    seconds
+    """
+    keys = []
+    for p in platforms:
+        test_bid, bid = branchIds(p, branch, masterbranch, pgo)
+        test_p = p + " (e10s)" if compare_e10s else p
+        for t in platformTests(p, tests):
+            for b, platform in ((bid, p), (test_bid, test_p)):
+                if store is None or store.is_stale(t, branchName(b), platform, maxAge):
+                    keys.append((test_map[t]['id'], b, platform_map[platform]))
+    fetcher.fetch_all(keys)
+
+def getGraphData(testid, branchid, platformid, store=None, series=None, maxAge=SYNC_AGE):
+    """
+    the graph server data of a test on a branch and platform; with a
+    results |store| and the (test, branch, platform) names of the |series|,
+    from the store, once it is synced with the graph server
+    """
+    if store is not None:
+        syncGraphData(store, series, testid, branchid, platformid, maxAge)
+        runs = store.runs(*series)
+        if not runs:
             return None
+        return {'stat': 'ok',
+                'test_runs': [[run_id, [None, None, revision], date, value]
+                              for date, revision, value, run_id in runs]}
+
+    return fetcher.fetch(testid, branchid, platformid)
+
+def syncGraphData(store, series, testid, branchid, platformid, maxAge=SYNC_AGE):
+    """
+    fetch the graph server runs of the (test, branch, platform) |series|
+    into the results |store|, unless they were fetched in the last |maxAge|
+    seconds
+    """
+    if not store.is_stale(series[0], series[1], series[2], maxAge):
+        return
+    data = getGraphData(testid, branchid, platformid)
+    if data:
+        runs = [(run[2], run[1][2], run[3], run[0]) for run in data['test_runs']]
+        store.add_runs(series[0], series[1], series[2], runs, synced=int(time.time()))
 
-    if data['stat'] == 'fail':
-        return None
-    return data
+def summarize(vals):
+    low = sys.maxint
+    high = 0
+    average = 0
+    geomean = 0
+    if vals:
+        low = min(vals)
+        high = max(vals)
+        average = filter.mean(vals)
+        geomean = filter.geometric_mean(vals)
+    return {'low': low, 'high': high, 'avg': average, 'geomean': geomean, 'count': len(vals), 'data': vals}
 
 # TODO: consider moving this to mozinfo or datazilla_client
 def getDatazillaPlatform(os, platform, osversion, product):
@@ -256,64 +327,24 @@ def getDatazillaData(branchid):
     return alldata
 
 def parseGraphResultsByDate(data, start, end):
-    low = sys.maxint
-    high = 0
-    count = 0
-    runs = data['test_runs']
-    vals = []
-    for run in runs:
-        if run[2] >= start and run[2] <= end:
-            vals.append(run[3])
-            if run[3] < low:
-                low = run[3]
-            if run[3] > high:
-                high = run[3]
-            count += 1
-
-    average = 0
-    geomean = 0
-    if count > 0:
-        average = filter.mean(vals)
-        geomean = filter.geometric_mean(vals)
-    return {'low': low, 'high': high, 'avg': average, 'geomean': geomean, 'count': count, 'data': vals}
+    return summarize([run[3] for run in data['test_runs'] if run[2] >= start and run[2] <= end])
 
 def parseGraphResultsByChangeset(data, changeset):
-    low = sys.maxint
-    high = 0
-    count = 0
-    runs = data['test_runs']
-    vals = []
-    for run in runs:
-        push = run[1]
-        cset = push[2]
-        if cset == changeset:
-            vals.append(run[3])
-            if run[3] < low:
-                low = run[3]
-            if run[3] > high:
-                high = run[3]
-            count += 1
-
-    average = 0
-    geomean = 0
-    if count > 0:
-        average = filter.mean(vals)
-        geomean = filter.geometric_mean(vals)
-    return {'low': low, 'high': high, 'avg': average, 'geomean': geomean, 'count': count, 'data': vals}
+    return summarize([run[3] for run in data['test_runs'] if run[1][2] == changeset])
 
-def compareResults(revision, branch, masterbranch, skipdays, history, platforms, tests, pgo=False, printurl=False, compare_e10s=False, dzdata=None, pgodzdata=None, verbose=False, doPrint=False):
+def compareResults(revision, branch, masterbranch, skipdays, history, platforms, tests, pgo=False, printurl=False, compare_e10s=False, dzdata=None, pgodzdata=None, verbose=False, doPrint=False, store=None, maxAge=SYNC_AGE):
     startdate = int(time.mktime((datetime.datetime.now() - datetime.timedelta(days=(skipdays+history))).timetuple()))
     enddate = int(time.mktime((datetime.datetime.now() - datetime.timedelta(days=skipdays)).timetuple()))
 
+    prefetchGraphData(branch, masterbranch, platforms, tests, pgo, compare_e10s, store, maxAge)
+
     if doPrint:
         print "   test\t\t\tmin.\t->\tmax.\trev."
 
     for p in platforms:
         output = ["%s:\n" % p]
-        itertests = getListOfTests(p, tests)
-        if p == "Android":
-            itertests = android_tests
-
+        itertests = platformTests(p, tests)
+        test_bid, bid = branchIds(p, branch, masterbranch, pgo)
         for t in itertests:
             dzval = None
             if dzdata:
@@ -327,32 +358,25 @@ def compareResults(revision, branch, masterbranch, skipdays, history, platforms,
                     if test_map[t]['tbplname'] in pgodzdata[p]:
                         pgodzval = pgodzdata[p][test_map[t]['tbplname']]
 
-            if p.startswith('OSX') or p.startswith('Android') or pgo:
-                test_bid = branch_map[branch]['pgo']['id']
-                # Hack for talos on Android Firefox, since we use different
-                # numbers for pgo and android builds.
-                if p.startswith('Android') and branch == 'Firefox':
-                    test_bid = 11
-            else:
-                test_bid = branch_map[branch]['nonpgo']['id']
-
-            if p.startswith('OSX') or p.startswith('Android') or pgo:
-                bid = branch_map[masterbranch]['pgo']['id']
-                # Hack for talos on Android Firefox, since we use different
-                # numbers for pgo and android builds.
-                if p.startswith('Android') and masterbranch == 'Firefox':
-                    bid = 11
-            else:
-                bid = branch_map[masterbranch]['nonpgo']['id']
-
-            data = getGraphData(test_map[t]['id'], bid, platform_map[p])
-            if compare_e10s:
-                testdata = getGraphData(test_map[t]['id'], test_bid, platform_map[p + " (e10s)"])
+            test_p = p + " (e10s)" if compare_e10s else p
+            if store is not None:
+                # the store is indexed on dates and revisions
+                series = (t, branchName(bid), p)
+                test_series = (t, branchName(test_bid), test_p)
+                syncGraphData(store, series, test_map[t]['id'], bid, platform_map[p], maxAge)
+                syncGraphData(store, test_series, test_map[t]['id'], test_bid, platform_map[test_p], maxAge)
+                data = store.series(*series, create=False) is not None
+                testdata = store.series(*test_series, create=False) is not None
             else:
-                testdata = getGraphData(test_map[t]['id'], test_bid, platform_map[p])
+                data = getGraphData(test_map[t]['id'], bid, platform_map[p])
+                testdata = getGraphData(test_map[t]['id'], test_bid, platform_map[test_p])
             if data and testdata:
-                results = parseGraphResultsByDate(data, startdate, enddate)
-                test = parseGraphResultsByChangeset(testdata, revision)
+                if store is not None:
+                    results = summarize(store.values(*series, start=startdate, end=enddate))
+                    test = summarize(store.values(*test_series, revision=revision))
+                else:
+                    results = parseGraphResultsByDate(data, startdate, enddate)
+                    test = parseGraphResultsByChangeset(testdata, revision)
                 status = ''
                 if test['geomean'] < results['low']:
                     status = ':)'
@@ -383,6 +407,19 @@ def compareResults(revision, branch, masterbranch, skipdays, history, platforms,
         if doPrint:
             print '\n'.join(output)
 
+def branchName(branchid):
+    """
+    the name of the graph server branch of |branchid|, as talos reports it,
+    followed by the id if other branches have that name too
+    """
+    builds = [build for branch in branch_map.values() for build in branch.values()]
+    names = [build['name'] for build in builds if build['id'] == branchid]
+    if not names:
+        return str(branchid)
+    if any(build['name'] == names[0] and build['id'] != branchid for build in builds):
+        return "%s (%d)" % (names[0], branchid)
+    return names[0]
+
 class CompareOptions(ArgumentParser):
 
     def __init__(self):
@@ -448,8 +485,33 @@ class CompareOptions(ArgumentParser):
                         default = False,
                         help = "Output information for all tests")
 
+        self.add_argument("--store",
+                        action = "store", type = str, dest = "store",
+                        default = None,
+                        help = "SQLite database of results history to compare with, as recorded by talos --resultsStore.  Graph server data is added to it when it is missing or older than --max-age")
+
+        self.add_argument("--max-age",
+                        action = "store", type = float, dest = "max_age",
+                        default = SYNC_AGE / 3600.,
+                        help = "Number of hours after which the graph server data in --store is fetched again, default %d.  Use 0 to always fetch it" % (SYNC_AGE / 3600))
+
+        self.add_argument("--jobs",
+                        action = "store", type = int, dest = "jobs",
+                        default = graphfetch.JOBS,
+                        help = "Number of graph server requests to run at once, default %d" % graphfetch.JOBS)
+
+        self.add_argument("--cache-dir",
+                        action = "store", type = str, dest = "cache_dir",
+                        default = None,
+                        help = "Directory to keep graph server responses in for --cache-ttl seconds")
+
+        self.add_argument("--cache-ttl",
+                        action = "store", type = int, dest = "cache_ttl",
+                        default = graphfetch.CACHE_TTL,
+                        help = "Number of seconds the responses in --cache-dir are used for, default %d" % graphfetch.CACHE_TTL)
+
 def main():
-    global platforms, tests
+    global platforms, tests, fetcher
     parser = CompareOptions()
     args = parser.parse_args()
 
@@ -481,6 +543,12 @@ def main():
     if not args.revision:
         parser.error("ERROR: --revision is required")
 
+    if args.jobs < 1:
+        parser.error("ERROR: --jobs must be at least 1")
+
+    fetcher = graphfetch.GraphFetcher(SERVER, selector, jobs=args.jobs, cache_dir=args.cache_dir,
+                                      ttl=args.cache_ttl, debug=debug)
+
     #TODO: We need to ensure we have full coverage of the pushlog before we can do this.
 #    alldata = getDatazillaData(args.branch)
 #    datazilla, pgodatazilla, xperfdata = alldata[args.revision]
@@ -488,7 +556,14 @@ def main():
     if args.xperf:
         print xperfdata
     else:
-        compareResults(args.revision, args.branch, args.masterbranch, args.skipdays, args.history, platforms, tests, args.pgo, args.printurl, args.compare_e10s, datazilla, pgodatazilla, args.verbose, True)
+        store = resultstore.ResultsStore(args.store) if args.store else None
+        try:
+            compareResults(args.revision, args.branch, args.masterbranch, args.skipdays, args.history, platforms, tests, args.pgo, args.printurl, args.compare_e10s, datazilla, pgodatazilla, args.verbose, True,
+                           store=store, maxAge=args.max_age * 3600)
+        finally:
+            if store is not None:
+                store.close()
+            fetcher.close()
 
 def shorten(url):
     headers = {'content-type':'application/json'}
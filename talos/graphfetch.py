@@ -0,0 +1,205 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+concurrent fetching of graph server data for compare.py and report.py:
+ - at most |jobs| requests run at once, over keep-alive connections that
+   are reused for each host;
+ - the same data is only requested once, even when it is asked for again
+   while the first request is running;
+ - responses can be kept in an on-disk cache for |ttl| seconds.
+"""
+
+import hashlib
+import httplib
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import urllib
+from multiprocessing.pool import ThreadPool
+
+SERVER = 'graphs.mozilla.org'
+SELECTOR = '/api/test/runs'
+JOBS = 8
+CACHE_TTL = 60 * 60 # seconds
+TIMEOUT = 60 # seconds
+
+class ConnectionPool(object):
+    """keep-alive HTTP connections to |host|, keeping at most |size| idle ones"""
+
+    def __init__(self, host, size=JOBS, timeout=TIMEOUT, connection_class=httplib.HTTPConnection):
+        self.host = host
+        self.size = size
+        self.timeout = timeout
+        self.connection_class = connection_class
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """a connection, and whether it was used before"""
+        with self.lock:
+            if self.idle:
+                return self.idle.pop(), True
+        return self.connection_class(self.host, timeout=self.timeout), False
+
+    def release(self, connection):
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(connection)
+                return
+        connection.close()
+
+    def request(self, method, path, body=None, headers=None):
+        """the status and the body of the response"""
+        while True:
+            connection, reused = self.acquire()
+            try:
+                connection.request(method, path, body, headers or {})
+                response = connection.getresponse()
+                data = response.read()
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                if reused:
+                    # the server closed the idle connection: try a new one
+                    continue
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self.release(connection)
+            return response.status, data
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+class ResponseCache(object):
+    """response bodies kept in |directory| for |ttl| seconds"""
+
+    def __init__(self, directory, ttl=CACHE_TTL):
+        self.directory = directory
+        self.ttl = ttl
+
+    def path(self, key):
+        return os.path.join(self.directory, '%s.json' % hashlib.sha1(key).hexdigest())
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path) as f:
+                return f.read()
+        except (IOError, OSError):
+            return None
+
+    def set(self, key, data):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        # write aside and rename, so that readers never see a partial file
+        fd, temp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        path = self.path(key)
+        try:
+            os.rename(temp, path)
+        except OSError:
+            # windows doesn't rename over files
+            os.remove(path)
+            os.rename(temp, path)
+
+class GraphFetcher(object):
+    """fetches the runs of (test id, branch id, platform id) series from the graph server"""
+
+    def __init__(self, server=SERVER, selector=SELECTOR, jobs=JOBS, cache_dir=None, ttl=CACHE_TTL, debug=0):
+        self.server = server
+        self.selector = selector
+        self.jobs = jobs
+        self.debug = debug
+        self.cache = ResponseCache(cache_dir, ttl) if cache_dir else None
+        self.pools = {} # host -> ConnectionPool
+        self.slots = threading.BoundedSemaphore(jobs)
+        self.lock = threading.Lock()
+        self.results = {} # key -> data
+        self.pending = {} # key -> threading.Event, set when the data is in results
+
+    def pool(self, host):
+        with self.lock:
+            if host not in self.pools:
+                self.pools[host] = ConnectionPool(host, size=self.jobs)
+            return self.pools[host]
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.close()
+
+    def fetch(self, testid, branchid, platformid):
+        """the graph server data of the series, or None"""
+        key = (testid, branchid, platformid)
+        with self.lock:
+            if key in self.results:
+                return self.results[key]
+            event = self.pending.get(key)
+            if event is None:
+                event = self.pending[key] = threading.Event()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            event.wait()
+            return self.results.get(key)
+
+        try:
+            data = self.load(key)
+            with self.lock:
+                self.results[key] = data
+            return data
+        finally:
+            with self.lock:
+                del self.pending[key]
+            event.set()
+
+    def fetch_all(self, keys):
+        """a dictionary of the data of all the (test id, branch id, platform id) |keys|, fetched |jobs| at a time"""
+        keys = list(set(keys))
+        if not keys:
+            return {}
+        pool = ThreadPool(min(self.jobs, len(keys)))
+        try:
+            return dict(zip(keys, pool.map(lambda key: self.fetch(*key), keys)))
+        finally:
+            pool.close()
+            pool.join()
+
+    def load(self, key):
+        testid, branchid, platformid = key
+        body = {"id": testid, "branchid": branchid, "platformid": platformid}
+        if self.debug >= 3:
+            print "Querying graph server for: %s" % body
+        params = urllib.urlencode(sorted(body.items()))
+        cache_key = "%s%s?%s" % (self.server, self.selector, params)
+        text = self.cache.get(cache_key) if self.cache else None
+        cached = text is not None
+        if not cached:
+            headers = {"Content-type": "application/x-www-form-urlencoded", "Accept": "text/plain"}
+            with self.slots:
+                status, text = self.pool(self.server).request("POST", self.selector, params, headers)
+
+        if not text:
+            return None
+        try:
+            data = json.loads(text)
+        except ValueError:
+            print "NOT JSON: %s" % text
+            return None
+        if data.get('stat') == 'fail':
+            return None
+        if self.cache and not cached and status == httplib.OK:
+            self.cache.set(cache_key, text)
+        return data
@@ -0,0 +1,98 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+setup and cleanup hooks, run before and after each cycle of a test.
+
+test_config['setup'] and test_config['cleanup'] are python command lines,
+e.g. '${talos}/xtalos/start_xperf.py -c ${talos}/bcontroller.yml'. A script
+that defines the function named after its hook in HOOK_FUNCTIONS is imported
+once, and the function is called in process every cycle as
+
+    talos_setup(config, args)
+
+with |config| the dictionary that bcontroller.yml would contain (see
+talosconfig.talosConfig) and |args| the rest of the command line. The
+function may return a dictionary of counter name -> value, recorded for the
+cycle. Other scripts are run with python every cycle, and read
+bcontroller.yml.
+"""
+
+import imp
+import os
+import sys
+import traceback
+
+here = os.path.dirname(os.path.realpath(__file__))
+
+HOOK_FUNCTIONS = {'setup': 'talos_setup', 'cleanup': 'talos_cleanup'}
+
+# script path -> module
+modules = {}
+
+def import_script(path):
+    """
+    imports the script at |path|: as a module of talos if it is in one of its
+    packages, or else on its own with its directory first on sys.path, as
+    python would run it
+    """
+    parts = os.path.splitext(path)[0][len(here) + 1:].split(os.sep)
+    if path.startswith(here + os.sep) and \
+       all(os.path.exists(os.path.join(here, *(parts[:index] + ['__init__.py'])))
+           for index in range(1, len(parts))):
+        return __import__('.'.join(parts), globals(), {}, ['__name__'])
+
+    dirname = os.path.dirname(path)
+    sys.path.insert(0, dirname)
+    try:
+        return imp.load_source('talos_hook_%d' % len(modules), path)
+    finally:
+        sys.path.remove(dirname)
+
+class Hook(object):
+    """the |name| hook ('setup' or 'cleanup') of a test, running |command|"""
+
+    def __init__(self, name, command):
+        self.name = name
+        self.command = command
+        args = command.split()
+        self.script = os.path.realpath(args[0])
+        self.args = args[1:]
+        self.function = self.load()
+
+    @property
+    def in_process(self):
+        return self.function is not None
+
+    def load(self):
+        """the hook function of the script, or None to run it with python"""
+        function_name = HOOK_FUNCTIONS[self.name]
+        try:
+            # importing a script without hooks would run it
+            with open(self.script) as f:
+                if ('def %s(' % function_name) not in f.read():
+                    return None
+        except IOError:
+            return None
+
+        if self.script not in modules:
+            try:
+                modules[self.script] = import_script(self.script)
+            except Exception:
+                print "Failed to import %s hook %s, running it with python:" % (self.name, self.script)
+                traceback.print_exc()
+                return None
+        return getattr(modules[self.script], function_name, None)
+
+    def __call__(self, config):
+        """
+        runs the hook in process, and returns its counters; a failure is
+        reported, as it was from python
+        """
+        try:
+            return self.function(config, list(self.args)) or {}
+        except (Exception, SystemExit):
+            print "%s hook %s failed:" % (self.name, self.command)
+            traceback.print_exc()
+            return {}
@@ -4,8 +4,12 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import copy
 import os
-import utils
+import struct
+import sys
+import threading
+from array import array
 import whitelist
 
 SCRIPT_DIR = os.path.abspath(os.path.realpath(os.path.dirname(__file__)))
@@ -42,67 +46,327 @@ NAME_SUBSTITUTIONS = {'installtime': '{time}', 'prefetch': '{prefetch}',
 TUPLE_FILENAME_INDEX = 2
 WHITELIST_FILENAME = os.path.join(SCRIPT_DIR, 'mtio-whitelist.json')
 
+# binary format of IOData
+BINARY_MAGIC = 'MTIO'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<4sIII') # magic, version, string table size, number of rows
+BINARY_EXTENSION = '.mtio'
+
+# how often a log is read while the browser is writing it, in seconds
+TAIL_INTERVAL = 1.0
+READ_CHUNK_SIZE = 1 << 20
+
+class IOData(object):
+    """
+    Main thread I/O accumulated per (stage, event source, filename, operation).
+    The event sources, filenames and operations are kept once in a string
+    table, and the counts and durations in arrays with an entry per key.
+    It reads like the dict of key tuple -> {KEY_COUNT: ..., KEY_RUN_COUNT: ...,
+    KEY_DURATION: ...} the whitelist checks, in the order the keys were seen.
+    """
+
+    def __init__(self):
+        self.strings = []
+        self.string_ids = {}
+        self.rows = {} # (stage, source id, filename id, operation id) -> index in the arrays
+        self.stages = array('B')
+        self.sources = array('i')
+        self.filenames = array('i')
+        self.operations = array('i')
+        self.counts = array('i') # 0 for deleted keys
+        self.run_counts = array('i')
+        self.durations = array('d')
+
+    def intern(self, string):
+        string_id = self.string_ids.get(string)
+        if string_id is None:
+            string_id = self.string_ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def add(self, stage, event_source, filename, operation, duration,
+            count=1, run_count=1):
+        key = (stage, self.intern(event_source), self.intern(filename), self.intern(operation))
+        row = self.rows.get(key)
+        if row is None:
+            self.rows[key] = len(self.counts)
+            self.stages.append(stage)
+            self.sources.append(key[1])
+            self.filenames.append(key[2])
+            self.operations.append(key[3])
+            self.counts.append(count)
+            self.run_counts.append(run_count)
+            self.durations.append(duration)
+        else:
+            self.counts[row] += count
+            self.run_counts[row] += run_count
+            self.durations[row] += duration
+
+    def key(self, row):
+        strings = self.strings
+        return (STAGE_STRINGS[self.stages[row]], strings[self.sources[row]],
+                strings[self.filenames[row]], strings[self.operations[row]])
+
+    def row_key(self, key):
+        """the rows key of a key tuple of strings, or None if it was never added"""
+        stage, event_source, filename, operation = key
+        if stage not in STAGE_STRINGS:
+            return None
+        string_ids = self.string_ids
+        ids = (string_ids.get(event_source), string_ids.get(filename), string_ids.get(operation))
+        if None in ids:
+            return None
+        return (STAGE_STRINGS.index(stage),) + ids
+
+    def value(self, row):
+        return {KEY_COUNT: self.counts[row], KEY_RUN_COUNT: self.run_counts[row],
+                KEY_DURATION: self.durations[row]}
+
+    def live_rows(self):
+        counts = self.counts
+        return (row for row in xrange(len(counts)) if counts[row])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return self.row_key(key) in self.rows
+
+    def __getitem__(self, key):
+        row = self.rows.get(self.row_key(key))
+        if row is None:
+            raise KeyError(key)
+        return self.value(row)
+
+    def __delitem__(self, key):
+        row = self.rows.pop(self.row_key(key), None)
+        if row is None:
+            raise KeyError(key)
+        self.counts[row] = 0
+
+    def iterkeys(self):
+        return (self.key(row) for row in self.live_rows())
+
+    __iter__ = iterkeys
+
+    def keys(self):
+        return list(self.iterkeys())
+
+    def iteritems(self):
+        return ((self.key(row), self.value(row)) for row in self.live_rows())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def tostring(self):
+        """the data in binary form, without the deleted keys"""
+        compact = IOData()
+        for row in self.live_rows():
+            compact.add(self.stages[row], self.strings[self.sources[row]],
+                        self.strings[self.filenames[row]], self.strings[self.operations[row]],
+                        self.durations[row], self.counts[row], self.run_counts[row])
+        table = '\0'.join(compact.strings)
+        arrays = compact.arrays()
+        if sys.byteorder == 'big':
+            for values in arrays:
+                values.byteswap()
+        return ''.join([BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(table), len(compact.counts)),
+                        table] + [values.tostring() for values in arrays])
+
+    @classmethod
+    def fromstring(cls, string):
+        """the data, from the binary form of tostring()"""
+        magic, version, table_size, rows = BINARY_HEADER.unpack_from(string)
+        if magic != BINARY_MAGIC or version != BINARY_VERSION:
+            raise ValueError("Not main thread I/O data of version %d" % BINARY_VERSION)
+        data = cls()
+        offset = BINARY_HEADER.size
+        if rows:
+            data.strings = string[offset:offset + table_size].split('\0')
+        data.string_ids = dict((s, string_id) for string_id, s in enumerate(data.strings))
+        offset += table_size
+        for values in data.arrays():
+            size = rows * values.itemsize
+            if len(string) < offset + size:
+                raise ValueError("Truncated main thread I/O data")
+            values.fromstring(string[offset:offset + size])
+            if sys.byteorder == 'big':
+                values.byteswap()
+            offset += size
+        data.rows = dict(((data.stages[row], data.sources[row], data.filenames[row], data.operations[row]), row)
+                         for row in xrange(rows))
+        return data
+
+    def arrays(self):
+        return (self.stages, self.sources, self.filenames, self.operations,
+                self.counts, self.run_counts, self.durations)
+
+class Analyzer(object):
+    """
+    Accumulates a main thread I/O log (see MOZ_MAIN_THREAD_IO_LOG) as it is
+    read, possibly while the browser is still writing it, and checks the
+    files it accessed against a whitelist once it is done.
+    """
+
+    def __init__(self, whitelist=None):
+        self.whitelist = whitelist
+        self.data = IOData()
+        self.stage = STAGE_STARTUP
+        self.offset = 0
+        self.partial = ''
+        self.tail_thread = None
+        self.tail_stop = threading.Event()
+
+    def feed(self, text):
+        lines = (self.partial + text).split('\n')
+        self.partial = lines.pop()
+        for line in lines:
+            self.feed_line(line)
+
+    def feed_line(self, line):
+        entries = line.strip().split(',')
+        if len(entries) == LENGTH_IO_ENTRY:
+            if self.stage == STAGE_STARTUP:
+                return
+            if entries[INDEX_FILENAME] == KEY_NO_FILENAME:
+                return
+            # Format 1: I/O entry
+
+            # Temporary hack: logs are leaking Windows NT symlinks.
+            # We need to ignore those.
+            if entries[INDEX_FILENAME].startswith(LEAKED_SYMLINK_PREFIX):
+                return
+
+            # We'll key each entry on (stage, event source, filename, operation)
+            self.data.add(self.stage, entries[INDEX_EVENT_SOURCE], entries[INDEX_FILENAME],
+                          entries[INDEX_OPERATION], float(entries[INDEX_DURATION]))
+        elif len(entries) == LENGTH_NEXT_STAGE_ENTRY and entries[1] == TOKEN_NEXT_STAGE:
+            # Format 2: next stage
+            self.stage = self.stage + 1
+
+    def read(self, logfilename):
+        """reads what was written to |logfilename| since the last read"""
+        with open(logfilename, 'rb') as logfile:
+            logfile.seek(self.offset)
+            while True:
+                text = logfile.read(READ_CHUNK_SIZE)
+                if not text:
+                    break
+                self.offset += len(text)
+                self.feed(text)
+
+    def finish(self):
+        """processes the last line, if it wasn't terminated"""
+        line, self.partial = self.partial, ''
+        if line:
+            self.feed_line(line)
+
+    def start_tailing(self, logfilename, interval=TAIL_INTERVAL):
+        """reads |logfilename| every |interval| seconds, until stop_tailing()"""
+        def tail():
+            while not self.tail_stop.wait(interval):
+                try:
+                    self.read(logfilename)
+                except IOError:
+                    # not created yet
+                    pass
+        self.tail_stop.clear()
+        self.tail_thread = threading.Thread(target=tail, name='mainthreadio')
+        self.tail_thread.setDaemon(True)
+        self.tail_thread.start()
+
+    def stop_tailing(self):
+        if self.tail_thread:
+            self.tail_stop.set()
+            self.tail_thread.join()
+            self.tail_thread = None
+
+    def analyze(self, logfilename=None):
+        """
+        reads the rest of |logfilename|, removes whitelisted files from the
+        data, and returns the errors to report
+        """
+        self.stop_tailing()
+        if logfilename:
+            self.read(logfilename)
+        self.finish()
+        if not self.whitelist:
+            return ["Failed to load whitelist"]
+
+        # the directories above this run's profile are only whitelisted for it
+        wl = copy.copy(self.whitelist)
+        wl.listmap = dict(wl.listmap)
+        wl.allow_profile_dirs(self.data, TUPLE_FILENAME_INDEX)
+
+        wl.filter(self.data, TUPLE_FILENAME_INDEX)
+
+        # search for unknown filenames
+        errors = wl.get_error_strings(wl.check(self.data, TUPLE_FILENAME_INDEX))
+        # search for duration > 1.0
+        errors += wl.get_error_strings(wl.checkDuration(self.data, TUPLE_FILENAME_INDEX, KEY_DURATION))
+        return wl.format_errors(errors)
+
+# (xre_path, whitelist filename) -> Whitelist
+whitelists = {}
+
+def load_whitelist(xre_path, filename=WHITELIST_FILENAME):
+    """
+    the main thread I/O whitelist for the browser in |xre_path|, or None if
+    it can't be loaded; it is loaded once, and then shared by all the cycles
+    """
+    key = (xre_path, filename)
+    if key not in whitelists:
+        wl = whitelist.Whitelist(test_name = 'mainthreadio',
+                                 paths = {"{xre}": xre_path},
+                                 path_substitutions = PATH_SUBSTITUTIONS,
+                                 name_substitutions = NAME_SUBSTITUTIONS)
+        whitelists[key] = wl if wl.load(filename) else None
+    return whitelists[key]
+
 def parse(logfilename, data):
+    analyzer = Analyzer()
+    analyzer.data = data
     try:
-        with open(logfilename, 'r') as logfile:
-            if not logfile:
-                return False
-            stage = STAGE_STARTUP
-            for line in logfile:
-                prev_filename = str()
-                entries = line.strip().split(',')
-                if len(entries) == LENGTH_IO_ENTRY:
-                    if stage == STAGE_STARTUP:
-                        continue
-                    if entries[INDEX_FILENAME] == KEY_NO_FILENAME:
-                        continue
-                    # Format 1: I/O entry
-
-                    # Temporary hack: logs are leaking Windows NT symlinks.
-                    # We need to ignore those.
-                    if entries[INDEX_FILENAME].startswith(LEAKED_SYMLINK_PREFIX):
-                        continue
-
-                    # We'll key each entry on (stage, event source, filename, operation)
-                    key_tuple = (STAGE_STRINGS[stage], entries[INDEX_EVENT_SOURCE],
-                                 entries[INDEX_FILENAME], entries[INDEX_OPERATION])
-                    if key_tuple not in data:
-                        data[key_tuple] = {KEY_COUNT: 1, KEY_RUN_COUNT: 1, KEY_DURATION:
-                                float(entries[INDEX_DURATION])}
-                    else:
-                        if prev_filename != entries[INDEX_FILENAME]:
-                            data[key_tuple][KEY_RUN_COUNT] += 1
-                        data[key_tuple][KEY_COUNT] += 1
-                        data[key_tuple][KEY_DURATION] += float(entries[INDEX_DURATION])
-                    prev_filename = entries[INDEX_FILENAME]
-                elif len(entries) == LENGTH_NEXT_STAGE_ENTRY and entries[1] == TOKEN_NEXT_STAGE:
-                    # Format 2: next stage
-                    stage = stage + 1
-            return True
+        analyzer.read(logfilename)
     except IOError as e:
         print "%s: %s" % (e.filename, e.strerror)
         return False
+    analyzer.finish()
+    return True
+
+def format_output(data):
+    """the data, as it is tracked"""
+    rows = ["    [\"%s\", \"%s\", \"%s\", \"%s\", %d, %d, %f]" % (key + (
+            value[KEY_COUNT], value[KEY_RUN_COUNT], value[KEY_DURATION]))
+            for key, value in data.iteritems()]
+    return "[\n%s\n]\n" % ",\n".join(rows) if rows else "[\n]\n"
 
 def write_output(outfilename, data):
-    # Write the data out so that we can track it
+    # Write the data out so that we can track it, in binary form if the file
+    # name ends with BINARY_EXTENSION
     try:
-        with open(outfilename, 'w') as outfile:
-            outfile.write("[\n")
-            for idx, (key, value) in utils.indexed_items(data.iteritems()):
-                output = "    [\"%s\", \"%s\", \"%s\", \"%s\", %d, %d, %f]" % (
-                            key[0], key[1], key[2], key[3], value[KEY_COUNT],
-                            value[KEY_RUN_COUNT], value[KEY_DURATION])
-                outfile.write(output)
-                if idx >= 0:
-                    outfile.write(",\n")
-                else:
-                    outfile.write("\n")
-            outfile.write("]\n")
-            return True
+        if outfilename.endswith(BINARY_EXTENSION):
+            with open(outfilename, 'wb') as outfile:
+                outfile.write(data.tostring())
+        else:
+            with open(outfilename, 'w') as outfile:
+                outfile.write(format_output(data))
+        return True
     except IOError as e:
         print "%s: %s" % (e.filename, e.strerror)
         return False
 
+def read_output(filename):
+    """the IOData written to |filename| in binary form, or None"""
+    try:
+        with open(filename, 'rb') as f:
+            return IOData.fromstring(f.read())
+    except IOError as e:
+        print "%s: %s" % (e.filename, e.strerror)
+    except (ValueError, struct.error) as e:
+        print "%s: %s" % (filename, e)
+    return None
+
 def main(argv):
     if len(argv) < 4:
         print "Usage: %s <main_thread_io_log_file> <output_file> <xre_path>" % argv[0]
@@ -110,36 +374,25 @@ def main(argv):
     if not os.path.exists(argv[3]):
         print "XRE Path \"%s\" does not exist" % argv[3]
         return 1
-    data = {}
-    if not parse(argv[1], data):
-        print "Log parsing failed"
-        return 1
-
-    wl = whitelist.Whitelist(test_name = 'mainthreadio',
-                             paths = {"{xre}": argv[3]},
-                             path_substitutions = PATH_SUBSTITUTIONS,
-                             name_substitutions = NAME_SUBSTITUTIONS)
-    if not wl.load(WHITELIST_FILENAME):
+    wl = load_whitelist(argv[3])
+    if not wl:
         print "Failed to load whitelist"
         return 1
 
-    wl.filter(data, TUPLE_FILENAME_INDEX)
+    analyzer = Analyzer(wl)
+    try:
+        errors = analyzer.analyze(argv[1])
+    except IOError as e:
+        print "%s: %s" % (e.filename, e.strerror)
+        print "Log parsing failed"
+        return 1
 
-    if not write_output(argv[2], data):
+    if not write_output(argv[2], analyzer.data):
         return 1
 
     # Disabled until we enable TBPL oranges
-    # search for unknown filenames
-    errors = wl.check(data, TUPLE_FILENAME_INDEX)
-    if errors:
-        strs = wl.get_error_strings(errors)
-        wl.print_errors(strs)
-
-    # search for duration > 1.0
-    errors = wl.checkDuration(data, TUPLE_FILENAME_INDEX, 'Duration')
-    if errors:
-        strs = wl.get_error_strings(errors)
-        wl.print_errors(strs)
+    for error in errors:
+        print error
 
     return 0
 
@@ -6,17 +6,25 @@
 
 import datetime
 import filter
+import httplib
 import imp
 import json
 import mozinfo
+import oauth2
 import os
 import post_file
+import replicates
+import resultstore
+import socket
+import sys
 import tempfile
+import threading
 import time
 import urllib
 import utils
+import zlib
 from StringIO import StringIO
-from dzclient import DatazillaRequest, DatazillaResult, DatazillaResultsCollection
+from test import test_dict
 
 def filesizeformat(bytes):
     """
@@ -34,6 +42,9 @@ def filesizeformat(bytes):
 class Output(object):
     """abstract base class for Talos output"""
 
+    output_timeout = 15 * 60 # seconds an output to a URL may take, retries included
+    spool_extension = '.txt' # of the local copies of the results
+
     @classmethod
     def check(cls, urls, **options):
         """check to ensure that the urls are valid"""
@@ -61,15 +72,81 @@ class Output(object):
         if results_scheme in ('http', 'https'):
             self.post(results, results_server, results_path, results_scheme, tbpl_output)
         elif results_scheme == 'file':
-            with open(results_path, 'w') as f:
-                for result in results:
-                    f.write("%s\n" % result)
+            self.write_file(results, results_path)
         else:
             raise NotImplementedError("%s: %s - only http://, https://, and file:// supported" % (self.__class__.__name__, results_url))
 
+    def write_file(self, results, path):
+        """write the results to the file at |path|, e.g. a local copy, and nothing else"""
+        with open(path, 'w') as f:
+            for result in results:
+                f.write("%s\n" % result)
+
     def post(self, results, server, path, scheme, tbpl_output):
         raise NotImplementedError("Abstract base class")
 
+    def run_options(self, test):
+        """test options for datazilla and perfherder"""
+
+        options = {}
+        test_options = ['rss', 'tpchrome', 'tpmozafterpaint', 'tpcycles', 'tppagecycles', 'tprender', 'tploadaboutblank', 'tpdelay', 'responsiveness', 'shutdown']
+        for option in test_options:
+            if option not in test.test_config:
+                continue
+            options[option] = test.test_config[option]
+        if test.extensions is not None:
+            options['extensions'] = [{'name': extension}
+                                     for extension in test.extensions]
+        return options
+
+    def test_machine(self):
+        """return test machine platform in a form appropriate to datazilla and perfherder"""
+        if self.results.remote:
+            # TODO: figure out how to not hardcode this, specifically the version !!
+            # should probably come from the agent (sut/adb) and passed in
+            platform = "Android"
+            processor = "ARMv7"
+            if 'tegra' in self.results.title:
+                version = "2.2"
+            elif 'panda' in self.results.title:
+                version = "4.0.4"
+            elif 'apcio' in self.results.title:
+                processor = "ARMv6"
+                version = "2.3"
+            else:
+                version = "unknown"
+        else:
+            platform = mozinfo.os
+            version = mozinfo.version
+            processor = mozinfo.processor
+            if self.results.title.endswith(".e") and not version.endswith('.e'):
+                # we are running this against e10s builds
+                version = '%s.e' % (version,)
+
+        return dict(name=self.results.title, os=platform, osversion=version, platform=processor)
+
+    def responsiveness_test(self, testname):
+        """returns if the test is a responsiveness test"""
+        # XXX currently this just looks for the string
+        # 'responsiveness' in the test name.
+        # It would be nice to be more declarative about this
+        return 'responsiveness' in testname
+
+    def average(self, vals, testname):
+        """
+        the score of tests that report one, from their (val, page) |vals|,
+        or None for the others
+        """
+        if self.responsiveness_test(testname):
+            return self.responsiveness_Metric([val for (val, page) in vals])
+        elif testname.startswith('v8_7'):
+            return self.v8_Metric(vals)
+        elif testname.startswith('kraken'):
+            return self.JS_Metric(vals)
+        elif testname.startswith('tcanvasmark'):
+            return self.CanvasMark_Metric(vals)
+        return None
+
     @classmethod
     def shortName(cls, name):
         """short name for counters"""
@@ -146,10 +223,20 @@ class GraphserverOutput(Output):
     info_format = ['title', 'testname', 'branch_name', 'sourcestamp', 'buildid', 'date']
 
     @classmethod
-    def check(cls, urls):
+    def check(cls, urls, **options):
         # ensure results_url link exists
         post_file.test_links(*urls)
 
+    def __init__(self, results, results_gzip=False, results_batch=1):
+        """
+        - results_gzip : gzip the posts, for graph servers that accept it
+        - results_batch : number of result strings posted per request, for
+          graph servers that collect more than one
+        """
+        Output.__init__(self, results)
+        self.gzip = results_gzip
+        self.batch = max(results_batch, 1)
+
     def __call__(self):
         """
         results to send to graphserver:
@@ -232,13 +319,6 @@ class GraphserverOutput(Output):
 
         return result_strings
 
-    def responsiveness_test(self, testname):
-        """returns if the test is a responsiveness test"""
-        # XXX currently this just looks for the string
-        # 'responsiveness' in the test name.
-        # It would be nice to be more declarative about this
-        return 'responsiveness' in testname
-
     def construct_results(self, vals, testname, **info):
         """
         return results string appropriate to graphserver
@@ -249,21 +329,8 @@ class GraphserverOutput(Output):
 
         info['testname'] = testname
         info_format = self.info_format
-        responsiveness = self.responsiveness_test(testname)
-        _type = 'VALUES'
-        average = None
-        if responsiveness:
-            _type = 'AVERAGE'
-            average = self.responsiveness_Metric([val for (val, page) in vals])
-        elif testname.startswith('v8_7'):
-            _type = 'AVERAGE'
-            average = self.v8_Metric(vals)
-        elif testname.startswith('kraken'):
-            _type = 'AVERAGE'
-            average = self.JS_Metric(vals)
-        elif testname.startswith('tcanvasmark'):
-            _type = 'AVERAGE'
-            average = self.CanvasMark_Metric(vals)
+        average = self.average(vals, testname)
+        _type = 'VALUES' if average is None else 'AVERAGE'
 
         # ensure that we have all of the info data available
         missing = [i for i in info_format if i not in info]
@@ -302,19 +369,35 @@ class GraphserverOutput(Output):
             raise utils.TalosError("send failed, graph server says:\n%s" % post)
         return links
 
+    @classmethod
+    def split_links(cls, links):
+        """
+        the links of each result of a response: the line of the test name,
+        result and path ends them
+        """
+        result = []
+        lines = []
+        for line in links.splitlines():
+            lines.append(line)
+            if len(line.split()) == 3:
+                result.append('\n'.join(lines) + '\n')
+                lines = []
+        return result
+
     def post(self, results, server, path, scheme, tbpl_output):
         """post results to the graphserver"""
 
         links = []
         wait_time = 5 # number of seconds between each attempt
 
-        for index, data_string in enumerate(results):
+        for index in range(0, len(results), self.batch):
+            files = [("filename", "data_string", data_string) for data_string in results[index:index + self.batch]]
             times = 0
             msg = ""
             while times < self.retries:
-                utils.info("Posting result %d of %d to %s://%s%s, attempt %d", index, len(results), scheme, server, path, times)
+                utils.info("Posting results %d to %d of %d to %s://%s%s, attempt %d", index, index + len(files) - 1, len(results), scheme, server, path, times)
                 try:
-                    links.append(self.process_Request(post_file.post_multipart(server, path, files=[("filename", "data_string", data_string)])))
+                    links.extend(self.split_links(self.process_Request(post_file.post_multipart(server, path, files=files, gzip=self.gzip))))
                     break
                 except utils.TalosError, e:
                     msg = str(e)
@@ -379,12 +462,104 @@ two lines for 'VALUES' payloads. You received:
             print 'RETURN: %s' % link_format % (url, linkName)
 
 
+class DatazillaPayload(object):
+    """
+    the datasets of a run, as dzclient's DatazillaResultsCollection.datasets()
+    gives them, built once along with their JSON for logging, files and posts
+    """
+
+    def __init__(self, machine_name, os, os_version, platform, build_name, version,
+                 revision, branch, id, test_date):
+        self.machine_name = machine_name
+        self.os = os
+        self.os_version = os_version
+        self.platform = platform
+        self.build_name = build_name
+        self.version = version
+        self.revision = revision
+        self.branch = branch
+        self.id = id
+        self.test_date = test_date
+        self.suites = {} # suite -> index in datasets
+        self.datasets = []
+        self._dataset_json = None
+        self._file_json = None
+        # the output threads of every URL ask for the JSON at once
+        self.json_lock = threading.Lock()
+
+    def add_suite(self, suite, results, options=None, talos_aux=None, results_xperf=None):
+        """adds the dataset of |suite|, replacing an earlier one of the same name"""
+        dataset = {'test_machine': {'name': self.machine_name,
+                                    'os': self.os,
+                                    'osversion': self.os_version,
+                                    'platform': self.platform},
+                   'test_build': {'name': self.build_name,
+                                  'version': self.version,
+                                  'revision': self.revision[:50],
+                                  'branch': self.branch,
+                                  'id': self.id},
+                   'testrun': {'date': self.test_date, 'suite': suite},
+                   'results': results}
+        if options:
+            dataset['testrun']['options'] = options
+        if talos_aux:
+            dataset['talos_aux'] = talos_aux
+        if results_xperf:
+            dataset['results_xperf'] = results_xperf
+        if suite in self.suites:
+            self.datasets[self.suites[suite]] = dataset
+        else:
+            self.suites[suite] = len(self.datasets)
+            self.datasets.append(dataset)
+        self._dataset_json = self._file_json = None
+
+    @property
+    def dataset_json(self):
+        """the JSON of each dataset, as posted"""
+        with self.json_lock:
+            if self._dataset_json is None:
+                self._dataset_json = [json.dumps(dataset) for dataset in self.datasets]
+            return self._dataset_json
+
+    @property
+    def file_json(self):
+        """the JSON of the datasets, as written to files"""
+        with self.json_lock:
+            if self._file_json is None:
+                self._file_json = json.dumps(self.datasets, indent=2, sort_keys=True)
+            return self._file_json
+
+    def talosdata(self, limit=None):
+        """
+        the JSON of the datasets, as json.dumps(datasets), of the first
+        datasets within |limit| bytes if given; and how many are left out
+        """
+        pieces = self.dataset_json
+        count = len(pieces)
+        if limit is not None:
+            size = 0 # of '[', ']' and the ', ' separators too
+            for count, piece in enumerate(pieces):
+                size += len(piece) + 2
+                if size > limit:
+                    break
+            else:
+                count = len(pieces)
+        return '[%s]' % ', '.join(pieces[:count]), len(pieces) - count
+
 class DatazillaOutput(Output):
     """send output to datazilla"""
 
-    def __init__(self, results, authfile=None):
+    spool_extension = '.json'
+    talosdata_limit = 1024 * 1024 # bytes of datasets logged on the TALOSDATA line
+
+    def __init__(self, results, authfile=None, datazilla_no_log=False):
+        """
+        - authfile : python file of the datazillaAuth oauth credentials
+        - datazilla_no_log : don't log the datasets on the TALOSDATA line
+        """
         Output.__init__(self, results)
         self.authfile = authfile
+        self.log = not datazilla_no_log
         self.oauth = None
         if authfile is not None:
             # get datazilla oauth credentials
@@ -406,7 +581,7 @@ class DatazillaOutput(Output):
 
     def output(self, results, results_url, tbpl_output):
         """output to the results_url
-        - results : DatazillaResults instance
+        - results : DatazillaPayload instance
         - results_url : http:// or file:// URL
         """
 
@@ -417,16 +592,23 @@ class DatazillaOutput(Output):
         results_url_split = utils.urlsplit(results_url)
         results_scheme, results_server, results_path, _, _ = results_url_split
 
-        utils.info("TALOSDATA: %s" % json.dumps(results.datasets()))
+        if self.log:
+            talosdata, left_out = results.talosdata(self.talosdata_limit)
+            utils.info("TALOSDATA: %s" % talosdata)
+            if left_out:
+                utils.info("TALOSDATA: %d of %d datasets left out, over %d bytes",
+                           left_out, len(results.datasets), self.talosdata_limit)
         if results_scheme in ('http', 'https'):
             self.post(results, results_server, results_path, results_scheme, tbpl_output)
         elif results_scheme == 'file':
-            f = file(results_path, 'w')
-            f.write(json.dumps(results.datasets(), indent=2, sort_keys=True))
-            f.close()
+            self.write_file(results, results_path)
         else:
             raise NotImplementedError("%s: %s - only http://, https://, and file:// supported" % (self.__class__.__name__, results_url))
 
+    def write_file(self, results, path):
+        with open(path, 'w') as f:
+            f.write(results.file_json)
+
     def __call__(self):
 
         # platform
@@ -435,15 +617,24 @@ class DatazillaOutput(Output):
         # build information
         browser_config = self.results.browser_config
 
-        # a place to put results
-        res = DatazillaResult()
+        # make a datazilla payload
+        if browser_config['develop'] and not browser_config['sourcestamp']:
+            browser_config['sourcestamp'] = ''
+        payload = DatazillaPayload(machine_name=machine['name'],
+                                   os=machine['os'],
+                                   os_version=machine['osversion'],
+                                   platform=machine['platform'],
+                                   build_name=browser_config['browser_name'],
+                                   version=browser_config['browser_version'],
+                                   revision=browser_config['sourcestamp'],
+                                   branch=browser_config['branch_name'],
+                                   id=browser_config['buildid'],
+                                   test_date=self.results.date)
 
         for test in self.results.results:
-            suite = "%s" % test.name()
-            res.add_testsuite(suite, options=self.run_options(test))
-
             # serialize test results
             results = {}
+            aux = {}
             if not test.using_xperf:
                 for result in test.results:
                     # XXX this will not work for manifests which list
@@ -453,34 +644,17 @@ class DatazillaOutput(Output):
                             results.setdefault(test.name(), []).extend(val)
                         else:
                             results.setdefault(page, []).extend(val)
-                for result, values in results.items():
-                    res.add_test_results(suite, result, values)
 
-                # counters results_aux data
-                for cd in test.all_counter_results:
-                    for name, vals in cd.items():
-                        res.add_talos_auxiliary(suite, name, vals)
-            else:
-                # specific xperf_aux data
-                for cd in test.all_counter_results:
-                    for name, vals in cd.items():
-                        res.add_xperf_results(suite, name, vals)
+            # counters results_aux data, or specific xperf_aux data
+            for cd in test.all_counter_results:
+                for name, vals in cd.items():
+                    aux.setdefault(name, []).extend(vals)
 
-        # make a datazilla test result collection
-        if browser_config['develop'] and not browser_config['sourcestamp']:
-            browser_config['sourcestamp'] = ''
-        collection = DatazillaResultsCollection(machine_name=machine['name'],
-                                                os=machine['os'],
-                                                os_version=machine['osversion'],
-                                                platform=machine['platform'],
-                                                build_name=browser_config['browser_name'],
-                                                version=browser_config['browser_version'],
-                                                revision=browser_config['sourcestamp'],
-                                                branch=browser_config['branch_name'],
-                                                id=browser_config['buildid'],
-                                                test_date=self.results.date)
-        collection.add_datazilla_result(res)
-        return collection
+            if test.using_xperf:
+                payload.add_suite(test.name(), results, options=self.run_options(test), results_xperf=aux)
+            else:
+                payload.add_suite(test.name(), results, options=self.run_options(test), talos_aux=aux)
+        return payload
 
     def post(self, results, server, path, scheme, tbpl_output):
         """post the data to datazilla"""
@@ -505,9 +679,10 @@ class DatazillaOutput(Output):
                 utils.info("No oauth credentials found for project '%s' in '%s'", project, self.authfile)
         utils.info("datazilla: %s//%s/%s; oauth=%s", scheme, server, project, bool(oauth_key and oauth_secret))
 
-        # submit the request
-        req = DatazillaRequest.create(scheme, server, project, oauth_key, oauth_secret, results)
-        responses = req.submit()
+        # submit the datasets
+        assert results.branch, "%s: branch required for posting" % self.__class__.__name__
+        responses = [self.send(scheme, server, project, oauth_key, oauth_secret, data)
+                     for data in results.dataset_json]
 
         # print error responses
         for response in responses:
@@ -559,50 +734,347 @@ class DatazillaOutput(Output):
 
             # build TBPL output
             # XXX this will not work for multiple URLs :(
-            for dataset in results.datasets():
+            for dataset in results.datasets:
                 url = "%s&test=%s" % (url, dataset['testrun']['suite'])
                 utils.info("Datazilla results at %s", url)
 
-    def run_options(self, test):
-        """test options for datazilla"""
+    def send(self, scheme, server, project, oauth_key, oauth_secret, data):
+        """
+        post the JSON |data| of a dataset to the datazilla |project|, as
+        dzclient's DatazillaRequest.send does; returns the httplib response
+        """
 
-        options = {}
-        test_options = ['rss', 'tpchrome', 'tpmozafterpaint', 'tpcycles', 'tppagecycles', 'tprender', 'tploadaboutblank', 'tpdelay', 'responsiveness', 'shutdown']
-        for option in test_options:
-            if option not in test.test_config:
+        path = '/%s/api/load_test' % project
+        params = {'data': urllib.quote(data)}
+        if oauth_key and oauth_secret:
+            params.update({'user': project,
+                           'oauth_version': '1.0',
+                           'oauth_nonce': oauth2.generate_nonce(),
+                           'oauth_timestamp': int(time.time())})
+
+            # there is no token in two-legged oauth, but the request needs one
+            token = oauth2.Token(key='', secret='')
+            consumer = oauth2.Consumer(key=oauth_key, secret=oauth_secret)
+            params['oauth_token'] = token.key
+            params['oauth_consumer_key'] = consumer.key
+            req = oauth2.Request(method='POST', url='%s://%s%s' % (scheme, server, path), parameters=params)
+            req.sign_request(oauth2.SignatureMethod_HMAC_SHA1(), consumer, token)
+            body = req.to_postdata()
+        else:
+            body = urllib.urlencode(params)
+
+        connection_class = httplib.HTTPSConnection if scheme == 'https' else httplib.HTTPConnection
+        conn = connection_class(server)
+        conn.request('POST', path, body, {'Content-type': 'application/x-www-form-urlencoded'})
+        return conn.getresponse()
+
+def json_fields(fields):
+    """the compact JSON text of the (key, value) |fields| of an object, without its braces"""
+    return ','.join('%s:%s' % (json.dumps(key), json.dumps(value, separators=(',', ':')))
+                    for key, value in fields)
+
+class PerfherderOutput(Output):
+    """
+    one JSON document per run, of the structure of perfherder-schema.json:
+    suites of subtests of replicates, with their filtered values, counters,
+    and the machine and build. The document is generated once, in chunks,
+    and the same chunks are written to every URL, gzipped with
+    |perfherder_gzip| or to file:// URLs ending in .gz.
+    """
+
+    schema_version = 1
+    chunk_size = 64 * 1024 # bytes of the pieces written
+    retries = 3 # number of times to attempt to post
+    timeout = 60 # seconds
+
+    @classmethod
+    def check(cls, urls, **options):
+        post_file.test_links(*urls)
+
+    def __init__(self, results, perfherder_gzip=False):
+        Output.__init__(self, results)
+        self.gzip = perfherder_gzip
+
+    @property
+    def spool_extension(self):
+        # write_file gzips every file with perfherder_gzip
+        return '.json.gz' if self.gzip else '.json'
+
+    def __call__(self):
+        """the text of the document, in chunks of about chunk_size bytes"""
+        return list(self.encode(self.document()))
+
+    def document(self):
+        browser_config = self.results.browser_config
+        machine = self.test_machine()
+        build = {'name': browser_config['browser_name'], 'version': browser_config['browser_version'],
+                 'revision': browser_config['sourcestamp'], 'branch': browser_config['branch_name'],
+                 'id': browser_config['buildid']}
+        if browser_config.get('develop'):
+            # as for datazilla, develop runs may have no revision or build id
+            for key in ('revision', 'id'):
+                if not build[key]:
+                    build[key] = ''
+        yield '{%s,"suites":[' % json_fields([
+            ('schema_version', self.schema_version),
+            ('framework', {'name': 'talos'}),
+            ('machine', {'name': machine['name'], 'os': machine['os'],
+                         'osversion': machine['osversion'], 'platform': machine['platform']}),
+            ('build', build),
+            ('date', self.results.date)])
+        for index, test in enumerate(self.results.results):
+            if index:
+                yield ','
+            for piece in self.suite(test):
+                yield piece
+        yield ']}'
+
+    def suite(self, test):
+        test_class = test_dict.get(test.name())
+        yield '{%s' % json_fields([
+            ('name', test.name()),
+            ('extension', test.test_config.get('test_name_extension', '')),
+            ('lower_is_better', test_class is None or test_class.lower_is_better),
+            ('options', self.run_options(test))])
+
+        # as for the graph server, xperf runs only have counters
+        if not (test.format == 'tpformat' and test.using_xperf):
+            _filters = self.results.filters
+            if 'filters' in test.test_config:
+                try:
+                    _filters = filter.filters_args(test.test_config['filters'])
+                except AssertionError, e:
+                    raise utils.TalosError(str(e))
+
+            pages = []
+            replicates = {}
+            vals = []
+            for result in test.results:
+                for page, runs in result.raw_values():
+                    if page not in replicates:
+                        pages.append(page)
+                        replicates[page] = []
+                    replicates[page].extend(runs)
+                vals.extend(result.values(_filters))
+
+            yield ',"subtests":['
+            for index, page in enumerate(pages):
+                value = filter.apply(replicates[page], _filters)
+                yield '%s{%s}' % (',' if index else '', json_fields([
+                    ('name', test.name() if page == 'NULL' else page),
+                    ('value', value if value > -1 else None),
+                    ('replicates', replicates.pop(page))]))
+            yield ']'
+
+            value = self.average(vals, test.name())
+            if value is None:
+                value = resultstore.summary_value([val for val, page in vals])
+            yield ',"value":%s' % json.dumps(value)
+
+        counters = {}
+        names = []
+        for cd in test.all_counter_results:
+            for name, values in cd.items():
+                if name not in counters:
+                    names.append(name)
+                    counters[name] = []
+                counters[name].extend(values)
+        yield ',"counters":['
+        index = 0
+        for name in names:
+            values = [value for value in counters[name] if isinstance(value, (int, long, float))]
+            if not values:
+                # e.g. main thread I/O or xperf tuples
                 continue
-            options[option] = test.test_config[option]
-        if test.extensions is not None:
-            options['extensions'] = [{'name': extension}
-                                     for extension in test.extensions]
-        return options
+            yield '%s{%s}' % (',' if index else '', json_fields([
+                ('name', self.shortName(name)),
+                ('value', filter.mean(values)),
+                ('values', values)]))
+            index += 1
+        yield ']}'
+
+    def encode(self, results, gzip=False):
+        """the text of the |results| pieces, in chunks of about chunk_size bytes, gzipped if |gzip|"""
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if gzip else None
+        buffer = []
+        size = 0
+        for piece in results:
+            buffer.append(piece)
+            size += len(piece)
+            if size >= self.chunk_size:
+                chunk = ''.join(buffer)
+                buffer = []
+                size = 0
+                if compressor:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    yield chunk
+        chunk = ''.join(buffer)
+        if compressor:
+            chunk = compressor.compress(chunk) + compressor.flush()
+        if chunk:
+            yield chunk
 
-    def test_machine(self):
-        """return test machine platform in a form appropriate to datazilla"""
-        if self.results.remote:
-            # TODO: figure out how to not hardcode this, specifically the version !!
-            # should probably come from the agent (sut/adb) and passed in
-            platform = "Android"
-            processor = "ARMv7"
-            if 'tegra' in self.results.title:
-                version = "2.2"
-            elif 'panda' in self.results.title:
-                version = "4.0.4"
-            elif 'apcio' in self.results.title:
-                processor = "ARMv6"
-                version = "2.3"
-            else:
-                version = "unknown"
+    def output(self, results, results_url, tbpl_output):
+        """output to the results_url
+        - results : the chunks of the document
+        - results_url : http:// or file:// URL
+        """
+
+        utils.info("Outputting perfherder results to %s", results_url)
+        results_scheme, results_server, results_path, _, _ = utils.urlsplit(results_url)
+
+        if results_scheme in ('http', 'https'):
+            self.post(results, results_server, results_path, results_scheme, tbpl_output)
+        elif results_scheme == 'file':
+            self.write_file(results, results_path)
         else:
-            platform = mozinfo.os
-            version = mozinfo.version
-            processor = mozinfo.processor
-            if self.results.title.endswith(".e") and not version.endswith('.e'):
-                # we are running this against e10s builds
-                version = '%s.e' % (version,)
+            raise NotImplementedError("%s: %s - only http://, https://, and file:// supported" % (self.__class__.__name__, results_url))
 
-        return dict(name=self.results.title, os=platform, osversion=version, platform=processor)
+    def write_file(self, results, path):
+        with open(path, 'wb') as f:
+            for chunk in self.encode(results, self.gzip or path.endswith('.gz')):
+                f.write(chunk)
+
+    def post(self, results, server, path, scheme, tbpl_output):
+        """post the chunks of the document to |path| of |server|"""
+
+        url = '%s://%s%s' % (scheme, server, path)
+        wait_time = 5 # number of seconds between each attempt
+        for attempt in range(self.retries):
+            utils.info("Posting perfherder results to %s, attempt %d", url, attempt)
+            try:
+                status, reason, body = self.post_chunked(results, server, path or '/', scheme)
+                if status < 300:
+                    break
+                msg = "%s %s" % (status, reason.lower())
+            except (httplib.HTTPException, socket.error), e:
+                msg = str(e)
+            time.sleep(wait_time)
+            wait_time *= 2
+        else:
+            raise utils.TalosError("Error posting to %s (%d attempts): %s" % (url, self.retries, msg))
+
+        tbpl_output.setdefault('perfherder', {})[url] = {'status': status}
+
+    def post_chunked(self, results, server, path, scheme):
+        """returns the status, reason and body of the response"""
+        connection_class = httplib.HTTPSConnection if scheme == 'https' else httplib.HTTPConnection
+        conn = connection_class(server, timeout=self.timeout)
+        try:
+            conn.putrequest('POST', path)
+            conn.putheader('Content-Type', 'application/json')
+            conn.putheader('Transfer-Encoding', 'chunked')
+            if self.gzip:
+                conn.putheader('Content-Encoding', 'gzip')
+            conn.endheaders()
+            for chunk in self.encode(results, self.gzip):
+                conn.send('%x\r\n%s\r\n' % (len(chunk), chunk))
+            conn.send('0\r\n\r\n')
+            response = conn.getresponse()
+            return response.status, response.reason, response.read()
+        finally:
+            conn.close()
+
+class ReplicatesOutput(Output):
+    """
+    the raw replicates and counter samples of the run, in the columnar
+    binary files of replicates.py; file:// URLs of a directory get a file
+    per run, for replicates.load to read them all back
+    """
+
+    spool_extension = replicates.EXTENSION
+
+    @classmethod
+    def check(cls, urls, **options):
+        for url in urls:
+            if utils.urlsplit(url)[0] != 'file':
+                raise utils.TalosError("%s: %s - only file:// supported" % (cls.__name__, url))
+
+    def __call__(self):
+        return replicates.Replicates.from_talos_results(self.results, self.test_machine())
+
+    def output(self, results, results_url, tbpl_output):
+        """output to the results_url
+        - results : the Replicates of the run
+        - results_url : file:// URL of a file or directory
+        """
+
+        results_scheme, results_server, results_path, _, _ = utils.urlsplit(results_url)
+        if results_scheme != 'file':
+            raise NotImplementedError("%s: %s - only file:// supported" % (self.__class__.__name__, results_url))
+        if os.path.isdir(results_path):
+            results_path = os.path.join(results_path, '%s-%d%s' % (self.results.title, self.results.date,
+                                                                   replicates.EXTENSION))
+        utils.info("Outputting replicates to %s", results_path)
+        self.write_file(results, results_path)
+
+    def write_file(self, results, path):
+        results.write(path)
 
 # available output formats
 formats = {'datazilla_urls': DatazillaOutput,
+           'perfherder_urls': PerfherderOutput,
+           'replicates_urls': ReplicatesOutput,
            'results_urls': GraphserverOutput}
+
+class Destination(object):
+    """the output of the results of a format to a URL, in a thread"""
+
+    def __init__(self, format, _output, results, url):
+        self.format = format
+        self.output = _output
+        self.results = results
+        self.url = url
+        self.tbpl_output = {}
+        self.exc_info = None
+        self.seconds = None
+        self.thread = threading.Thread(target=self.run, name='output %s' % url)
+        self.thread.daemon = True # a timed out output doesn't hold up talos
+
+    def run(self):
+        start = time.time()
+        try:
+            self.output.output(self.results, self.url, self.tbpl_output)
+        except:
+            self.exc_info = sys.exc_info()
+        self.seconds = time.time() - start
+
+def fan_out(destinations, tbpl_output):
+    """
+    output to the Destinations at once, each within the output_timeout of
+    its Output; adds their TBPL output, and the format, status and seconds
+    of each URL to tbpl_output['outputs']. Raises the error of the first
+    Destination, in order, that failed or timed out.
+    """
+
+    start = time.time()
+    for destination in destinations:
+        destination.thread.start()
+
+    failure = None
+    outputs = tbpl_output.setdefault('outputs', {})
+    for destination in destinations:
+        destination.thread.join(max(start + destination.output.output_timeout - time.time(), 0))
+        if destination.thread.is_alive():
+            status = 'timed out'
+            seconds = time.time() - start
+            error = (utils.TalosError, utils.TalosError("Timed out outputting %s results to %s after %d seconds" %
+                                                        (destination.format, destination.url, seconds)), None)
+        else:
+            status = 'failed' if destination.exc_info else 'ok'
+            seconds = destination.seconds
+            error = destination.exc_info
+            # in order, as if output one after the other
+            for key, value in destination.tbpl_output.items():
+                if isinstance(value, dict):
+                    tbpl_output.setdefault(key, {}).update(value)
+                else:
+                    tbpl_output[key] = value
+        utils.info("Output of %s results to %s: %s in %.2f seconds", destination.format, destination.url, status, seconds)
+        outputs[destination.url] = {'format': destination.format, 'status': status, 'seconds': round(seconds, 3)}
+        if error and not failure:
+            failure = error
+
+    if failure:
+        raise failure[0], failure[1], failure[2]
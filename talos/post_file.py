@@ -10,6 +10,7 @@ import socket
 from socket import error, herror, gaierror, timeout
 socket.setdefaulttimeout(None)
 import urlparse
+import zlib
 
 def link_exists(host, selector, scheme='http'):
     url = "%s://%s%s" % (scheme, host, selector)
@@ -44,11 +45,20 @@ def test_links(*urls):
         if scheme in ('http', 'https') and not link_exists(server, path, scheme):
             print 'WARNING: graph server link does not exist: %s' % url
 
-def post_multipart(host, selector, fields=(), files=()):
+BOUNDARY = '----------ThIs_Is_tHe_bouNdaRY_$'
+CRLF = '\r\n'
+CHUNK_SIZE = 64 * 1024 # bytes sent at once
+
+# hosts that refused a gzip Content-Encoding
+gzip_refused = set()
+
+def post_multipart(host, selector, fields=(), files=(), gzip=False):
     """
     Post fields and files to an http host as multipart/form-data.
     fields is a sequence of (name, value) elements for regular form fields.
     files is a sequence of (name, filename, value) elements for data to be uploaded as files
+    With gzip, the body is sent gzipped unless the host refused it before
+    with a 415 Unsupported Media Type, in which case it is sent again as is.
     Return the server's response page.
     """
     try:
@@ -59,13 +69,12 @@ def post_multipart(host, selector, fields=(), files=()):
             host = host[0:index]
 
         # Summarized results to the official graph server
-        content_type, body = encode_multipart_formdata(fields, files)
-
-        headers = {"Content-Type": content_type, "Content-length": str(len(body)), "Host": host, "Accept": "text/plain"}
-        conn = httplib.HTTPConnection(host)
-        conn.request("POST", selector, body, headers)
-        response = conn.getresponse()
-        return response.read()
+        gzip = gzip and host not in gzip_refused
+        status, page = send_multipart(host, selector, fields, files, gzip)
+        if gzip and status == 415:
+            gzip_refused.add(host)
+            status, page = send_multipart(host, selector, fields, files)
+        return page
     except (httplib.HTTPException, error, herror, gaierror, timeout), e:
         print "WARNING: graph server unreachable"
         print "WARNING: " + str(e)
@@ -74,31 +83,82 @@ def post_multipart(host, selector, fields=(), files=()):
         print "WARNING: graph server unreachable"
         raise
 
-def encode_multipart_formdata(fields, files):
+def send_multipart(host, selector, fields, files, gzip=False):
+    """
+    stream the multipart/form-data body of fields and files to the host,
+    gzipped if asked; return the status and page of the response
+    """
+    pieces = lambda: chunks(iter_multipart_formdata(fields, files))
+    if gzip:
+        compressed = list(gzip_chunks(pieces()))
+        pieces = lambda: compressed
+    # the length is that of the pieces rather than of their join
+    length = sum(len(piece) for piece in pieces())
+
+    conn = httplib.HTTPConnection(host)
+    try:
+        conn.putrequest('POST', selector)
+        conn.putheader('Content-Type', 'multipart/form-data; boundary=%s' % BOUNDARY)
+        conn.putheader('Content-Length', str(length))
+        conn.putheader('Accept', 'text/plain')
+        if gzip:
+            conn.putheader('Content-Encoding', 'gzip')
+        conn.endheaders()
+        for piece in pieces():
+            conn.send(piece)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+def chunks(pieces, size=CHUNK_SIZE):
+    """the pieces, gathered in strings of at least size bytes but the last"""
+    buffer = []
+    buffered = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            yield ''.join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield ''.join(buffer)
+
+def gzip_chunks(pieces):
+    """the gzip stream of the pieces"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for piece in pieces:
+        compressed = compressor.compress(piece)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def iter_multipart_formdata(fields, files):
     """
     fields is a sequence of (name, value) elements for regular form fields.
     files is a sequence of (name, filename, value) elements for data to be uploaded as files
-    Return (content_type, body) ready for httplib.HTTP instance
+    Yield the pieces of the multipart/form-data body, without copying the values
     """
-    BOUNDARY = '----------ThIs_Is_tHe_bouNdaRY_$'
-    CRLF = '\r\n'
-    L = []
     for (key, value) in fields:
-        L.append('--' + BOUNDARY)
-        L.append('Content-Disposition: form-data; name="%s"' % key)
-        L.append('')
-        L.append(value)
+        yield '--%s%sContent-Disposition: form-data; name="%s"%s%s' % (BOUNDARY, CRLF, key, CRLF, CRLF)
+        yield value
+        yield CRLF
     for (key, filename, value) in files:
-        L.append('--' + BOUNDARY)
-        L.append('Content-Disposition: form-data; name="%s"; filename="%s"' % (key, filename))
-        L.append('Content-Type: %s' % get_content_type(filename))
-        L.append('')
-        L.append(value)
-    L.append('--' + BOUNDARY + '--')
-    L.append('')
-    body = CRLF.join(L)
+        yield '--%s%sContent-Disposition: form-data; name="%s"; filename="%s"%sContent-Type: %s%s%s' % (
+            BOUNDARY, CRLF, key, filename, CRLF, get_content_type(filename), CRLF, CRLF)
+        yield value
+        yield CRLF
+    yield '--%s--%s' % (BOUNDARY, CRLF)
+
+def encode_multipart_formdata(fields, files):
+    """
+    fields is a sequence of (name, value) elements for regular form fields.
+    files is a sequence of (name, filename, value) elements for data to be uploaded as files
+    Return (content_type, body) ready for httplib.HTTP instance
+    """
     content_type = 'multipart/form-data; boundary=%s' % BOUNDARY
-    return content_type, body
+    return content_type, ''.join(iter_multipart_formdata(fields, files))
 
 def get_content_type(filename):
     return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
@@ -0,0 +1,147 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from symLogging import LogError, LogMessage
+
+import os
+import Queue
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+
+# Number of profiles that may be waiting for the compression thread before
+# add() blocks
+MAX_PENDING_PROFILES = 4
+# Number of bytes compressed and copied at a time
+COPY_CHUNK_SIZE = 1 << 16
+# zlib compression levels
+COMPRESSION_LEVELS = range(zlib.Z_DEFAULT_COMPRESSION, zlib.Z_BEST_COMPRESSION + 1)
+
+class ProfileArchive:
+  """
+  A zip archive of profiles that stays open for a whole test. Profiles are
+  compressed and written on a background thread, so that the next cycle can
+  start while the previous cycle's profile is still being archived.
+  A compression level of 0 stores the profiles as they are, which is
+  fastest; levels 1 to 9 deflate them at that zlib level, and -1 at
+  zlib's default, as zipfile does.
+  """
+
+  def __init__(self, path, compression_level=zlib.Z_DEFAULT_COMPRESSION):
+    if compression_level not in COMPRESSION_LEVELS:
+      raise ValueError("Bad zlib compression level for profile archive: " + str(compression_level))
+    self.path = path
+    self.compression_level = compression_level
+    self.names = set()
+    self.staging_dir = tempfile.mkdtemp()
+    self.zip = zipfile.ZipFile(path, "w", zipfile.ZIP_STORED if compression_level == 0 else zipfile.ZIP_DEFLATED,
+                               allowZip64=True)
+    self.queue = Queue.Queue(MAX_PENDING_PROFILES)
+    self.bytes_in = 0
+    self.bytes_out = 0
+    self.busy_time = 0
+    self.worker = threading.Thread(target=self._run, name="ProfileArchive")
+    self.worker.setDaemon(True)
+    self.worker.start()
+
+  def __contains__(self, arcname):
+    return arcname in self.names
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def add(self, filename, arcname):
+    """
+    Queues |filename| to be written to the archive as |arcname|. The file is
+    moved out of the way first, so the caller may reuse its name right away.
+    """
+    if arcname in self.names:
+      raise ValueError("Duplicate name in profile archive: " + arcname)
+    if not self.worker:
+      raise ValueError("Profile archive " + self.path + " is closed")
+    staged = os.path.join(self.staging_dir, str(len(self.names)))
+    shutil.move(filename, staged)
+    self.names.add(arcname)
+    self.queue.put((staged, arcname))
+
+  def close(self):
+    """Waits for pending profiles to be written and finishes the archive."""
+    if not self.worker:
+      return
+    self.queue.put(None)
+    self.worker.join()
+    self.worker = None
+    self.zip.close()
+    shutil.rmtree(self.staging_dir, ignore_errors=True)
+    megabytes = self.bytes_in / 1048576.0
+    LogMessage("Archived {0} profiles to {1}: {2:.1f} MB compressed to {3:.1f} MB "
+               "in {4:.2f}s ({5:.1f} MB/s)".format(len(self.names), self.path,
+                                                  megabytes, self.bytes_out / 1048576.0, self.busy_time,
+                                                  megabytes / self.busy_time if self.busy_time else 0))
+
+  def _run(self):
+    while True:
+      item = self.queue.get()
+      if item is None:
+        return
+      filename, arcname = item
+      start = time.time()
+      try:
+        self._write(filename, arcname)
+      except Exception as e:
+        LogError("Failed to add profile {0} to archive {1}: {2}".format(arcname, self.path, e))
+      finally:
+        self.busy_time += time.time() - start
+        try:
+          os.remove(filename)
+        except OSError:
+          pass
+
+  def _write(self, filename, arcname):
+    if self.compression_level in (0, zlib.Z_DEFAULT_COMPRESSION):
+      self.zip.write(filename, arcname)
+    else:
+      self._write_deflated(filename, arcname)
+    zinfo = self.zip.getinfo(arcname)
+    self.bytes_in += zinfo.file_size
+    self.bytes_out += zinfo.compress_size
+
+  def _write_deflated(self, filename, arcname):
+    """
+    Writes |filename| deflated at the compression level, which zipfile
+    can't do: the data is compressed aside, then written after a header of
+    its CRC and sizes, as ZipFile.write does.
+    """
+    st = os.stat(filename)
+    zinfo = zipfile.ZipInfo(arcname, time.localtime(st.st_mtime)[0:6])
+    zinfo.external_attr = (st.st_mode & 0xFFFF) << 16L
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    zinfo.file_size = zinfo.compress_size = zinfo.CRC = 0
+    compressor = zlib.compressobj(self.compression_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    with tempfile.TemporaryFile(dir=self.staging_dir) as deflated:
+      with open(filename, "rb") as f:
+        while True:
+          data = f.read(COPY_CHUNK_SIZE)
+          if not data:
+            break
+          zinfo.file_size += len(data)
+          zinfo.CRC = zlib.crc32(data, zinfo.CRC) & 0xffffffff
+          deflated.write(compressor.compress(data))
+      deflated.write(compressor.flush())
+      zinfo.compress_size = deflated.tell()
+      deflated.seek(0)
+
+      zip = self.zip
+      zinfo.header_offset = zip.fp.tell()
+      zip.fp.write(zinfo.FileHeader(max(zinfo.file_size, zinfo.compress_size) > zipfile.ZIP64_LIMIT))
+      shutil.copyfileobj(deflated, zip.fp, COPY_CHUNK_SIZE)
+    zip.filelist.append(zinfo)
+    zip.NameToInfo[zinfo.filename] = zinfo
+    zip._didModify = True
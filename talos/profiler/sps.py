@@ -3,6 +3,15 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import json
+import re
+
+COMPRESSED_FORMAT = "profileJSONWithSymbolicationTable,1"
+
+# Number of bytes read from the profile file at a time when streaming
+READ_CHUNK_SIZE = 1 << 16
+
+gWhitespaceRE = re.compile(r"[ \t\n\r]*")
+gDecoder = json.JSONDecoder()
 
 def compress_profile(profile):
   symbols = set()
@@ -21,7 +30,7 @@ def compress_profile(profile):
           sample["frames"][i] = location_to_index[frame]
         else:
           frame["location"] = location_to_index[frame["location"]]
-  profile["format"] = "profileJSONWithSymbolicationTable,1"
+  profile["format"] = COMPRESSED_FORMAT
   profile["symbolicationTable"] = dict(enumerate(symbols))
   profile["profileJSON"] = { "threads": profile["threads"] }
   del profile["threads"]
@@ -30,3 +39,285 @@ def save_profile(profile, filename):
   f = open(filename, "w")
   json.dump(profile, f)
   f.close()
+
+class JSONStreamReader:
+  """
+  Pull-style reader for a JSON document stored in a file. Containers are
+  walked with object_items() / array_items(), and any value can be decoded
+  in one go with value(), so only the value currently being looked at has
+  to be held in memory.
+  """
+
+  def __init__(self, f, chunk_size=READ_CHUNK_SIZE):
+    self.f = f
+    self.chunk_size = chunk_size
+    self.buf = ""
+    self.pos = 0
+    self.eof = False
+
+  def _fill(self, size=None):
+    if self.eof:
+      return False
+    data = self.f.read(size or self.chunk_size)
+    if not data:
+      self.eof = True
+      return False
+    self.buf = self.buf[self.pos:] + data
+    self.pos = 0
+    return True
+
+  def peek(self):
+    while True:
+      self.pos = gWhitespaceRE.match(self.buf, self.pos).end()
+      if self.pos < len(self.buf):
+        return self.buf[self.pos]
+      if not self._fill():
+        raise ValueError("Unexpected end of JSON input")
+
+  def expect(self, char):
+    if self.peek() != char:
+      raise ValueError("Expected %r at offset %d" % (char, self.pos))
+    self.pos += 1
+
+  def value(self):
+    self.peek()
+    size = self.chunk_size
+    while True:
+      try:
+        value, end = gDecoder.raw_decode(self.buf, self.pos)
+      except ValueError:
+        # The value is cut off by the end of the buffer. Read twice as much
+        # each time, so that a large value is only decoded O(log n) times.
+        if not self._fill(size):
+          raise
+        size *= 2
+        continue
+      if end == len(self.buf) and self._fill():
+        # A number at the end of the buffer may continue in the next chunk.
+        continue
+      self.pos = end
+      return value
+
+  def _separator(self, close):
+    char = self.peek()
+    self.pos += 1
+    if char == ",":
+      return True
+    if char == close:
+      return False
+    raise ValueError("Expected ',' or %r at offset %d" % (close, self.pos - 1))
+
+  def object_items(self):
+    """
+    Yields the keys of the object at the current position. The caller has
+    to consume each key's value before advancing the generator.
+    """
+    self.expect("{")
+    if self.peek() == "}":
+      self.pos += 1
+      return
+    while True:
+      key = self.value()
+      self.expect(":")
+      yield key
+      if not self._separator("}"):
+        return
+
+  def array_items(self):
+    """
+    Yields once per element of the array at the current position. The
+    caller has to consume the element before advancing the generator.
+    """
+    self.expect("[")
+    if self.peek() == "]":
+      self.pos += 1
+      return
+    while True:
+      yield
+      if not self._separator("]"):
+        return
+
+class SymbolTable:
+  """
+  Interns frame locations in order of first appearance, so that symbol
+  indices are the same from run to run. When given an AddressResolver, "0x"
+  frame locations are resolved the first time they are seen, and frames
+  whose addresses resolve to the same symbol share an index. Addresses left
+  to the remote symbol server have to be resolved, with resolve_frames()
+  and resolve_remote(), before any index is assigned.
+  """
+
+  def __init__(self, resolver=None):
+    self.resolver = resolver
+    self.symbols = []
+    self.symbol_to_index = {}
+    self.location_to_index = {}
+    self.resolved = {}
+
+  def needs_remote(self):
+    return bool(self.resolver and self.resolver.forward)
+
+  def resolve(self, location):
+    symbol = self.resolved.get(location)
+    if symbol is None:
+      symbol = self.resolved[location] = self.resolver.resolve(location)
+    return symbol
+
+  def resolve_frames(self, frames):
+    for frame in frames:
+      if not isinstance(frame, basestring) and frame["location"][0:2] == "0x":
+        self.resolve(frame["location"])
+
+  def resolve_remote(self):
+    """
+    Replaces the local guesses for the addresses the resolver deferred to
+    the remote symbol server by what the server found.
+    """
+    self.resolved.update(self.resolver.resolve_deferred())
+
+  def index(self, location, resolve=True):
+    index = self.location_to_index.get(location)
+    if index is None:
+      symbol = location
+      if resolve and self.resolver and location[0:2] == "0x":
+        symbol = self.resolve(location)
+      index = self.symbol_to_index.get(symbol)
+      if index is None:
+        index = self.symbol_to_index[symbol] = str(len(self.symbols))
+        self.symbols.append(symbol)
+      self.location_to_index[location] = index
+    return index
+
+  def compress_frames(self, frames):
+    for i, frame in enumerate(frames):
+      if isinstance(frame, basestring):
+        frames[i] = self.index(frame, resolve=False)
+      else:
+        frame["location"] = self.index(frame["location"])
+
+  def finish(self):
+    """
+    Returns the final list of symbols.
+    """
+    return self.symbols
+
+def symbolicate_and_compress(profile, symbolicator=None):
+  """
+  Symbolicates |profile| in place and converts it to COMPRESSED_FORMAT in a
+  single traversal of its frames. This gives the same profile as
+  ProfileSymbolicator.symbolicate_profile() followed by compress_profile(),
+  except that symbol indices are assigned in order of first appearance.
+  """
+  resolver = None
+  if symbolicator and "libs" in profile:
+    resolver = symbolicator.address_resolver(profile["libs"])
+  table = SymbolTable(resolver)
+  if table.needs_remote():
+    for thread in profile["threads"]:
+      for sample in thread["samples"]:
+        table.resolve_frames(sample["frames"])
+    table.resolve_remote()
+  for thread in profile["threads"]:
+    for sample in thread["samples"]:
+      table.compress_frames(sample["frames"])
+  profile["format"] = COMPRESSED_FORMAT
+  profile["symbolicationTable"] = dict(enumerate(table.finish()))
+  profile["profileJSON"] = { "threads": profile["threads"] }
+  del profile["threads"]
+
+def read_libs(filename):
+  """
+  Returns the JSON-encoded "libs" string of the profile stored in
+  |filename|, or None. Gecko writes "libs" ahead of the samples, so this
+  usually only has to read the start of the file.
+  """
+  f = open(filename, "r")
+  try:
+    reader = JSONStreamReader(f)
+    for key in reader.object_items():
+      value = reader.value()
+      if key == "libs":
+        return value
+  finally:
+    f.close()
+  return None
+
+def read_samples(filename):
+  """
+  Yields the samples of the profile stored in |filename|, one at a time.
+  """
+  f = open(filename, "r")
+  try:
+    reader = JSONStreamReader(f)
+    for key in reader.object_items():
+      if key != "threads":
+        reader.value()
+        continue
+      for _ in reader.array_items():
+        for thread_key in reader.object_items():
+          if thread_key != "samples":
+            reader.value()
+            continue
+          for _ in reader.array_items():
+            yield reader.value()
+  finally:
+    f.close()
+
+def symbolicate_and_compress_file(filename, output_filename, symbolicator=None, libs=None):
+  """
+  Streaming counterpart of symbolicate_and_compress(): reads the raw profile
+  in |filename| one sample at a time and writes the symbolicated,
+  compressed profile to |output_filename|. |libs| is the profile's "libs"
+  string, as returned by read_libs().
+  """
+  resolver = None
+  if symbolicator and libs is not None:
+    resolver = symbolicator.address_resolver(libs)
+  table = SymbolTable(resolver)
+  if table.needs_remote():
+    # The samples are written as they are read, so the remote symbols have
+    # to be known before the first index is assigned.
+    for sample in read_samples(filename):
+      table.resolve_frames(sample["frames"])
+    table.resolve_remote()
+
+  f = open(filename, "r")
+  out = open(output_filename, "w")
+  try:
+    reader = JSONStreamReader(f)
+    out.write("{")
+    for key in reader.object_items():
+      if key in ("format", "symbolicationTable", "profileJSON"):
+        reader.value()
+        continue
+      if key != "threads":
+        out.write("%s:%s," % (json.dumps(key), json.dumps(reader.value())))
+        continue
+      # Threads end up under "profileJSON" in the compressed format.
+      out.write('"profileJSON":{"threads":[')
+      for thread_index, _ in enumerate(reader.array_items()):
+        out.write("," if thread_index else "")
+        out.write("{")
+        for thread_key_index, thread_key in enumerate(reader.object_items()):
+          out.write("," if thread_key_index else "")
+          out.write(json.dumps(thread_key) + ":")
+          if thread_key != "samples":
+            out.write(json.dumps(reader.value()))
+            continue
+          out.write("[")
+          for sample_index, _ in enumerate(reader.array_items()):
+            sample = reader.value()
+            table.compress_frames(sample["frames"])
+            out.write("," if sample_index else "")
+            out.write(json.dumps(sample))
+          out.write("]")
+        out.write("}")
+      out.write("]},")
+    out.write('"format":%s,"symbolicationTable":{' % json.dumps(COMPRESSED_FORMAT))
+    for i, symbol in enumerate(table.finish()):
+      out.write("," if i else "")
+      out.write('"%d":%s' % (i, json.dumps(symbol)))
+    out.write("}}")
+  finally:
+    out.close()
+    f.close()
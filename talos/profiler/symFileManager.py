@@ -8,17 +8,65 @@ import os
 import re
 import threading
 import time
+from array import array
 from bisect import bisect
 
 # Libraries to keep prefetched
 PREFETCHED_LIBS = [ "xul.pdb", "firefox.pdb" ]
 
+# Binary symbol index files live next to the .sym file they were built from.
+# They hold a header line, the sorted addresses as 32-bit unsigned integers
+# and the matching symbols separated by newlines.
+SYMBOL_INDEX_SUFFIX = ".idx"
+SYMBOL_INDEX_MAGIC = "SYMIDX1"
+
 class SymbolInfo:
   def __init__(self, addressMap):
     self.sortedAddresses = sorted(addressMap.keys())
     self.sortedSymbols = [addressMap[address] for address in self.sortedAddresses]
     self.entryCount = len(self.sortedAddresses)
 
+  @staticmethod
+  def FromIndexFile(path):
+    f = open(path, "rb")
+    try:
+      magic, count = f.readline().split()
+      if magic != SYMBOL_INDEX_MAGIC:
+        raise ValueError("Not a symbol index file")
+      count = int(count)
+      addresses = array("I")
+      addresses.fromfile(f, count)
+      symbols = f.read().split("\n") if count else []
+    finally:
+      f.close()
+    if len(symbols) != count:
+      raise ValueError("Truncated symbol index file")
+    symbolInfo = SymbolInfo({})
+    symbolInfo.sortedAddresses = addresses
+    symbolInfo.sortedSymbols = symbols
+    symbolInfo.entryCount = count
+    return symbolInfo
+
+  def WriteIndexFile(self, path):
+    """
+    Returns False if the symbols can't be represented in an index file.
+    """
+    if self.entryCount and self.sortedAddresses[-1] >= 1 << 32:
+      return False
+    tempPath = path + ".tmp"
+    f = open(tempPath, "wb")
+    try:
+      f.write("%s %d\n" % (SYMBOL_INDEX_MAGIC, self.entryCount))
+      array("I", self.sortedAddresses).tofile(f)
+      f.write("\n".join(symbol.encode("utf-8") if isinstance(symbol, unicode) else symbol
+                        for symbol in self.sortedSymbols))
+    finally:
+      f.close()
+    if os.path.exists(path):
+      os.remove(path)
+    os.rename(tempPath, path)
+    return True
+
   # TODO: Add checks for address < funcEnd ?
   def Lookup(self, address):
     nearest = bisect(self.sortedAddresses, address) - 1
@@ -95,7 +143,30 @@ class SymFileManager:
 
     return libSymbolMap
 
+  def BuildSymbolIndex(self, path):
+    """
+    Writes the binary index for the .sym file at |path|, so that later
+    lookups don't need to parse the .sym file again.
+    """
+    symbolInfo = self.ParseSymbolFile(path)
+    if symbolInfo:
+      try:
+        symbolInfo.WriteIndexFile(path + SYMBOL_INDEX_SUFFIX)
+      except Exception as e:
+        LogError("Error writing symbol index for " + path + ": " + str(e))
+    return symbolInfo
+
   def FetchSymbolsFromFile(self, path):
+    indexPath = path + SYMBOL_INDEX_SUFFIX
+    if os.path.isfile(indexPath):
+      try:
+        LogTrace("Loading symbol index at " + indexPath)
+        return SymbolInfo.FromIndexFile(indexPath)
+      except Exception as e:
+        LogError("Error reading symbol index " + indexPath + ": " + str(e))
+    return self.ParseSymbolFile(path)
+
+  def ParseSymbolFile(self, path):
     try:
       symFile = open(path, "r")
     except Exception as e:
@@ -0,0 +1,231 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from symLogging import LogTrace, LogError
+
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib2
+
+# Seconds to wait for a single response from the remote symbol server
+DEFAULT_TIMEOUT = 30
+# Seconds a whole Resolve() call may take, however many modules it needs
+DEFAULT_DEADLINE = 120
+# Maximum number of requests in flight at the same time
+MAX_CONCURRENT_REQUESTS = 4
+# Seconds for which a module the server didn't know is not asked about again
+NEGATIVE_CACHE_TTL = 24 * 60 * 60
+
+# Resolvers shared by all symbolication requests in this process, keyed by
+# (server URL, cache directory)
+gResolvers = {}
+gResolversLock = threading.Lock()
+
+def GetRemoteResolver(options):
+  """
+  Returns the RemoteSymbolResolver for the symbol server configured in
+  |options|. Requests for the same server share one resolver, so that
+  symbols fetched for one profile are reused for the next.
+  """
+  key = (options["remoteSymbolServer"], options.get("remoteSymbolCache"))
+  gResolversLock.acquire()
+  try:
+    if key not in gResolvers:
+      gResolvers[key] = RemoteSymbolResolver(key[0], key[1],
+                                             options.get("remoteSymbolTimeout", DEFAULT_TIMEOUT),
+                                             options.get("remoteSymbolDeadline", DEFAULT_DEADLINE))
+    return gResolvers[key]
+  finally:
+    gResolversLock.release()
+
+class ModuleCache:
+  """
+  Symbols the remote server returned for one (libName, breakpadId)
+  module, kept in memory and, if a cache directory is given, on disk.
+  """
+
+  def __init__(self, libName, breakpadId, cacheDir):
+    self.libName = libName
+    self.breakpadId = breakpadId
+    self.lock = threading.Lock()
+    self.symbols = {}
+    self.unknownSince = None
+    self.path = None
+    if cacheDir:
+      name = hashlib.sha1(libName + "/" + breakpadId).hexdigest()
+      self.path = os.path.join(cacheDir, name + ".json")
+      self.Load()
+
+  def Load(self):
+    try:
+      f = open(self.path, "r")
+    except IOError:
+      return
+    try:
+      data = json.load(f)
+      self.symbols = dict((int(offset), symbol) for offset, symbol in data["symbols"].iteritems())
+      self.unknownSince = data.get("unknownSince")
+    except Exception as e:
+      LogError("Ignoring unreadable symbol cache file " + self.path + ": " + str(e))
+    finally:
+      f.close()
+
+  def Save(self):
+    if not self.path:
+      return
+    try:
+      try:
+        os.makedirs(os.path.dirname(self.path))
+      except OSError:
+        pass
+      tempPath = "%s.%d.%d.tmp" % (self.path, os.getpid(), threading.currentThread().ident)
+      f = open(tempPath, "w")
+      json.dump({ "libName": self.libName, "breakpadId": self.breakpadId,
+                  "unknownSince": self.unknownSince, "symbols": self.symbols }, f)
+      f.close()
+      if os.path.exists(self.path):
+        os.remove(self.path)
+      os.rename(tempPath, self.path)
+    except Exception as e:
+      LogError("Couldn't write symbol cache file " + self.path + ": " + str(e))
+
+  def IsKnownUnknown(self):
+    return self.unknownSince is not None and time.time() - self.unknownSince < NEGATIVE_CACHE_TTL
+
+class RemoteSymbolResolver:
+  """
+  Resolves module offsets with a remote symbol server. Responses are cached
+  per (module, offset), modules the server doesn't know are remembered for
+  NEGATIVE_CACHE_TTL, and concurrent requests for the same module are
+  coalesced. Modules are requested in parallel, and every request is bounded
+  by a timeout and every Resolve() call by a deadline.
+  """
+
+  def __init__(self, url, cacheDir=None, timeout=DEFAULT_TIMEOUT, deadline=DEFAULT_DEADLINE):
+    self.url = url
+    self.cacheDir = cacheDir
+    self.timeout = timeout
+    self.deadline = deadline
+    self.modules = {}
+    self.modulesLock = threading.Lock()
+    self.requestSlots = threading.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+  def GetModuleCache(self, libName, breakpadId):
+    self.modulesLock.acquire()
+    try:
+      key = (libName, breakpadId)
+      if key not in self.modules:
+        self.modules[key] = ModuleCache(libName, breakpadId, self.cacheDir)
+      return self.modules[key]
+    finally:
+      self.modulesLock.release()
+
+  def Resolve(self, requests, symbolSources, forwardCount=0):
+    """
+    |requests| is a list of (libName, breakpadId, offsets) tuples. Returns a
+    dict mapping each (libName, breakpadId) the server knows to a dict of
+    {offset: symbol}; offsets that couldn't be resolved before the deadline
+    are missing from it.
+    """
+    deadline = time.time() + self.deadline
+    results = {}
+    threads = []
+    for libName, breakpadId, offsets in requests:
+      moduleCache = self.GetModuleCache(libName, breakpadId)
+      thread = threading.Thread(target=self._ResolveModule,
+                                args=(moduleCache, offsets, symbolSources, forwardCount, results))
+      thread.setDaemon(True)
+      thread.start()
+      threads.append(thread)
+
+    for thread in threads:
+      thread.join(max(0, deadline - time.time()))
+      if thread.isAlive():
+        LogError("Remote symbolication didn't finish before the deadline")
+        break
+
+    # Results that arrive after the deadline still go into the cache, but
+    # aren't part of this call's result.
+    return dict(results)
+
+  def _ResolveModule(self, moduleCache, offsets, symbolSources, forwardCount, results):
+    # Holding the module's lock while the request is in flight coalesces
+    # requests for the same module: later callers find its symbols cached.
+    moduleCache.lock.acquire()
+    try:
+      if moduleCache.IsKnownUnknown():
+        LogTrace("Not forwarding request for unknown module " + moduleCache.libName)
+        return
+      missing = sorted(set(offset for offset in offsets if offset not in moduleCache.symbols))
+      if missing:
+        self.requestSlots.acquire()
+        try:
+          response = self._Request(moduleCache, missing, symbolSources, forwardCount)
+        finally:
+          self.requestSlots.release()
+        if response is None:
+          return
+        known, symbols = response
+        if not known:
+          moduleCache.unknownSince = time.time()
+          moduleCache.Save()
+          return
+        moduleCache.unknownSince = None
+        moduleCache.symbols.update(zip(missing, symbols))
+        moduleCache.Save()
+      results[(moduleCache.libName, moduleCache.breakpadId)] = \
+        dict((offset, moduleCache.symbols[offset]) for offset in offsets)
+    except Exception as e:
+      LogError("Exception while resolving symbols remotely: " + str(e))
+    finally:
+      moduleCache.lock.release()
+
+  def _Request(self, moduleCache, offsets, symbolSources, forwardCount):
+    """
+    Returns (known, symbols) for |offsets|, or None if the server couldn't
+    be reached.
+    """
+    LogTrace("Forwarding " + str(len(offsets)) + " PCs in " + moduleCache.libName + " for symbolication")
+    stack = [[0, offset] for offset in offsets]
+    memoryMap = [[moduleCache.libName, moduleCache.breakpadId]]
+    requestVersion = 4
+    while True:
+      requestObj = { "symbolSources": symbolSources,
+                     "stacks": [stack], "memoryMap": memoryMap,
+                     "forwarded": forwardCount + 1, "version": requestVersion }
+      headers = { "Content-Type": "application/json" }
+      requestHandle = urllib2.Request(self.url, json.dumps(requestObj), headers)
+      try:
+        response = urllib2.urlopen(requestHandle, None, self.timeout)
+        responseJson = json.loads(response.read())
+        break
+      except urllib2.HTTPError as e:
+        if requestVersion == 4:
+          # The server rejected the request; try again with version 3
+          requestVersion = 3
+          continue
+        LogError("Exception while forwarding request: " + str(e))
+        return None
+      except Exception as e:
+        # Timeouts and connection errors aren't worth retrying
+        LogError("Exception while forwarding request: " + str(e))
+        return None
+
+    try:
+      if requestVersion == 4:
+        known = bool(responseJson["knownModules"][0])
+        symbols = responseJson["symbolicatedStacks"][0]
+      else:
+        symbols = responseJson[0]
+        known = True
+    except Exception as e:
+      LogError("Exception while parsing server response to forwarded request: " + str(e))
+      return None
+    if len(symbols) != len(offsets):
+      LogError(str(len(symbols)) + " symbols in response, " + str(len(offsets)) + " PCs in request!")
+      return None
+    return known, symbols
@@ -2,46 +2,151 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
-import cStringIO
 import hashlib
 import json
 import os
 import platform
 import re
+import shutil
+import socket
 import subprocess
 import sys
 import urllib2
 import zipfile
 from symFileManager import SymFileManager
-from symbolicationRequest import SymbolicationRequest
+from symbolicationRequest import SymbolicationRequest, getModuleV3
 from symLogging import LogMessage
 
+# Symbol sources used when symbolicating profiles
+SYMBOL_SOURCES = ["FIREFOX", "WINDOWS"]
+
+# Symbol zips are downloaded in chunks of this many bytes
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+# Number of times an interrupted symbol zip download is resumed
+DOWNLOAD_ATTEMPTS = 3
+
+class AddressResolver:
+  """
+  Resolves profile frame addresses one at a time, giving the same strings
+  as a SymbolicationRequest would. Addresses in libraries that have no local
+  symbols are deferred; resolve_deferred() forwards them to the remote
+  symbol server in a single request.
+  """
+
+  def __init__(self, symbolicator, libs):
+    self.symbolicator = symbolicator
+    self.shared_libraries = json.loads(libs)
+    self.shared_libraries.sort(key=lambda lib: lib["start"])
+    self.symbol_sources = [source for source in SYMBOL_SOURCES
+                           if source in symbolicator.options["symbolPaths"]]
+    self.forward = bool(symbolicator.options.get("remoteSymbolServer"))
+    # lib start address -> (libName, SymbolInfo or None), or None for libs
+    # that can't be symbolicated at all
+    self.modules = {}
+    self.deferred = set()
+
+  def _get_module(self, lib):
+    if lib["start"] not in self.modules:
+      module = getModuleV3(*self.symbolicator._module_from_lib(lib))
+      if module is None:
+        self.modules[lib["start"]] = None
+      else:
+        self.symbolicator.extract_symbols(module.libName, module.breakpadId)
+        symbol_map = self.symbolicator.sym_file_manager.GetLibSymbolMap(module.libName,
+                                                                        module.breakpadId,
+                                                                        self.symbol_sources)
+        self.modules[lib["start"]] = (module.libName, symbol_map)
+    return self.modules[lib["start"]]
+
+  def resolve(self, address):
+    lib = self.symbolicator._get_containing_library(int(address, 0), self.shared_libraries)
+    if not lib:
+      return address
+    module = self._get_module(lib)
+    if module is None:
+      return address
+    lib_name, symbol_map = module
+    offset = int(address, 0) - lib["start"]
+    function_name = None
+    if symbol_map:
+      function_name = symbol_map.Lookup(offset)
+    elif self.forward:
+      self.deferred.add(address)
+    if function_name is None:
+      function_name = hex(offset)
+    return function_name + " (in " + lib_name + ")"
+
+  def resolve_deferred(self):
+    """
+    Returns a dict mapping deferred addresses to the symbols the remote
+    symbol server found for them.
+    """
+    if not self.deferred:
+      return {}
+    symbols_to_resolve = self.symbolicator._assign_symbols_to_libraries(self.deferred, self.shared_libraries)
+    self.deferred = set()
+    return self.symbolicator._resolve_symbols(symbols_to_resolve)
+
 class ProfileSymbolicator:
   def __init__(self, options):
     self.options = options
     self.sym_file_manager = SymFileManager(self.options)
+    # (ZipFile, {(lib name, breakpad id): [member names]}) pairs
+    self.symbol_zips = []
+    self.extracted_modules = set()
 
   def integrate_symbol_zip_from_url(self, symbol_zip_url):
-    if self.have_integrated(symbol_zip_url):
-      return
-    LogMessage("Retrieving symbol zip from {symbol_zip_url}...".format(symbol_zip_url=symbol_zip_url))
-    io = urllib2.urlopen(symbol_zip_url, None, 30)
-    sio = cStringIO.StringIO(io.read())
-    zf = zipfile.ZipFile(sio)
-    io.close()
-    self.integrate_symbol_zip(zf)
-    zf.close()
-    self._create_file_if_not_exists(self._marker_file(symbol_zip_url))
+    zip_path = self._downloaded_zip_file(symbol_zip_url)
+    if not self.have_integrated(symbol_zip_url):
+      LogMessage("Retrieving symbol zip from {symbol_zip_url}...".format(symbol_zip_url=symbol_zip_url))
+      self._download(symbol_zip_url, zip_path)
+      self._create_file_if_not_exists(self._marker_file(symbol_zip_url))
+    self.integrate_symbol_zip_from_file(zip_path)
 
   def integrate_symbol_zip_from_file(self, filename):
-    if self.have_integrated(filename):
-      return
-    f = open(filename, 'r')
-    zf = zipfile.ZipFile(f)
-    self.integrate_symbol_zip(zf)
-    f.close()
-    zf.close()
-    self._create_file_if_not_exists(self._marker_file(filename))
+    self.integrate_symbol_zip(zipfile.ZipFile(filename, 'r'))
+
+  def _downloaded_zip_file(self, symbol_zip_url):
+    download_dir = os.path.join(self.options["symbolPaths"]["FIREFOX"], ".downloads")
+    return os.path.join(download_dir, hashlib.sha1(symbol_zip_url).hexdigest() + ".zip")
+
+  def _download(self, url, filename):
+    """
+    Streams |url| to |filename| in chunks. An interrupted download is
+    resumed from where it stopped if the server supports range requests.
+    """
+    partial_filename = filename + ".part"
+    self._create_file_if_not_exists(partial_filename)
+    for attempt in range(DOWNLOAD_ATTEMPTS):
+      offset = os.path.getsize(partial_filename)
+      request = urllib2.Request(url)
+      if offset:
+        request.add_header("Range", "bytes=%d-" % offset)
+      try:
+        response = urllib2.urlopen(request, None, 30)
+        if response.getcode() != 206:
+          # The server sent the whole file.
+          offset = 0
+        f = open(partial_filename, 'ab' if offset else 'wb')
+        try:
+          shutil.copyfileobj(response, f, DOWNLOAD_CHUNK_SIZE)
+        finally:
+          f.close()
+          response.close()
+        break
+      except urllib2.HTTPError as e:
+        if e.code == 416:
+          # The partial file already holds the whole download.
+          break
+        if attempt == DOWNLOAD_ATTEMPTS - 1:
+          raise
+      except (urllib2.URLError, IOError, socket.error) as e:
+        if attempt == DOWNLOAD_ATTEMPTS - 1:
+          raise
+      LogMessage("Retrying download of {url} from byte {offset}: {error}".format(url=url, offset=os.path.getsize(partial_filename), error=e))
+    if os.path.exists(filename):
+      os.remove(filename)
+    os.rename(partial_filename, filename)
 
   def _create_file_if_not_exists(self, filename):
     try:
@@ -54,7 +159,45 @@ class ProfileSymbolicator:
       pass
 
   def integrate_symbol_zip(self, symbol_zip_file):
-    symbol_zip_file.extractall(self.options["symbolPaths"]["FIREFOX"])
+    """
+    Makes the symbols in |symbol_zip_file| available. Nothing is extracted
+    yet; extract_symbols() pulls out a module's symbols when a profile
+    needs them.
+    """
+    members = {}
+    for name in symbol_zip_file.namelist():
+      parts = name.split("/")
+      if len(parts) > 2 and parts[-1]:
+        members.setdefault((parts[0], parts[1]), []).append(name)
+    self.symbol_zips.append((symbol_zip_file, members))
+
+  def extract_symbols(self, lib_name, breakpad_id):
+    """
+    Extracts the <lib_name>/<breakpad_id>/ members of the integrated symbol
+    zips and builds the binary symbol index of each .sym file among them.
+    """
+    if (lib_name, breakpad_id) in self.extracted_modules:
+      return
+    self.extracted_modules.add((lib_name, breakpad_id))
+    output_dir = self.options["symbolPaths"]["FIREFOX"]
+    for symbol_zip_file, members in self.symbol_zips:
+      for name in members.get((lib_name, breakpad_id), []):
+        path = os.path.join(output_dir, *name.split("/"))
+        if os.path.exists(path) and os.path.getsize(path) == symbol_zip_file.getinfo(name).file_size:
+          # Extracted by an earlier cycle of the same test.
+          continue
+        symbol_zip_file.extract(name, output_dir)
+        if path.endswith(".sym"):
+          self.sym_file_manager.BuildSymbolIndex(path)
+
+  def _extract_symbols_for_libs(self, shared_libraries):
+    for lib in shared_libraries:
+      self.extract_symbols(*self._module_from_lib(lib))
+
+  def close(self):
+    for symbol_zip_file, members in self.symbol_zips:
+      symbol_zip_file.close()
+    self.symbol_zips = []
 
   def _marker_file(self, symbol_zip_url):
     marker_dir = os.path.join(self.options["symbolPaths"]["FIREFOX"], ".markers")
@@ -67,11 +210,12 @@ class ProfileSymbolicator:
     if "libs" not in profile_json:
       return []
     shared_libraries = json.loads(profile_json["libs"])
+    self._extract_symbols_for_libs(shared_libraries)
     memoryMap = []
     for lib in shared_libraries:
       memoryMap.append(self._module_from_lib(lib))
 
-    rawRequest = { "stacks": [[]], "memoryMap": memoryMap, "version": 4, "symbolSources": ["FIREFOX", "WINDOWS"] }
+    rawRequest = { "stacks": [[]], "memoryMap": memoryMap, "version": 4, "symbolSources": SYMBOL_SOURCES }
     request = SymbolicationRequest(self.sym_file_manager, rawRequest)
     if not request.isValidRequest:
       return []
@@ -103,12 +247,14 @@ class ProfileSymbolicator:
 
     # Additionally, we add all dumped symbol files to the missingsymbols zip file.
     zip = zipfile.ZipFile(symbol_zip_path, 'a', zipfile.ZIP_DEFLATED)
+    # namelist() builds a new list on every call; look names up in a set.
+    zip_names = set(zip.namelist())
 
     rootlen = len(os.path.join(output_dir, '_')) - 1
     for lib in unknown_modules:
       [name, breakpadId] = self._module_from_lib(lib)
       expected_name = os.path.join(name, breakpadId, name) + '.sym'
-      if expected_name in zip.namelist():
+      if expected_name in zip_names:
         # No need to dump the symbols again if we already have it in the
         # missingsymbols zip file from a previous run.
         zip.extract(expected_name, output_dir)
@@ -124,8 +270,9 @@ class ProfileSymbolicator:
         actual_name = sym_file[rootlen:]
         if expected_name != actual_name:
           LogMessage("Got unexpected name for symbol file, expected {0} but got {1}.".format(expected_name, actual_name))
-        if actual_name not in zip.namelist():
+        if actual_name not in zip_names:
           zip.write(sym_file, actual_name)
+          zip_names.add(actual_name)
     zip.close()
 
   def store_symbols(self, fullpath, dump_syms_bin, output_directory):
@@ -180,13 +327,24 @@ class ProfileSymbolicator:
   def symbolicate_profile(self, profile_json):
     if "libs" not in profile_json:
       return
-    shared_libraries = json.loads(profile_json["libs"])
-    shared_libraries.sort(key=lambda lib: lib["start"])
     addresses = self._find_addresses(profile_json)
-    symbols_to_resolve = self._assign_symbols_to_libraries(addresses, shared_libraries)
-    symbolication_table = self._resolve_symbols(symbols_to_resolve)
+    symbolication_table = self.symbolicate_addresses(addresses, profile_json["libs"])
     self._substitute_symbols(profile_json, symbolication_table)
 
+  def address_resolver(self, libs):
+    return AddressResolver(self, libs)
+
+  def symbolicate_addresses(self, addresses, libs):
+    """
+    Resolves a collection of "0x..." address strings against the shared
+    libraries described by the profile's JSON-encoded |libs| string.
+    Returns a dict mapping each resolved address to its symbol.
+    """
+    shared_libraries = json.loads(libs)
+    shared_libraries.sort(key=lambda lib: lib["start"])
+    symbols_to_resolve = self._assign_symbols_to_libraries(addresses, shared_libraries)
+    return self._resolve_symbols(symbols_to_resolve)
+
   def _find_addresses(self, profile_json):
     addresses = set()
     for thread in profile_json["threads"]:
@@ -235,12 +393,13 @@ class ProfileSymbolicator:
     for moduleIndex, library_with_symbols in enumerate(symbols_to_resolve):
       lib = library_with_symbols["library"]
       symbols = library_with_symbols["symbols"]
+      self.extract_symbols(*self._module_from_lib(lib))
       memoryMap.append(self._module_from_lib(lib))
       all_symbols += symbols
       for symbol in symbols:
         processedStack.append([moduleIndex, int(symbol, 0) - lib["start"]])
 
-    rawRequest = { "stacks": [processedStack], "memoryMap": memoryMap, "version": 4, "symbolSources": ["FIREFOX", "WINDOWS"] }
+    rawRequest = { "stacks": [processedStack], "memoryMap": memoryMap, "version": 4, "symbolSources": SYMBOL_SOURCES }
     request = SymbolicationRequest(self.sym_file_manager, rawRequest)
     if not request.isValidRequest:
       return {}
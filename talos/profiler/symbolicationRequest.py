@@ -4,10 +4,9 @@
 
 from symLogging import LogTrace, LogError, LogMessage
 import symFileManager
+import symRemoteResolver
 
 import re
-import json
-import urllib2
 from bisect import bisect
 
 # Precompiled regex for validating lib names
@@ -160,75 +159,26 @@ class SymbolicationRequest:
     LogTrace("Forwarding " + str(len(stack)) + " PCs for symbolication")
 
     try:
-      url = self.symFileManager.sOptions["remoteSymbolServer"]
-      rawModules =  []
-      moduleToIndex = {}
-      newIndexToOldIndex = {}
-      for moduleIndex, m in modules:
-        l = [m.libName, m.breakpadId]
-        newModuleIndex = len(rawModules)
-        rawModules.append(l)
-        moduleToIndex[m] = newModuleIndex
-        newIndexToOldIndex[newModuleIndex] = moduleIndex
-
-      rawStack = []
+      offsetsByModule = dict((moduleIndex, []) for moduleIndex, m in modules)
       for entry in stack:
-        moduleIndex = entry[0]
-        offset = entry[1]
-        module = self.combinedMemoryMap[moduleIndex]
-        newIndex = moduleToIndex[module]
-        rawStack.append([newIndex, offset])
-
-      requestVersion = 4
-      while True:
-        requestObj = { "symbolSources": self.symbolSources,
-                       "stacks": [rawStack], "memoryMap": rawModules,
-                       "forwarded": self.forwardCount + 1, "version": requestVersion }
-        requestJson = json.dumps(requestObj)
-        headers = { "Content-Type": "application/json" }
-        requestHandle = urllib2.Request(url, requestJson, headers)
-        try:
-          response = urllib2.urlopen(requestHandle)
-        except Exception as e:
-          if requestVersion == 4:
-            # Try again with version 3
-            requestVersion = 3
-            continue
-          raise e
-        succeededVersion = requestVersion
-        break
+        offsetsByModule[entry[0]].append(entry[1])
+      requests = [(m.libName, m.breakpadId, offsetsByModule[moduleIndex]) for moduleIndex, m in modules]
 
+      resolver = symRemoteResolver.GetRemoteResolver(self.symFileManager.sOptions)
+      resolved = resolver.Resolve(requests, self.symbolSources, self.forwardCount)
     except Exception as e:
       LogError("Exception while forwarding request: " + str(e))
       return
 
-    try:
-      responseJson = json.loads(response.read())
-    except Exception as e:
-      LogError("Exception while reading server response to forwarded request: " + str(e))
-      return
-
-    try:
-      if succeededVersion == 4:
-        responseKnownModules = responseJson['knownModules']
-        for newIndex, known in enumerate(responseKnownModules):
-          if known and newIndex in newIndexToOldIndex:
-            self.knownModules[newIndexToOldIndex[newIndex]] = True
-
-        responseSymbols = responseJson['symbolicatedStacks'][0]
-      else:
-        responseSymbols = responseJson[0]
-      if len(responseSymbols) != len(stack):
-        LogError(str(len(responseSymbols)) + " symbols in response, " + str(len(stack)) + " PCs in request!")
-        return
+    for moduleIndex, m in modules:
+      if (m.libName, m.breakpadId) in resolved:
+        self.knownModules[moduleIndex] = True
 
-      for index in range(0, len(stack)):
-        symbol = responseSymbols[index]
-        originalIndex = indexes[index]
-        symbolicatedStack[originalIndex] = symbol
-    except Exception as e:
-      LogError("Exception while parsing server response to forwarded request: " + str(e))
-      return
+    for index, entry in enumerate(stack):
+      module = self.combinedMemoryMap[entry[0]]
+      symbols = resolved.get((module.libName, module.breakpadId), {})
+      if entry[1] in symbols:
+        symbolicatedStack[indexes[index]] = symbols[entry[1]]
 
   def Symbolicate(self, stackNum):
     # Check if we should forward requests when required sym files don't exist
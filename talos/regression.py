@@ -0,0 +1,356 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+statistical detection of performance changes in graph server history:
+ - welch_ttest() and mann_whitney_u() tell whether two samples of results
+   differ, without assuming they have the same variance or are normal;
+ - detect_changes() finds the pushes of a series after which its results
+   changed, with a t-test of the pushes before and after each of them.
+
+Run as a script, it reports the changes of the series compare.py knows,
+and whether a --revision differs from the history before it.
+"""
+
+import datetime
+import math
+import sys
+import time
+from argparse import ArgumentParser
+import compare
+import filter
+import graphfetch
+import resultstore
+
+BACK_WINDOW = 12 # pushes before a change to compare with
+FORE_WINDOW = 12 # pushes after it
+MIN_WINDOW = 3 # the fewest pushes on either side
+THRESHOLD = 7. # t value of a change
+ALPHA = 0.05 # significance of a difference between samples
+
+### distributions
+
+def betainc(a, b, x):
+    """the regularized incomplete beta function I_x(a, b)"""
+    if x <= 0.:
+        return 0.
+    if x >= 1.:
+        return 1.
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) +
+                     a * math.log(x) + b * math.log(1. - x))
+    # the continued fraction converges quickly below the mean
+    if x < (a + 1.) / (a + b + 2.):
+        return front * _betacf(a, b, x) / a
+    return 1. - front * _betacf(b, a, 1. - x) / b
+
+def _betacf(a, b, x, iterations=200, epsilon=3e-16):
+    """the continued fraction of betainc(), by Lentz's method"""
+    tiny = 1e-300
+    c = 1.
+    d = 1. - (a + b) * x / (a + 1.)
+    d = 1. / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in xrange(1, iterations + 1):
+        m2 = 2 * m
+        for numerator in (m * (b - m) * x / ((a + m2 - 1.) * (a + m2)),
+                          -(a + m) * (a + b + m) * x / ((a + m2) * (a + m2 + 1.))):
+            d = 1. + numerator * d
+            d = 1. / (d if abs(d) > tiny else tiny)
+            c = 1. + numerator / c
+            c = c if abs(c) > tiny else tiny
+            delta = c * d
+            h *= delta
+        if abs(delta - 1.) < epsilon:
+            break
+    return h
+
+def t_pvalue(t, df):
+    """the two-sided p-value of |t| in Student's t distribution of |df| degrees of freedom"""
+    if math.isinf(t):
+        return 0.
+    return betainc(df / 2., 0.5, df / (df + t * t))
+
+def normal_pvalue(z):
+    """the two-sided p-value of |z| in the standard normal distribution"""
+    return math.erfc(abs(z) / math.sqrt(2.))
+
+### tests of two samples
+
+def welch_ttest(a, b):
+    """
+    Welch's t-test of the samples |a| and |b|, of at least 2 values each:
+    returns the t value, positive when |b| is higher, the degrees of freedom
+    and the two-sided p-value
+    """
+    n1, n2 = len(a), len(b)
+    if n1 < 2 or n2 < 2:
+        raise ValueError("Welch's t-test needs at least 2 values in each sample")
+    m1, m2 = filter.mean(a), filter.mean(b)
+    v1 = sum((x - m1) ** 2 for x in a) / (n1 - 1)
+    v2 = sum((x - m2) ** 2 for x in b) / (n2 - 1)
+    return _welch(m1, v1, n1, m2, v2, n2)
+
+def _welch(m1, v1, n1, m2, v2, n2):
+    s1, s2 = v1 / n1, v2 / n2
+    if not s1 + s2:
+        # no variance: the samples are the same, or entirely different
+        t = 0. if m1 == m2 else math.copysign(float('inf'), m2 - m1)
+        return t, float(n1 + n2 - 2), t_pvalue(t, n1 + n2 - 2)
+    t = (m2 - m1) / math.sqrt(s1 + s2)
+    df = (s1 + s2) ** 2 / (s1 ** 2 / (n1 - 1) + s2 ** 2 / (n2 - 1))
+    return t, df, t_pvalue(t, df)
+
+def ranks(values):
+    """the ranks of |values|, from 1, ties sharing their average rank; and the sizes of the ties"""
+    order = sorted(range(len(values)), key=values.__getitem__)
+    result = [0.] * len(values)
+    ties = []
+    start = 0
+    while start < len(order):
+        end = start + 1
+        while end < len(order) and values[order[end]] == values[order[start]]:
+            end += 1
+        rank = (start + end + 1) / 2.
+        for index in order[start:end]:
+            result[index] = rank
+        if end - start > 1:
+            ties.append(end - start)
+        start = end
+    return result, ties
+
+def mann_whitney_u(a, b):
+    """
+    the Mann-Whitney U test of the samples |a| and |b|: returns the U
+    statistic of |a| and the two-sided p-value, in the normal approximation
+    with a correction for ties and continuity
+    """
+    n1, n2 = len(a), len(b)
+    if not n1 or not n2:
+        raise ValueError("the Mann-Whitney U test needs values in each sample")
+    rank, ties = ranks(list(a) + list(b))
+    u = sum(rank[:n1]) - n1 * (n1 + 1) / 2.
+    n = n1 + n2
+    mu = n1 * n2 / 2.
+    tie_correction = sum(t ** 3 - t for t in ties) / float(n * (n - 1)) if n > 1 else 0.
+    sigma = math.sqrt(n1 * n2 / 12. * ((n + 1) - tie_correction))
+    if not sigma:
+        return u, 1.
+    z = max(abs(u - mu) - 0.5, 0.) / sigma
+    return u, normal_pvalue(z)
+
+def prediction_ttest(history, value):
+    """
+    the t value and two-sided p-value of a single |value| against the
+    prediction interval of |history|, of at least 2 values
+    """
+    n = len(history)
+    if n < 2:
+        raise ValueError("the prediction interval needs at least 2 values")
+    m = filter.mean(history)
+    s = math.sqrt(sum((x - m) ** 2 for x in history) / (n - 1))
+    if not s:
+        t = 0. if value == m else math.copysign(float('inf'), value - m)
+    else:
+        t = (value - m) / (s * math.sqrt(1. + 1. / n))
+    return t, t_pvalue(t, n - 1)
+
+TESTS = ('welch', 'mannwhitney')
+
+def differs(history, values, alpha=ALPHA, test='welch'):
+    """
+    whether |values| differ from |history| with a significance of |alpha|,
+    by Welch's t-test or the Mann-Whitney U test; a single value is tested
+    against the prediction interval of the history instead of by Welch's
+    """
+    if test == 'mannwhitney':
+        return mann_whitney_u(history, values)[1] < alpha
+    if len(values) == 1:
+        return prediction_ttest(history, values[0])[1] < alpha
+    return welch_ttest(history, values)[2] < alpha
+
+### change points
+
+def pushes(runs):
+    """
+    the (revision, date, value) of each push of |runs| of (date, revision,
+    value), in date order; the value of a push is the mean of its runs
+    """
+    by_revision = {}
+    order = []
+    for date, revision, value in sorted(runs):
+        if revision not in by_revision:
+            by_revision[revision] = [date, []]
+            order.append(revision)
+        by_revision[revision][1].append(value)
+    return [(revision, by_revision[revision][0], filter.mean(by_revision[revision][1]))
+            for revision in order]
+
+def t_values(values, back=BACK_WINDOW, fore=FORE_WINDOW, min_window=MIN_WINDOW):
+    """
+    the t value of a change at each index of |values|: of the Welch t-test
+    of the |back| values before it and the |fore| values from it, or None
+    where there are fewer than |min_window| on either side. Running sums
+    make each one a constant time computation.
+    """
+    n = len(values)
+    # shifted by the first value, so that the sums of squares don't lose precision
+    shift = values[0] if values else 0.
+    sums = [0.] * (n + 1)
+    squares = [0.] * (n + 1)
+    for i, value in enumerate(values):
+        value -= shift
+        sums[i + 1] = sums[i] + value
+        squares[i + 1] = squares[i] + value * value
+
+    def moments(start, end):
+        count = end - start
+        total = sums[end] - sums[start]
+        mean = total / count
+        var = max(squares[end] - squares[start] - total * mean, 0.) / (count - 1)
+        return mean, var, count
+
+    result = [None] * n
+    for i in xrange(min_window, n - min_window + 1):
+        m1, v1, n1 = moments(max(i - back, 0), i)
+        m2, v2, n2 = moments(i, min(i + fore, n))
+        result[i] = _welch(m1, v1, n1, m2, v2, n2)[0]
+    return result
+
+class Change(object):
+    """a change of the results of a series, at the push of |revision|"""
+
+    def __init__(self, index, revision, date, t, old, new, lower_is_better=True):
+        self.index = index
+        self.revision = revision
+        self.date = date
+        self.t = t
+        self.old = old # mean of the pushes before
+        self.new = new # and from the change
+        self.lower_is_better = lower_is_better
+
+    @property
+    def percent(self):
+        if not self.old:
+            return 0.
+        return 100. * (self.new - self.old) / self.old
+
+    @property
+    def regression(self):
+        return (self.new > self.old) == self.lower_is_better
+
+    def __repr__(self):
+        return "Change(%r, %r, t=%.2f, %.2f -> %.2f)" % (self.index, self.revision, self.t, self.old, self.new)
+
+def detect_changes(runs, back=BACK_WINDOW, fore=FORE_WINDOW, threshold=THRESHOLD, lower_is_better=True):
+    """
+    the Changes in |runs| of (date, revision, value): pushes where the t
+    value is at least |threshold| and the highest of the pushes around
+    """
+    points = pushes(runs)
+    values = [value for revision, date, value in points]
+    ts = t_values(values, back, fore)
+    changes = []
+    for i, t in enumerate(ts):
+        if t is None or abs(t) < threshold:
+            continue
+        # of pushes as high, the first is the change
+        if any(u is not None and abs(u) >= abs(t) for u in ts[max(i - back, 0):i]) or \
+           any(u is not None and abs(u) > abs(t) for u in ts[i + 1:i + fore]):
+            continue
+        old = filter.mean(values[max(i - back, 0):i])
+        new = filter.mean(values[i:i + fore])
+        revision, date, value = points[i]
+        changes.append(Change(i, revision, date, t, old, new, lower_is_better))
+    return changes
+
+### command line
+
+def series_runs(data, startdate=None, enddate=None):
+    """the (date, revision, value) runs of graph server |data| between the dates"""
+    return [(run[2], run[1][2], run[3]) for run in data['test_runs']
+            if (startdate is None or run[2] >= startdate) and (enddate is None or run[2] <= enddate)]
+
+class RegressionOptions(ArgumentParser):
+
+    def __init__(self):
+        ArgumentParser.__init__(self, description="Find the changes in the results of talos tests on the graph server")
+        self.add_argument("--branch", default="Inbound", choices=compare.branches,
+                          help="branch to look at, default Inbound")
+        self.add_argument("--platform", action="append", dest="platforms", choices=compare.platforms,
+                          help="platform to look at; can be given several times, defaults to all")
+        self.add_argument("--testname", action="append", dest="testnames", choices=compare.tests,
+                          help="test to look at; can be given several times, defaults to all")
+        self.add_argument("--revision",
+                          help="revision whose results to compare with the history before it")
+        self.add_argument("--history", type=int, default=30,
+                          help="number of days of history to look at, default 30")
+        self.add_argument("--pgo", action="store_true", default=False,
+                          help="use the PGO branch if available")
+        self.add_argument("--back-window", type=int, default=BACK_WINDOW,
+                          help="pushes before a change to compare with, default %d" % BACK_WINDOW)
+        self.add_argument("--fore-window", type=int, default=FORE_WINDOW,
+                          help="pushes after a change to compare with, default %d" % FORE_WINDOW)
+        self.add_argument("--threshold", type=float, default=THRESHOLD,
+                          help="t value of a change, default %g" % THRESHOLD)
+        self.add_argument("--alpha", type=float, default=ALPHA,
+                          help="significance of the difference of --revision, default %g" % ALPHA)
+        self.add_argument("--test", default='welch', choices=TESTS,
+                          help="test of the difference of --revision, default welch")
+        self.add_argument("--store",
+                          help="SQLite database of results history, as for compare.py")
+        self.add_argument("--jobs", type=int, default=graphfetch.JOBS,
+                          help="number of graph server requests to run at once")
+        self.add_argument("--cache-dir",
+                          help="directory to keep graph server responses in for an hour")
+
+def format_change(test, change):
+    return "   %s %-18s\t%s\t%s\t%7.1f\t->\t%7.1f\t%+.1f%%\tt=%.1f" % (
+        ':(' if change.regression else ':)', test, change.revision,
+        datetime.datetime.fromtimestamp(change.date).strftime('%Y-%m-%d'),
+        change.old, change.new, change.percent, change.t)
+
+def main(args=sys.argv[1:]):
+    parser = RegressionOptions()
+    options = parser.parse_args(args)
+    platforms = options.platforms or compare.platforms
+    tests = options.testnames or compare.tests
+    startdate = int(time.time() - options.history * 24 * 60 * 60)
+
+    compare.fetcher = graphfetch.GraphFetcher(compare.SERVER, compare.selector, jobs=options.jobs,
+                                              cache_dir=options.cache_dir, debug=compare.debug)
+    store = resultstore.ResultsStore(options.store) if options.store else None
+    try:
+        compare.prefetchGraphData(options.branch, options.branch, platforms, list(tests), options.pgo, store=store)
+        for p in platforms:
+            print "%s:" % p
+            bid = compare.branchIds(p, options.branch, options.branch, options.pgo)[0]
+            for t in compare.platformTests(p, list(tests)):
+                data = compare.getGraphData(compare.test_map[t]['id'], bid, compare.platform_map[p], store=store,
+                                            series=(t, compare.branchName(bid), p))
+                if not data:
+                    print "   %-18s\tNo data for platform" % t
+                    continue
+                runs = series_runs(data, startdate)
+                lower_is_better = compare.lowerIsBetter(t)
+                for change in detect_changes(runs, options.back_window, options.fore_window,
+                                             options.threshold, lower_is_better):
+                    print format_change(t, change)
+                if options.revision:
+                    values = [value for date, revision, value in runs if revision == options.revision]
+                    if not values:
+                        continue
+                    first = min(date for date, revision, value in runs if revision == options.revision)
+                    history = [value for date, revision, value in runs if date < first]
+                    if len(history) > 1 and differs(history, values, options.alpha, options.test):
+                        better = (filter.mean(values) < filter.mean(history)) == lower_is_better
+                        print "   %s %-18s\t%s differs from the %d runs before it: %.1f -> %.1f" % (
+                            ':)' if better else ':(', t, options.revision, len(history),
+                            filter.mean(history), filter.mean(values))
+    finally:
+        if store is not None:
+            store.close()
+        compare.fetcher.close()
+
+if __name__ == '__main__':
+    main()
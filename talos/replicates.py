@@ -0,0 +1,258 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+raw replicates and counter samples of talos runs, in columns.
+
+A run is written in a binary file of:
+ - a header: magic, version and the size of the metadata;
+ - the metadata, in JSON: the run (machine, build, date), the string
+   tables of the suite, page and counter columns, and the number of rows of
+   each table;
+ - the columns of each table of TABLES, in order, as little endian arrays.
+
+load() reads the files of many runs into one set of columns, with a run
+column indexing their metadata; the columns are numpy arrays if numpy is
+available, and arrays of the array module if not.
+"""
+
+import json
+import os
+import struct
+import sys
+from array import array
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = 'TREP'
+VERSION = 1
+HEADER = struct.Struct('<4sII') # magic, version, metadata size
+EXTENSION = '.trep'
+
+# table -> (column, array typecode); suite, page and counter are indexes of their string tables
+TABLES = (('replicates', (('suite', 'i'), ('cycle', 'i'), ('page', 'i'), ('value', 'd'))),
+          ('counters', (('suite', 'i'), ('cycle', 'i'), ('counter', 'i'), ('value', 'd'))))
+STRING_COLUMNS = ('suite', 'page', 'counter')
+NUMPY_TYPES = {'i': '<i4', 'd': '<f8'}
+
+class Table(object):
+    """columns of the same number of rows"""
+
+    def __init__(self, columns):
+        self.names = [name for name, typecode in columns]
+        self.typecodes = dict(columns)
+        self.columns = dict((name, array(typecode)) for name, typecode in columns)
+
+    def __len__(self):
+        return len(self.columns[self.names[0]])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def extend(self, count, **values):
+        """adds |count| rows, of the values of each column: a sequence, or a single value for all the rows"""
+        for name in self.names:
+            value = values[name]
+            column = self.columns[name]
+            if isinstance(value, (int, long, float)):
+                column.extend(array(self.typecodes[name], [value]) * count)
+            else:
+                column.extend(value)
+
+class Replicates(object):
+    """the replicates and counters tables of a run"""
+
+    def __init__(self, run=None):
+        self.run = run or {}
+        self.strings = dict((name, []) for name in STRING_COLUMNS)
+        self.string_ids = dict((name, {}) for name in STRING_COLUMNS)
+        self.tables = dict((name, Table(columns)) for name, columns in TABLES)
+
+    def __getitem__(self, name):
+        return self.tables[name]
+
+    def string_id(self, column, string):
+        ids = self.string_ids[column]
+        if string not in ids:
+            ids[string] = len(self.strings[column])
+            self.strings[column].append(string)
+        return ids[string]
+
+    @classmethod
+    def from_talos_results(cls, talos_results, machine=None):
+        """the replicates of |talos_results|, a TalosResults, run on |machine|"""
+        browser_config = talos_results.browser_config
+        data = cls({'title': talos_results.title,
+                    'date': talos_results.date,
+                    'machine': machine or {},
+                    'browser_name': browser_config.get('browser_name'),
+                    'browser_version': browser_config.get('browser_version'),
+                    'branch_name': browser_config.get('branch_name'),
+                    'sourcestamp': browser_config.get('sourcestamp'),
+                    'buildid': browser_config.get('buildid')})
+        for test in talos_results.results:
+            suite = data.string_id('suite', test.name())
+            for cycle, result in enumerate(test.results):
+                for page, runs in result.raw_values():
+                    data['replicates'].extend(len(runs), suite=suite, cycle=cycle,
+                                              page=data.string_id('page', page), value=runs)
+            for cycle, counters in enumerate(test.all_counter_results):
+                for name, values in counters.items():
+                    # only samples, not e.g. main thread I/O or xperf tuples
+                    values = [value for value in values if isinstance(value, (int, long, float))]
+                    if not values:
+                        continue
+                    data['counters'].extend(len(values), suite=suite, cycle=cycle,
+                                            counter=data.string_id('counter', name), value=values)
+        return data
+
+    def tostring(self):
+        metadata = json.dumps({'run': self.run,
+                               'strings': self.strings,
+                               'rows': dict((name, len(table)) for name, table in self.tables.items())},
+                              separators=(',', ':'))
+        pieces = [HEADER.pack(MAGIC, VERSION, len(metadata)), metadata]
+        for name, columns in TABLES:
+            for column, typecode in columns:
+                values = self.tables[name][column]
+                if sys.byteorder == 'big':
+                    values = array(typecode, values)
+                    values.byteswap()
+                pieces.append(values.tostring())
+        return ''.join(pieces)
+
+    def write(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.tostring())
+
+def parse(string, use_numpy=True):
+    """
+    the (metadata, {table: {column: values}}) of a run from the string of
+    Replicates.tostring(); the values are numpy arrays over |string| if
+    |use_numpy| and numpy is available
+    """
+    try:
+        magic, version, size = HEADER.unpack_from(string)
+    except struct.error:
+        raise ValueError("Not talos replicates")
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not talos replicates of version %d" % VERSION)
+    offset = HEADER.size
+    metadata = json.loads(string[offset:offset + size])
+    offset += size
+    tables = {}
+    for name, columns in TABLES:
+        rows = metadata['rows'][name]
+        tables[name] = {}
+        for column, typecode in columns:
+            end = offset + rows * array(typecode).itemsize
+            if len(string) < end:
+                raise ValueError("Truncated talos replicates")
+            if use_numpy and numpy is not None:
+                values = numpy.frombuffer(string, dtype=NUMPY_TYPES[typecode], count=rows, offset=offset)
+            else:
+                values = array(typecode, string[offset:end])
+                if sys.byteorder == 'big':
+                    values.byteswap()
+            tables[name][column] = values
+            offset = end
+    return metadata, tables
+
+def read(path):
+    """the Replicates of the file at |path|"""
+    with open(path, 'rb') as f:
+        metadata, tables = parse(f.read(), use_numpy=False)
+    data = Replicates(metadata['run'])
+    for column in STRING_COLUMNS:
+        for string in metadata['strings'][column]:
+            data.string_id(column, string)
+    for name, columns in tables.items():
+        data.tables[name].columns.update(columns)
+    return data
+
+class Collection(object):
+    """
+    the tables of many runs, with a run column of the index of their
+    metadata in |runs|, and suite, page and counter columns indexing
+    |strings|
+    """
+
+    def __init__(self, runs, strings, tables):
+        self.runs = runs
+        self.strings = strings
+        self.tables = tables
+
+    def __getitem__(self, name):
+        return self.tables[name]
+
+def paths(paths):
+    """the replicates files at |paths|, and in the directories of |paths|"""
+    for path in paths:
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                if filename.endswith(EXTENSION):
+                    yield os.path.join(path, filename)
+        else:
+            yield path
+
+def load(paths_):
+    """the Collection of the runs in the replicates files at or in the directories of |paths_|"""
+    runs = []
+    strings = dict((name, []) for name in STRING_COLUMNS)
+    string_ids = dict((name, {}) for name in STRING_COLUMNS)
+    pieces = dict((name, dict((column, []) for column, typecode in (('run', 'i'),) + columns))
+                  for name, columns in TABLES)
+
+    for path in paths(paths_):
+        with open(path, 'rb') as f:
+            metadata, tables = parse(f.read())
+        run = len(runs)
+        runs.append(metadata['run'])
+
+        # the ids of the strings of the run, in the collection
+        mapping = {}
+        for column in STRING_COLUMNS:
+            ids = string_ids[column]
+            for string in metadata['strings'][column]:
+                if string not in ids:
+                    ids[string] = len(strings[column])
+                    strings[column].append(string)
+            mapping[column] = [ids[string] for string in metadata['strings'][column]]
+
+        for name, columns in TABLES:
+            rows = metadata['rows'][name]
+            pieces[name]['run'].append((run, rows))
+            for column, typecode in columns:
+                values = tables[name][column]
+                if column in mapping:
+                    if numpy is not None:
+                        values = numpy.array(mapping[column] or [0], dtype=NUMPY_TYPES['i'])[values]
+                    else:
+                        values = array('i', [mapping[column][value] for value in values])
+                pieces[name][column].append(values)
+
+    return Collection(runs, strings, dict((name, concatenate(pieces[name], columns)) for name, columns in TABLES))
+
+def concatenate(pieces, columns):
+    """the columns of a table from the |pieces| of each run"""
+    typecodes = dict((('run', 'i'),) + columns)
+    table = {}
+    for column, values in pieces.items():
+        if column == 'run':
+            if numpy is not None:
+                table[column] = numpy.repeat(numpy.array([run for run, rows in values] or [0], dtype=NUMPY_TYPES['i']),
+                                             [rows for run, rows in values] or [0])
+            else:
+                table[column] = array('i')
+                for run, rows in values:
+                    table[column].extend(array('i', [run]) * rows)
+        elif numpy is not None:
+            table[column] = numpy.concatenate(values) if values else numpy.zeros(0, dtype=NUMPY_TYPES[typecodes[column]])
+        else:
+            table[column] = array(typecodes[column])
+            for piece in values:
+                table[column].extend(piece)
+    return table
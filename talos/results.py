@@ -11,9 +11,12 @@ see https://wiki.mozilla.org/Buildbot/Talos/DataFormat
 
 import filter
 import json
+import mainthreadio
 import os
 import output
 import re
+import resultstore
+import tempfile
 import utils
 import csv
 
@@ -32,8 +35,20 @@ class TalosResults(object):
         self.date = date
         self.browser_config = browser_config
 
+        # (format, options) -> (Output, its results), built once
+        self.payloads = {}
+
     def add(self, test_results):
         self.results.append(test_results)
+        self.payloads.clear()
+
+    def payload(self, format, **options):
+        """the Output of |format| and its results, built on first use"""
+        key = (format, tuple(sorted(options.items())))
+        if key not in self.payloads:
+            _output = output.formats[format](self, **options)
+            self.payloads[key] = (_output, _output())
+        return self.payloads[key]
 
     def check_output_formats(self, output_formats, **output_options):
         """check output formats"""
@@ -68,19 +83,23 @@ class TalosResults(object):
         tbpl_output = {}
         try:
 
+            # build the results of each format once, keep a local copy of
+            # them, then output them to all the URLs at once; a failing URL
+            # doesn't stop the others, its error is raised once all are done
+            destinations = []
             for key, urls in output_formats.items():
-                options = output_options.get(key, {})
-                _output = output.formats[key](self, **options)
-                results = _output()
-                for url in urls:
-                    _output.output(results, url, tbpl_output)
+                _output, results = self.payload(key, **output_options.get(key, {}))
+                if self.browser_config.get('results_spool'):
+                    self.spool(self.browser_config['results_spool'], key, _output, results)
+                destinations.extend(output.Destination(key, _output, results, url) for url in urls)
+            output.fan_out(destinations, tbpl_output)
 
         except utils.TalosError, e:
-            # print to results.out
+            # print to results.out, of the graphserver results already built if any
             try:
-                _output = output.GraphserverOutput(self)
-                results = _output()
-                _output.output('file://%s' % os.path.join(os.getcwd(), 'results.out'), results)
+                payloads = [payload for (key, options), payload in self.payloads.items() if key == 'results_urls']
+                _output, results = payloads[0] if payloads else self.payload('results_urls')
+                _output.output(results, 'file://%s' % os.path.join(os.getcwd(), 'results.out'), {})
             except:
                 pass
             print '\nFAIL: %s' % str(e).replace('\n', '\nRETURN:')
@@ -88,6 +107,44 @@ class TalosResults(object):
 
         print "TinderboxPrint: TalosResult: %s" % json.dumps(tbpl_output)
 
+        if self.browser_config.get('results_store'):
+            self.store(self.browser_config['results_store'])
+
+    def spool(self, directory, format, _output, results):
+        """
+        keep a local copy of the |results| of |format| in |directory|,
+        written aside and renamed so that the copies there are whole
+        """
+        name = '%s-%s-%s%s' % (self.title or 'talos', self.date,
+                               format[:-len('_urls')] if format.endswith('_urls') else format,
+                               _output.spool_extension)
+        path = os.path.join(directory, name)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            fd, temp = tempfile.mkstemp(dir=directory, prefix='.' + name)
+            os.close(fd)
+            _output.write_file(results, temp)
+            try:
+                os.rename(temp, path)
+            except OSError:
+                # windows doesn't rename over files
+                os.remove(path)
+                os.rename(temp, path)
+        except (EnvironmentError, utils.TalosError) as e:
+            print "Failed to spool the %s results to %s: %s" % (format, path, e)
+
+    def store(self, path):
+        """record the results in the local results store at |path|"""
+        try:
+            store = resultstore.ResultsStore(path)
+            try:
+                store.add_talos_results(self, resultstore.local_platform(self.browser_config.get('e10s'), self.remote))
+            finally:
+                store.close()
+        except resultstore.Error as e:
+            print "Failed to record the results in %s: %s" % (path, e)
+
 
 class TestResults(object):
     """container object for all test results across cycles"""
@@ -110,11 +167,12 @@ class TestResults(object):
     def mainthread(self):
         return self.test_config['mainthread']
 
-    def add(self, results, counter_results=None):
+    def add(self, results, counter_results=None, mainthread_io=None):
         """
         accumulate one cycle of results
         - results : TalosResults instance or path to browser log
         - counter_results : counters accumulated for this cycle
+        - mainthread_io : main thread I/O data of this cycle, from mainthreadio.Analyzer
         """
 
         if isinstance(results, basestring):
@@ -123,7 +181,8 @@ class TestResults(object):
                 raise utils.TalosError("no output from browser [%s]" % results)
 
             # convert to a results class via parsing the browser log
-            browserLog = BrowserLogResults(filename=results, counter_results=counter_results, global_counters=self.global_counters)
+            browserLog = BrowserLogResults(filename=results, counter_results=counter_results, global_counters=self.global_counters,
+                                           mainthread_io=mainthread_io)
             results = browserLog.results()
 
         self.using_xperf = browserLog.using_xperf
@@ -287,13 +346,14 @@ class BrowserLogResults(object):
     # If we are using xperf, we do not upload the regular results, only xperf counters
     using_xperf = False
 
-    def __init__(self, filename=None, results_raw=None, counter_results=None, global_counters=None):
+    def __init__(self, filename=None, results_raw=None, counter_results=None, global_counters=None, mainthread_io=None):
         """
         - shutdown : whether to record shutdown results or not
         """
 
         self.counter_results = counter_results
         self.global_counters = global_counters
+        self.mainthread_io_data = mainthread_io
 
         if not (results_raw or filename):
             raise utils.TalosError("Must specify filename or results_raw")
@@ -497,15 +557,9 @@ class BrowserLogResults(object):
 
         # we want to measure mtio on xperf runs.
         # this will be shoved into the xperf results as we ignore those
-        SCRIPT_DIR = os.path.abspath(os.path.realpath(os.path.dirname(__file__)))
-        filename = os.path.join(SCRIPT_DIR, 'mainthread_io.json')
-        try:
-            contents = file(filename).read()
-            counter_results.setdefault('mainthreadio', []).append(contents)
+        if self.mainthread_io_data is not None:
+            counter_results.setdefault('mainthreadio', []).append(mainthreadio.format_output(self.mainthread_io_data))
             self.using_xperf = True
-        except:
-            # silent failure is fine here as we will only see this on tp5n runs
-            pass
 
     def shutdown(self, counter_results):
         """record shutdown time in counter_results dictionary"""
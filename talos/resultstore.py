@@ -0,0 +1,154 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+a local store of results history, in a SQLite database.
+
+Each (test, branch, platform) series holds runs of a date, a revision and a
+value, indexed by date and by revision so that compare.py and report.py can
+look at weeks of history without asking the graph server. Talos records its
+own results in it (see --resultsStore), and compare.py adds what the graph
+server has when the store hasn't been synced with it recently.
+"""
+
+import mozinfo
+import sqlite3
+import time
+import filter
+
+Error = sqlite3.Error
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY,
+    test TEXT NOT NULL,
+    branch TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    synced INTEGER, -- when the remote runs were last fetched
+    UNIQUE (test, platform, branch)
+);
+CREATE TABLE IF NOT EXISTS runs (
+    series INTEGER NOT NULL REFERENCES series (id),
+    date INTEGER NOT NULL,
+    revision TEXT,
+    value REAL NOT NULL,
+    run_id INTEGER, -- the graph server's id of the run, for remote runs
+    UNIQUE (series, run_id)
+);
+CREATE INDEX IF NOT EXISTS runs_by_date ON runs (series, date);
+CREATE INDEX IF NOT EXISTS runs_by_revision ON runs (series, revision);
+"""
+
+def local_platform(e10s=False, remote=False):
+    """the name compare.py gives to the platform talos runs on"""
+    if remote:
+        platform = 'Android'
+    elif mozinfo.os == 'linux':
+        platform = 'Linux64' if mozinfo.bits == 64 else 'Linux'
+    elif mozinfo.os == 'win':
+        versions = {'5.1': 'WinXP', '6.1': 'Win7', '6.2': 'Win8'}
+        platform = versions.get(mozinfo.version[:3], 'Win%s' % mozinfo.version)
+    elif mozinfo.os == 'mac':
+        platform = 'OSX64' if '10.6' in mozinfo.version else 'OSX10.8' if '10.8' in mozinfo.version else 'OSX%s' % mozinfo.version
+    else:
+        platform = '%s %s' % (mozinfo.os, mozinfo.version)
+    if e10s:
+        platform += ' (e10s)'
+    return platform
+
+def summary_value(values):
+    """the value of a run from its page values: the mean, ignoring the max as the graph server does"""
+    values = sorted(values)
+    if len(values) > 1:
+        values = values[:-1]
+    return filter.mean(values) if values else 0
+
+class ResultsStore(object):
+    """results history in the SQLite database at |path|"""
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        self.series_ids = {}
+
+    def close(self):
+        self.db.close()
+
+    def series(self, test, branch, platform, create=True):
+        """the id of the series, or None if it doesn't exist and isn't |create|d"""
+        key = (test, branch, platform)
+        if key not in self.series_ids:
+            row = self.db.execute("SELECT id FROM series WHERE test = ? AND branch = ? AND platform = ?",
+                                  key).fetchone()
+            if row:
+                self.series_ids[key] = row[0]
+            elif create:
+                self.series_ids[key] = self.db.execute("INSERT INTO series (test, branch, platform) VALUES (?, ?, ?)",
+                                                       key).lastrowid
+            else:
+                return None
+        return self.series_ids[key]
+
+    def add_runs(self, test, branch, platform, runs, synced=None):
+        """
+        adds |runs| of (date, revision, value, run_id) to the series; runs
+        with a run_id replace the one of the same id. |synced| is when the
+        runs were fetched from a remote source, if they were.
+        """
+        series = self.series(test, branch, platform)
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO runs (series, date, revision, value, run_id) VALUES (?, ?, ?, ?, ?)",
+                                ((series, date, revision, value, run_id) for date, revision, value, run_id in runs))
+            if synced is not None:
+                self.db.execute("UPDATE series SET synced = ? WHERE id = ?", (synced, series))
+
+    def synced(self, test, branch, platform):
+        """when the series was last fetched from a remote source, or None"""
+        series = self.series(test, branch, platform, create=False)
+        if series is None:
+            return None
+        return self.db.execute("SELECT synced FROM series WHERE id = ?", (series,)).fetchone()[0]
+
+    def is_stale(self, test, branch, platform, max_age):
+        """whether the series wasn't fetched in the last |max_age| seconds"""
+        synced = self.synced(test, branch, platform)
+        return synced is None or synced < time.time() - max_age
+
+    def runs(self, test, branch, platform, start=None, end=None, revision=None):
+        """the (date, revision, value, run_id) runs of the series between the |start| and |end| dates, or of |revision|"""
+        series = self.series(test, branch, platform, create=False)
+        if series is None:
+            return []
+        query = "SELECT date, revision, value, run_id FROM runs WHERE series = ?"
+        params = [series]
+        if start is not None:
+            query += " AND date >= ?"
+            params.append(start)
+        if end is not None:
+            query += " AND date <= ?"
+            params.append(end)
+        if revision is not None:
+            query += " AND revision = ?"
+            params.append(revision)
+        return self.db.execute(query + " ORDER BY date", params).fetchall()
+
+    def values(self, test, branch, platform, start=None, end=None, revision=None):
+        """the values of the runs(), in date order"""
+        return [run[2] for run in self.runs(test, branch, platform, start=start, end=end, revision=revision)]
+
+    def add_talos_results(self, talos_results, platform):
+        """records a run of each test of |talos_results|, a TalosResults, on |platform|"""
+        browser_config = talos_results.browser_config
+        for test in talos_results.results:
+            if test.format == 'tpformat' and test.using_xperf:
+                # as for the graph server, there are only xperf counters
+                continue
+            _filters = talos_results.filters
+            if 'filters' in test.test_config:
+                _filters = filter.filters_args(test.test_config['filters'])
+            values = [val for result in test.results for val, page in result.values(_filters)]
+            if values:
+                self.add_runs(test.name(), browser_config['branch_name'], platform,
+                              [(talos_results.date, browser_config['sourcestamp'], summary_value(values), None)])
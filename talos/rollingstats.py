@@ -0,0 +1,193 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+incremental per day statistics of graph server series, for the weekday
+reports of scripts/report.py.
+
+The values of each day of a (test, platform) series are kept in buckets of
+a logarithmic sketch: values within ACCURACY of each other share a bucket,
+which holds their count, sum and sum of squares. Adding a value is a
+constant time update, the series percentiles come from the bucket counts,
+and the moments of a day's values between two percentiles are those of its
+buckets between them. The state is saved to a JSON file, along with the
+last run of each series, so that later reports only add the new runs; the
+days older than a maximum age are dropped, so that the reports cover the
+recent history the graph server gives, and the file stops growing.
+"""
+
+import datetime
+import json
+import math
+import os
+import tempfile
+import time
+
+ACCURACY = 0.001 # relative error of a value's bucket
+VERSION = 1
+MAX_AGE = 365 # days of runs kept in the state of report.py
+
+GAMMA = (1. + ACCURACY) / (1. - ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+ZERO_BUCKET = -2 ** 31 # values of 0 and below
+
+def bucket(value):
+    """the index of the bucket of |value|"""
+    if value <= 0:
+        return ZERO_BUCKET
+    return int(math.ceil(math.log(value) / LOG_GAMMA))
+
+def day(date):
+    """the day number of the |date| timestamp, in local time"""
+    return datetime.date.fromtimestamp(date).toordinal()
+
+def weekday(day):
+    """the weekday of |day|, Monday being 0 as in calendar.day_name"""
+    return (day - 1) % 7
+
+class SeriesStats(object):
+    """the per day buckets of a series: day -> bucket -> [count, sum, sum of squares]"""
+
+    def __init__(self, shift=None, last=None, days=None):
+        self.shift = shift # subtracted from the values, to keep the sums of squares precise
+        self.last = last # (date, run id) of the last run added
+        self.days = days or {}
+
+    def add(self, date, value):
+        if self.shift is None:
+            self.shift = value
+        buckets = self.days.setdefault(day(date), {})
+        index = bucket(value)
+        counts = buckets.get(index)
+        if counts is None:
+            counts = buckets[index] = [0, 0., 0.]
+        value -= self.shift
+        counts[0] += 1
+        counts[1] += value
+        counts[2] += value * value
+
+    def add_runs(self, runs):
+        """
+        adds the graph server |runs| of [run id, [push id, ?, revision],
+        date, value] that are after the last one added; returns how many
+        """
+        new = [run for run in runs if self.last is None or (run[2], run[0]) > self.last]
+        for run in new:
+            self.add(run[2], run[3])
+        if new:
+            self.last = max((run[2], run[0]) for run in new)
+        return len(new)
+
+    def expire(self, oldest):
+        """drops the days before the |oldest| day number"""
+        for d in [d for d in self.days if d < oldest]:
+            del self.days[d]
+
+    def fractions(self, low=0.1, high=0.9):
+        """
+        bucket -> the fraction of its values between the |low| and |high|
+        ranks of the series, as report.py trimmed them: the values of
+        sorted(values)[int(low * n):int(high * n + 1)]
+        """
+        totals = {}
+        for buckets in self.days.itervalues():
+            for index, counts in buckets.iteritems():
+                totals[index] = totals.get(index, 0) + counts[0]
+        n = sum(totals.itervalues())
+        start, end = int(low * n), min(int(high * n + 1), n)
+        fractions = {}
+        rank = 0
+        for index in sorted(totals):
+            count = totals[index]
+            kept = min(rank + count, end) - max(rank, start)
+            if kept > 0:
+                fractions[index] = float(kept) / count
+            rank += count
+        return fractions
+
+    def moments(self, fractions=None):
+        """
+        day -> (count, mean, variance) of its values, of the |fractions| of
+        each bucket if given
+        """
+        result = {}
+        for d, buckets in self.days.iteritems():
+            count = total = squares = 0.
+            for index, counts in buckets.iteritems():
+                fraction = 1. if fractions is None else fractions.get(index, 0.)
+                if fraction:
+                    count += fraction * counts[0]
+                    total += fraction * counts[1]
+                    squares += fraction * counts[2]
+            if count:
+                mean = total / count
+                result[d] = (count, mean + self.shift, max(squares / count - mean * mean, 0.))
+        return result
+
+    def weekdays(self, mode='variance', low=0.1, high=0.9):
+        """weekday -> the variance, or the count in 'count' |mode|, of each day of the trimmed series"""
+        result = dict((i, []) for i in range(7))
+        for d, (count, mean, variance) in sorted(self.moments(self.fractions(low, high)).items()):
+            result[weekday(d)].append(variance if mode == 'variance' else count)
+        return result
+
+    def to_json(self):
+        return {'shift': self.shift, 'last': self.last,
+                'days': dict((str(d), dict((str(index), counts) for index, counts in buckets.iteritems()))
+                             for d, buckets in self.days.iteritems())}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data['shift'], tuple(data['last']) if data['last'] else None,
+                   dict((int(d), dict((int(index), counts) for index, counts in buckets.iteritems()))
+                        for d, buckets in data['days'].iteritems()))
+
+class RollingStats(object):
+    """
+    the SeriesStats of (test, platform) series, kept in the JSON file at
+    |path| if given, without the days older than |max_age| days if given
+    """
+
+    def __init__(self, path=None, max_age=None):
+        self.path = path
+        self.oldest = day(time.time()) - max_age if max_age is not None else None
+        self.series_stats = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get('version') == VERSION:
+                for key, stats in data['series'].iteritems():
+                    test, platform = key.split('|', 1)
+                    self.series_stats[(test, platform)] = SeriesStats.from_json(stats)
+            self.expire()
+
+    def series(self, test, platform):
+        key = (test, platform)
+        if key not in self.series_stats:
+            self.series_stats[key] = SeriesStats()
+        return self.series_stats[key]
+
+    def expire(self):
+        """drops the days older than the maximum age from every series"""
+        if self.oldest is None:
+            return
+        for stats in self.series_stats.itervalues():
+            stats.expire(self.oldest)
+
+    def save(self):
+        if not self.path:
+            return
+        self.expire()
+        data = {'version': VERSION,
+                'series': dict(('%s|%s' % key, stats.to_json()) for key, stats in self.series_stats.iteritems())}
+        # write aside and rename, so that an interrupted report keeps the last state
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        try:
+            os.rename(temp, self.path)
+        except OSError:
+            # windows doesn't rename over files
+            os.remove(self.path)
+            os.rename(temp, self.path)
@@ -1,13 +1,13 @@
-from datetime import datetime
 import sys, os
 import csv
-import numpy
-import collections
 import argparse
 from calendar import day_name
 
 sys.path.insert(1, os.path.join(sys.path[0], '..'))
 import compare
+import graphfetch
+import resultstore
+import rollingstats
 
 def get_branch(platform):
     if platform == 'Android' or platform.startswith('OSX'):
@@ -27,42 +27,43 @@ def get_tuple(test, platform):
     return [(compare.test_map[test]['id'], get_branch(platform), compare.platform_map[platform], test, platform)]
 
 
-def generate_report(tuple_list, filepath, mode='variance'):
+def generate_report(tuple_list, filepath, mode='variance', store=None, stats=None):
+    """
+    writes the weekday report of the series of |tuple_list| to |filepath|;
+    |stats| is the RollingStats to add the new runs of each series to
+    """
     avg = []
+    if stats is None:
+        stats = rollingstats.RollingStats()
+
+    # fetch all the graph server data at once
+    compare.fetcher.fetch_all(test[:3] for test in tuple_list
+                              if store is None or store.is_stale(test[3], compare.branchName(test[1]), test[4], compare.SYNC_AGE))
 
     for test in tuple_list:
         testid, branchid, platformid = test[:3]
-        data_dict = compare.getGraphData(testid, branchid, platformid)
+        data_dict = compare.getGraphData(testid, branchid, platformid, store=store,
+                                         series=(test[3], compare.branchName(branchid), test[4]))
         week_avgs = []
 
+        series = stats.series(test[3], test[4])
         if data_dict:
-            data = data_dict['test_runs']
-            data.sort(key=lambda x: x[3])
-            data = data[int(0.1*len(data)):int(0.9*len(data) + 1)]
-            time_dict = collections.OrderedDict()
-            days = {}
-
-            for point in data:
-                time = datetime.fromtimestamp(point[2]).strftime('%Y-%m-%d')
-                time_dict[time] = time_dict.get(time, []) + [point[3]]
-
-            for time in time_dict:
-                runs = len(time_dict[time])
-                weekday = datetime.strptime(time, '%Y-%m-%d').strftime('%A')
-                variance = numpy.var(time_dict[time])
-                if mode == 'variance':
-                    days[weekday] = days.get(weekday, []) + [variance]
-                elif mode == 'count':
-                    days[weekday] = days.get(weekday, []) + [runs]
+            series.add_runs(data_dict['test_runs'])
+            if stats.oldest is not None:
+                series.expire(stats.oldest)
+
+        if series.days:
+            # the values are trimmed to the 10-90 percentiles of the series
+            days = series.weekdays(mode)
 
             line = ["-".join(test[3:])]
-            for day in day_name:
+            for day in range(7):
+                values = days[day]
                 if mode == 'variance':
                     # removing top and bottom 10% to reduce outlier influence
-                    tenth = len(days[day])/10
-                    average = numpy.average(sorted(days[day])[tenth:tenth*9 + 1])
-                elif mode == 'count':
-                    average = numpy.average(days[day])
+                    tenth = len(values)/10
+                    values = sorted(values)[tenth:tenth*9 + 1]
+                average = sum(values) / len(values) if values else float('nan')
                 line.append("%.3f" % average)
                 week_avgs.append(average)
 
@@ -73,6 +74,8 @@ def generate_report(tuple_list, filepath, mode='variance'):
 
             avg.append(line)
 
+    stats.save()
+
     with open(filepath, 'wb') as report:
         avgs_header = csv.writer(report, quoting=csv.QUOTE_ALL)
         avgs_header.writerow(['test-platform'] + list(day_name))
@@ -109,6 +112,12 @@ def main():
     parser.add_argument("--test", help="show only the test named TEST")
     parser.add_argument("--platform", help="show only the platform named PLATFORM")
     parser.add_argument("--mode", help="select mode", default='variance')
+    parser.add_argument("--store", help="SQLite database of results history to report on, fetching from the graph server what is missing or old")
+    parser.add_argument("--jobs", type=int, default=graphfetch.JOBS, help="number of graph server requests to run at once")
+    parser.add_argument("--cache-dir", help="directory to keep graph server responses in for an hour")
+    parser.add_argument("--state", help="JSON file to keep the statistics of the series in between reports, so that only new runs are added")
+    parser.add_argument("--max-age", type=int, default=rollingstats.MAX_AGE,
+                        help="number of days of runs kept in --state, default %d" % rollingstats.MAX_AGE)
     args = parser.parse_args()
     tuple_list = get_all_test_tuples()
     f = 'report'
@@ -121,7 +130,16 @@ def main():
         f += '-%s' % args.test
 
     f += '-%s' % args.mode
-    generate_report(tuple_list, filepath=f + '.csv', mode = args.mode)
+    compare.fetcher = graphfetch.GraphFetcher(compare.SERVER, compare.selector, jobs=args.jobs,
+                                              cache_dir=args.cache_dir, debug=compare.debug)
+    store = resultstore.ResultsStore(args.store) if args.store else None
+    try:
+        generate_report(tuple_list, filepath=f + '.csv', mode = args.mode, store = store,
+                        stats = rollingstats.RollingStats(args.state, max_age=args.max_age))
+    finally:
+        if store is not None:
+            store.close()
+        compare.fetcher.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,161 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+evicts the browser's files from the Linux page cache before a cold startup,
+and verifies with mincore(2) that they are gone:
+ - posix_fadvise(POSIX_FADV_DONTNEED) drops the cached pages of each file
+   under the install directory and the profile;
+ - if some of them are still resident and talos may write to
+   /proc/sys/vm/drop_caches, the whole page cache is dropped.
+"""
+
+import ctypes
+import ctypes.util
+import mmap
+import os
+import platform
+import time
+
+DROP_CACHES = '/proc/sys/vm/drop_caches'
+POSIX_FADV_DONTNEED = 4
+PAGE_SIZE = mmap.PAGESIZE
+
+# the low bit of each byte mincore fills in tells if the page is resident
+RESIDENT_BITS = ''.join(chr(byte & 1) for byte in range(256))
+
+_libc = None
+
+def supported():
+    return platform.system() == 'Linux'
+
+def libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        _libc.mmap64.restype = ctypes.c_void_p
+        _libc.mmap64.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int,
+                                 ctypes.c_int, ctypes.c_int, ctypes.c_int64]
+        _libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+        _libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.POINTER(ctypes.c_ubyte)]
+        _libc.posix_fadvise64.argtypes = [ctypes.c_int, ctypes.c_int64, ctypes.c_int64, ctypes.c_int]
+    return _libc
+
+def os_error(filename):
+    errno = ctypes.get_errno()
+    return OSError(errno, os.strerror(errno), filename)
+
+def files(paths):
+    """the regular files at or under |paths|, not following symbolic links"""
+    for path in paths:
+        if os.path.isfile(path) and not os.path.islink(path):
+            yield path
+        for dirpath, dirnames, filenames in os.walk(path):
+            for filename in filenames:
+                filename = os.path.join(dirpath, filename)
+                if os.path.isfile(filename) and not os.path.islink(filename):
+                    yield filename
+
+def resident_bytes(filename):
+    """how much of |filename| is in the page cache"""
+    size = os.path.getsize(filename)
+    if not size:
+        return 0
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+        address = libc().mmap64(None, size, mmap.PROT_READ, mmap.MAP_SHARED, fd, 0)
+        if address in (None, ctypes.c_void_p(-1).value):
+            raise os_error(filename)
+        try:
+            pages = (ctypes.c_ubyte * ((size + PAGE_SIZE - 1) // PAGE_SIZE))()
+            if libc().mincore(address, size, pages):
+                raise os_error(filename)
+        finally:
+            libc().munmap(address, size)
+    finally:
+        os.close(fd)
+    resident = str(bytearray(pages)).translate(RESIDENT_BITS).count('\x01')
+    return min(resident * PAGE_SIZE, size)
+
+def fadvise_dontneed(filename):
+    """asks the kernel to drop the cached pages of |filename|"""
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+        # only clean pages are dropped
+        os.fsync(fd)
+        error = libc().posix_fadvise64(fd, 0, 0, POSIX_FADV_DONTNEED)
+        if error:
+            raise OSError(error, os.strerror(error), filename)
+    finally:
+        os.close(fd)
+
+def can_drop_caches():
+    return os.access(DROP_CACHES, os.W_OK)
+
+def drop_caches():
+    """drops the whole page cache, which needs root"""
+    libc().sync()
+    with open(DROP_CACHES, 'w') as f:
+        f.write('1\n')
+
+class Eviction(object):
+    """what evict() did"""
+
+    def __init__(self):
+        self.files = 0
+        self.size = 0 # bytes of the files
+        self.resident_before = 0 # bytes in the page cache before
+        self.resident_after = 0 # and after
+        self.seconds = 0.
+        self.dropped_caches = False
+
+    @property
+    def evicted(self):
+        return self.resident_before - self.resident_after
+
+    def counters(self):
+        """the talos counters of the eviction"""
+        return {'cold_evicted_bytes': self.evicted,
+                'cold_resident_bytes': self.resident_after,
+                'cold_evict_time': int(round(self.seconds * 1000))}
+
+def residency(filenames):
+    """the total bytes of |filenames| that are in the page cache"""
+    total = 0
+    for filename in filenames:
+        try:
+            total += resident_bytes(filename)
+        except (IOError, OSError):
+            # gone, or not readable
+            pass
+    return total
+
+def evict(paths, allow_drop_caches=True):
+    """
+    evicts the files at or under |paths| from the page cache, dropping the
+    whole page cache if some remain and |allow_drop_caches| and talos has
+    the rights to; returns an Eviction
+    """
+    eviction = Eviction()
+    filenames = list(files(paths))
+    eviction.files = len(filenames)
+    eviction.resident_before = residency(filenames)
+
+    start = time.time()
+    for filename in filenames:
+        try:
+            eviction.size += os.path.getsize(filename)
+            fadvise_dontneed(filename)
+        except (IOError, OSError):
+            pass
+    eviction.seconds = time.time() - start
+    eviction.resident_after = residency(filenames)
+
+    if eviction.resident_after and allow_drop_caches and can_drop_caches():
+        start = time.time()
+        drop_caches()
+        eviction.seconds += time.time() - start
+        eviction.dropped_caches = True
+        eviction.resident_after = residency(filenames)
+    return eviction
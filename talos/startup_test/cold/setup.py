@@ -1,4 +1,26 @@
-from cache_flusher import cache_flusher
+import os
+import pagecache
 
-cache_flusher.flush()
+def talos_setup(config, args):
+    """
+    talos setup hook: evicts the browser's files from the page cache on
+    Linux, and returns how much was evicted and how long it took, or flushes
+    the file system caches elsewhere; pass --no-drop-caches to never drop
+    the whole page cache on Linux
+    """
+    if pagecache.supported():
+        paths = [os.path.dirname(config['browser_path'])]
+        if config.get('profile_dir'):
+            paths.append(config['profile_dir'])
+        eviction = pagecache.evict(paths, allow_drop_caches='--no-drop-caches' not in args)
+        print "evicted %d of %d bytes in %d files from the page cache in %.3fs%s" % (
+            eviction.evicted, eviction.size, eviction.files, eviction.seconds,
+            ", dropping the whole page cache" if eviction.dropped_caches else "")
+        return eviction.counters()
 
+    from cache_flusher import cache_flusher
+    cache_flusher.flush()
+
+if __name__ == '__main__':
+    from cache_flusher import cache_flusher
+    cache_flusher.flush()
@@ -1,7 +1,9 @@
 import os
+from collections import OrderedDict
 from utils import writeConfigFile
 
-def generateTalosConfig(command_line, browser_config, test_config, pid=None):
+def talosConfig(command_line, browser_config, test_config, pid=None):
+    """the configuration for bcontroller and the setup and cleanup hooks"""
     bcontroller_vars = ['command', 'child_process', 'process', 'browser_wait', 'test_timeout', 'browser_log', 'browser_path', 'error_filename']
 
     if 'xperf_path' in browser_config:
@@ -15,6 +17,9 @@ def generateTalosConfig(command_line, browser_config, test_config, pid=None):
         bcontroller_vars.extend(['host', 'port', 'deviceroot', 'env'])
 
     browser_config['command'] = ' '.join(command_line)
+    if '-profile' in command_line[:-1]:
+        browser_config['profile_dir'] = command_line[command_line.index('-profile') + 1]
+        bcontroller_vars.append('profile_dir')
 
     if (('xperf_providers' in test_config) and
         ('xperf_user_providers' in test_config) and
@@ -27,7 +32,11 @@ def generateTalosConfig(command_line, browser_config, test_config, pid=None):
         browser_config['approot'] = os.path.dirname(browser_config['browser_path'])
         bcontroller_vars.extend(['xperf_providers', 'xperf_user_providers', 'xperf_stackwalk', 'processID', 'approot'])
 
-    content = writeConfigFile(browser_config, bcontroller_vars)
+    return OrderedDict((var, browser_config[var]) for var in bcontroller_vars)
+
+def generateTalosConfig(command_line, browser_config, test_config, pid=None):
+    config = talosConfig(command_line, browser_config, test_config, pid=pid)
+    content = writeConfigFile(config, config.keys())
 
     with open(browser_config['bcontroller_config'], "w") as fhandle:
         fhandle.write(content)
@@ -9,6 +9,7 @@ class Test(object):
     desktop = True
     mobile = True
     fennecIDs = False
+    lower_is_better = True # False for scores, like runs/s
 
     @classmethod
     def name(cls):
@@ -76,6 +77,7 @@ class TsBase(Test):
         'sps_profile_interval',
         'sps_profile_entries',
         'sps_profile_startup',
+        'sps_profile_compression_level',
         'preferences',
         'xperf_counters',
         'xperf_providers',
@@ -128,7 +130,9 @@ class ts_paint(ts):
 
 class ts_paint_cold(ts_paint):
     """
-    Clears the disk cache before running the ts_paint tests.
+    Clears the disk cache before running the ts_paint tests. On Linux, only
+    the browser's files are evicted from the page cache, and the bytes
+    evicted and the time it took are recorded as counters.
     """
     setup = "${talos}/startup_test/cold/setup.py"
     mobile = False
@@ -265,8 +269,8 @@ class PageloaderTest(Test):
     timeout = None
     filters = None
     keys = ['tpmanifest', 'tpcycles', 'tppagecycles', 'tprender', 'tpchrome', 'tpmozafterpaint', 'tploadnocache',
-            'rss', 'mainthread', 'resolution', 'cycles', 'sps_profile', 'sps_profile_interval', 'sps_profile_entries',
-            'tptimeout', 'win_counters', 'w7_counters', 'linux_counters', 'mac_counters', 'tpscrolltest',
+            'rss', 'mainthread', 'mainthread_tail', 'resolution', 'cycles', 'sps_profile', 'sps_profile_interval', 'sps_profile_entries',
+            'sps_profile_compression_level', 'tptimeout', 'win_counters', 'w7_counters', 'linux_counters', 'mac_counters', 'tpscrolltest',
             'remote_counters', 'xperf_counters', 'timeout', 'shutdown', 'responsiveness', 'profile_path',
             'xperf_providers', 'xperf_user_providers', 'xperf_stackwalk', 'filters', 'preferences',
             'extensions', 'setup', 'cleanup','fennecIDs', 'test_name_extension'
@@ -504,6 +508,7 @@ class v8_7(PageloaderTest):
     resolution = 20
     tpmozafterpaint = False
     preferences = {'dom.send_after_paint_to_content': False}
+    lower_is_better = False
 
 class kraken(PageloaderTest):
     """
@@ -534,6 +539,7 @@ class tcanvasmark(PageloaderTest):
     tpmozafterpaint = False
     preferences = {'dom.send_after_paint_to_content': False}
     filters = [["ignore_first", [1]], ['median', []]]
+    lower_is_better = False
 
 class tscroll(PageloaderTest):
     """
@@ -545,6 +551,7 @@ class tscroll(PageloaderTest):
 class dromaeo(PageloaderTest):
     """abstract base class for dramaeo tests"""
     filters = [['dromaeo', []]]
+    lower_is_better = False
 
 class dromaeo_css(dromaeo):
     """
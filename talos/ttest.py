@@ -14,6 +14,8 @@
 
 import os
 import platform
+import hooks
+import mainthreadio
 import results
 import traceback
 import subprocess
@@ -25,10 +27,9 @@ import mozcrash
 import mozdevice
 import talosconfig
 import shutil
-import zipfile
-import json
 from profiler import symbolication
 from profiler import sps
+from profiler.profileArchive import ProfileArchive
 import mozfile
 from threading import Thread
 
@@ -299,9 +300,9 @@ class TTest(object):
 
             # add the mainthread_io to the environment variable, as defined in test.py configs
             here = os.path.dirname(os.path.realpath(__file__))
+            mainthread_io_log = os.path.join(here, "mainthread_io.log")
             if test_config['mainthread']:
-                mainthread_io = os.path.join(here, "mainthread_io.log")
-                utils.setEnvironmentVars({'MOZ_MAIN_THREAD_IO_LOG': mainthread_io})
+                utils.setEnvironmentVars({'MOZ_MAIN_THREAD_IO_LOG': mainthread_io_log})
 
             preferences = copy.deepcopy(browser_config['preferences'])
             if 'preferences' in test_config and test_config['preferences']:
@@ -327,6 +328,7 @@ class TTest(object):
             sps_profile = upload_dir and test_config.get('sps_profile', False) and not browser_config['remote']
             sps_profile_dir = None
             profile_arcname = None
+            profile_archive = None
             profiling_info = None
 
             additional_env_vars = {}
@@ -350,6 +352,10 @@ class TTest(object):
                     os.remove(profile_arcname)
                 except OSError:
                     pass
+                # One archive for all cycles; profiles are compressed in the
+                # background while the next cycle runs.
+                profile_archive = ProfileArchive(profile_arcname,
+                                                 test_config.get('sps_profile_compression_level', -1))
 
                 symbol_paths = {
                     'FIREFOX': tempfile.mkdtemp(),
@@ -398,6 +404,13 @@ class TTest(object):
             # instantiate an object to hold test results
             test_results = results.TestResults(test_config, global_counters, extensions=self._ffsetup.extensions)
 
+            if test_config['mainthread']:
+                mtio_whitelist = mainthreadio.load_whitelist(os.path.dirname(browser_config['browser_path']))
+
+            # scripts with hooks are imported once, and run in process every cycle
+            setup_hook = hooks.Hook('setup', test_config['setup']) if test_config['setup'] else None
+            cleanup_hook = hooks.Hook('cleanup', test_config['cleanup']) if test_config['cleanup'] else None
+
             for i in range(test_config['cycles']):
 
                 # remove the browser log file
@@ -438,8 +451,13 @@ class TTest(object):
 
                 self.counter_results = None
                 mainthread_error_count = 0
+                mainthread_io = None
                 if not browser_config['remote']:
-                    if test_config['setup']:
+                    if setup_hook and setup_hook.in_process:
+                        counters = setup_hook(talosconfig.talosConfig(command_args, browser_config, test_config))
+                        for name, value in counters.items():
+                            global_counters.setdefault(name, []).append(value)
+                    elif setup_hook:
                         # Generate bcontroller.yml for xperf
                         talosconfig.generateTalosConfig(command_args, browser_config, test_config)
                         setup = subprocess.Popen(['python'] + test_config['setup'].split(), env=os.environ.copy(), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
@@ -458,6 +476,11 @@ class TTest(object):
                         from startup_test.media import media_manager
                         mm_httpd = media_manager.run_server(os.path.dirname(os.path.realpath(__file__)))
 
+                    if test_config['mainthread']:
+                        mtio_analyzer = mainthreadio.Analyzer(mtio_whitelist)
+                        if test_config.get('mainthread_tail'):
+                            mtio_analyzer.start_tailing(mainthread_io_log)
+
                     browser = TalosProcess.TalosProcess(command_args,
                                                         env=dict(os.environ.items() + additional_env_vars.items()),
                                                         logfile=browser_config['browser_log'],
@@ -484,24 +507,20 @@ class TTest(object):
                         mm_httpd.stop()
 
                     if test_config['mainthread']:
-                        rawlog = os.path.join(here, "mainthread_io.log")
-                        if os.path.exists(rawlog):
-                            processedlog = os.path.join(here, 'mainthread_io.json')
-                            xre_path = os.path.dirname(browser_config['browser_path'])
-                            mtio_py = os.path.join(here, 'mainthreadio.py')
-                            command = ['python', mtio_py, rawlog, processedlog, xre_path]
-                            mtio = subprocess.Popen(command, env=os.environ.copy(), stdout=subprocess.PIPE)
-                            output, stderr = mtio.communicate()
-                            for line in output.split('\n'):
-                                if line.strip() == "":
-                                    continue
-
-                                print line
+                        if os.path.exists(mainthread_io_log):
+                            for error in mtio_analyzer.analyze(mainthread_io_log):
+                                print error
                                 mainthread_error_count += 1
-                            os.remove(rawlog)
-
-                    if test_config['cleanup']:
-                        #HACK: add the pid to support xperf where we require the pid in post processing
+                            mainthread_io = mtio_analyzer.data
+                            os.remove(mainthread_io_log)
+                        mtio_analyzer.stop_tailing()
+
+                    #HACK: add the pid to support xperf where we require the pid in post processing
+                    if cleanup_hook and cleanup_hook.in_process:
+                        counters = cleanup_hook(talosconfig.talosConfig(command_args, browser_config, test_config, pid=pid))
+                        for name, value in counters.items():
+                            global_counters.setdefault(name, []).append(value)
+                    elif cleanup_hook:
                         talosconfig.generateTalosConfig(command_args, browser_config, test_config, pid=pid)
                         cleanup = TalosProcess.TalosProcess(['python'] + test_config['cleanup'].split(), env=os.environ.copy())
                         cleanup.run()
@@ -538,7 +557,8 @@ class TTest(object):
 
                 # add the results from the browser output
                 try:
-                    test_results.add(browser_log_filename, counter_results=self.counter_results)
+                    test_results.add(browser_log_filename, counter_results=self.counter_results,
+                                     mainthread_io=mainthread_io)
                 except Exception as e:
                     # Log the exception, but continue. One way to get here is if the browser hangs,
                     # and we'd still like to get symbolicated profiles in that case.
@@ -550,6 +570,12 @@ class TTest(object):
                         "enableTracing": 0,
                         # Fallback server if symbol is not found locally
                         "remoteSymbolServer": "http://symbolapi.mozilla.org:80/",
+                        # Persistent cache of symbols returned by the fallback server
+                        "remoteSymbolCache": os.path.join(tempfile.gettempdir(), "talos-symbol-cache"),
+                        # Timeout of each request to the fallback server (in seconds)
+                        "remoteSymbolTimeout": 30,
+                        # Maximum time spent on the fallback server per symbolication (in seconds)
+                        "remoteSymbolDeadline": 120,
                         # Maximum number of symbol files to keep in memory
                         "maxCacheEntries": 2000000,
                         # Frequency of checking for recent symbols to cache (in hours)
@@ -575,46 +601,45 @@ class TTest(object):
 
                     missing_symbols_zip = os.path.join(upload_dir, "missingsymbols.zip")
 
-                    try:
-                        mode = zipfile.ZIP_DEFLATED
-                    except:
-                        mode = zipfile.ZIP_STORED
-                    with zipfile.ZipFile(profile_arcname, 'a', mode) as arc:
-                        # Collect all individual profiles that the test has put into sps_profile_dir.
-                        for profile_filename in os.listdir(sps_profile_dir):
-                            testname = profile_filename
-                            if testname.endswith(".sps"):
-                                testname = testname[0:-4]
-                            profile_path = os.path.join(sps_profile_dir, profile_filename)
-                            try:
-                                profile_file = open(profile_path, 'r')
-                                profile = json.load(profile_file)
-                                profile_file.close()
-                                symbolicator.dump_and_integrate_missing_symbols(profile, missing_symbols_zip)
-                                symbolicator.symbolicate_profile(profile)
-                                sps.compress_profile(profile)
-                                sps.save_profile(profile, profile_path)
-                                profile = None # Free up memory
-                            except MemoryError as e:
-                                utils.info("Ran out of memory while trying to symbolicate profile {0} (cycle {1})".format(profile_path, i))
-                            except Exception as e:
-                                utils.info(e)
-                                utils.info("Encountered an exception during profile symbolication {0} (cycle {1})".format(profile_path, i))
-                            profile = None # Free up memory
-
-                            # Our zip will contain one directory per subtest, and each subtest
-                            # directory will contain one or more cycle_i.sps files.
-                            # For example, with test_config['name'] == 'tscrollx',
-                            #  profile_filename == 'iframe.svg.sps', i == 0, we'll get
-                            #  path_in_zip == 'profile_tscrollx/iframe.svg/cycle_0.sps'.
-                            cycle_name = "cycle_{0}.sps".format(i)
-                            path_in_zip = os.path.join("profile_{0}".format(test_config['name']), testname, cycle_name)
-                            utils.info("Adding profile {0} to archive {1}".format(path_in_zip, profile_arcname))
-                            try:
-                                arc.write(profile_path, path_in_zip)
-                            except Exception as e:
-                                utils.info(e)
-                                utils.info("Failed to copy profile {0} as {1} to archive {2}".format(profile_path, path_in_zip, profile_arcname))
+                    # Collect all individual profiles that the test has put into sps_profile_dir.
+                    for profile_filename in os.listdir(sps_profile_dir):
+                        testname = profile_filename
+                        if testname.endswith(".sps"):
+                            testname = testname[0:-4]
+                        profile_path = os.path.join(sps_profile_dir, profile_filename)
+                        compressed_path = profile_path + ".compressed"
+                        try:
+                            # Stream the profile from disk so that memory use
+                            # doesn't grow with the number of samples.
+                            libs = sps.read_libs(profile_path)
+                            if libs is not None:
+                                symbolicator.dump_and_integrate_missing_symbols({"libs": libs}, missing_symbols_zip)
+                            sps.symbolicate_and_compress_file(profile_path, compressed_path, symbolicator, libs)
+                            os.remove(profile_path)
+                            os.rename(compressed_path, profile_path)
+                        except MemoryError as e:
+                            utils.info("Ran out of memory while trying to symbolicate profile {0} (cycle {1})".format(profile_path, i))
+                        except Exception as e:
+                            utils.info(e)
+                            utils.info("Encountered an exception during profile symbolication {0} (cycle {1})".format(profile_path, i))
+                        if os.path.exists(compressed_path):
+                            os.remove(compressed_path)
+
+                        # Our zip will contain one directory per subtest, and each subtest
+                        # directory will contain one or more cycle_i.sps files.
+                        # For example, with test_config['name'] == 'tscrollx',
+                        #  profile_filename == 'iframe.svg.sps', i == 0, we'll get
+                        #  path_in_zip == 'profile_tscrollx/iframe.svg/cycle_0.sps'.
+                        cycle_name = "cycle_{0}.sps".format(i)
+                        path_in_zip = os.path.join("profile_{0}".format(test_config['name']), testname, cycle_name)
+                        utils.info("Adding profile {0} to archive {1}".format(path_in_zip, profile_arcname))
+                        try:
+                            # The archive takes the profile over and compresses it in the background.
+                            profile_archive.add(profile_path, path_in_zip)
+                        except Exception as e:
+                            utils.info(e)
+                            utils.info("Failed to copy profile {0} as {1} to archive {2}".format(profile_path, path_in_zip, profile_arcname))
+                    symbolicator.close()
 
                 #clean up any stray browser processes
                 self.cleanupAndCheckForCrashes(browser_config, profile_dir, test_config['name'])
@@ -624,6 +649,7 @@ class TTest(object):
             self.cleanupProfile(temp_dir)
             utils.restoreEnvironmentVars()
             if sps_profile:
+                profile_archive.close()
                 # For some reason, on Windows, big profiles are sometimes locked
                 # by another process even after all Firefox processes have been
                 # terminated. Allow up to 10 minutes for the file lock to be
@@ -640,5 +666,11 @@ class TTest(object):
 
         except Exception, e:
             self.counters = vars().get('cm', self.counters)
+            profile_archive = vars().get('profile_archive')
+            if profile_archive:
+                profile_archive.close()
+            mtio_analyzer = vars().get('mtio_analyzer')
+            if mtio_analyzer:
+                mtio_analyzer.stop_tailing()
             self.testCleanup(browser_config, profile_dir, test_config, self.counters, temp_dir)
             raise
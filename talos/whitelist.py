@@ -7,13 +7,11 @@
 import json
 import os
 import utils
+from xtalos import pathmatch
 
 KEY_XRE = '{xre}'
 
 class Whitelist:
-    # we need to find the root dir of the profile at runtime
-    PRE_PROFILE = ''
-
     def __init__(self, test_name, paths, path_substitutions, name_substitutions, init_with=None):
         self.test_name = test_name
         self.listmap = init_with if init_with else {}
@@ -21,6 +19,9 @@ class Whitelist:
         self.paths = paths
         self.path_substitutions = path_substitutions
         self.name_substitutions = name_substitutions
+        # take care of 'program files (x86)' matching 'program files'
+        self.normalizer = pathmatch.PathNormalizer(path_substitutions, name_substitutions,
+                                                   removals=[' (x86)'], strip='/\\\ \t')
 
     def load(self, filename):
         if not self.load_dependent_libs():
@@ -38,45 +39,52 @@ class Whitelist:
             return False
         return True
 
+    def build_baseline(self, data, filename_index):
+        """a whitelist ignoring every file accessed in |data|"""
+        return dict((self.sanitize_filename(row[filename_index]), {'ignore': True}) for row in data)
+
     def save_baseline(self, data, filename_index, output_filename):
-        self.listmap = {}
-        for tuple in data:
-            self.listmap[self.sanitize_filename(tuple[filename_index])] = {'ignore': True}
+        baseline = self.build_baseline(data, filename_index)
         with open(output_filename, 'w') as f:
-            json.dump(self.listmap, f, sort_keys=True, indent=4, separators=(',', ': '))
+            json.dump(baseline, f, sort_keys=True, indent=4, separators=(',', ': '))
         print "Dependent libs: %r" % self.dependent_libs
 
     def sanitize_filename(self, filename):
-        filename = filename.lower()
-        filename.replace(' (x86)', '')
-
-        for path, subst in self.path_substitutions.iteritems():
-            parts = filename.split(path)
-            if len(parts) >= 2:
-                if self.PRE_PROFILE == '' and subst == '{profile}':
-                    fname = self.sanitize_filename(parts[0])
-                    self.listmap[fname] = {}
-                    # Windows can have {appdata}\local\temp\longnamedfolder or {appdata}\local\temp\longna~1
-                    self.listmap[fname] = {}
-                    if not fname.endswith('~1'):
-                        # parse the longname into longna~1
-                        dirs = fname.split('\\')
-                        dirs[-1] = "%s~1" % (dirs[-1][:6])
-                        # now we want to ensure that every parent dir is added since we seem to be accessing them sometimes
-                        diter = 2
-                        while (diter < len(dirs)):
-                            self.listmap['\\'.join(dirs[:diter])] = {}
-                            diter = diter + 1
-                        self.PRE_PROFILE = fname
-
-                filename = "%s%s" % (subst, path.join(parts[1:]))
-
-        for old_name, new_name in self.name_substitutions.iteritems():
-            parts = filename.split(old_name)
-            if len(parts) >= 2:
-                filename = "%s%s" % (parts[0], new_name)
-
-        return filename.strip('/\\\ \t')
+        return self.normalizer.normalize(filename)
+
+    def profile_dirs(self, filenames):
+        """
+        The directories above the profile, which get accessed too. The profile
+        is in a temporary directory that is only known at runtime: this is the
+        most common one that the files in |filenames| are in.
+        """
+        profile_paths = [path for path, subst in self.path_substitutions.iteritems() if subst == '{profile}']
+        counts = {}
+        for filename in filenames:
+            filename = filename.lower()
+            for path in profile_paths:
+                if path in filename:
+                    parent = filename.split(path)[0]
+                    counts[parent] = counts.get(parent, 0) + 1
+                    break
+        if not counts:
+            return {}
+        parent = min(counts, key=lambda parent: (-counts[parent], parent))
+
+        fname = self.sanitize_filename(parent)
+        dirs = {fname: {}}
+        # Windows can have {appdata}\local\temp\longnamedfolder or {appdata}\local\temp\longna~1
+        if not fname.endswith('~1'):
+            # parse the longname into longna~1
+            parts = fname.split('\\')
+            parts[-1] = "%s~1" % (parts[-1][:6])
+            # now we want to ensure that every parent dir is added since we seem to be accessing them sometimes
+            for index in range(2, len(parts)):
+                dirs['\\'.join(parts[:index])] = {}
+        return dirs
+
+    def allow_profile_dirs(self, data, file_name_index):
+        self.listmap.update(self.profile_dirs(row_key[file_name_index] for row_key in data))
 
     def check(self, test, file_name_index):
         errors = {}
@@ -129,9 +137,12 @@ class Whitelist:
                 error_strs.append("File '%s' was accessed and we were not expecting it: %r" % (filename, datum))
         return error_strs
 
+    def format_errors(self, error_strs):
+        return ["TEST-UNEXPECTED-FAIL | %s | %s" % (self.test_name, error_msg) for error_msg in error_strs]
+
     def print_errors(self, error_strs):
-        for error_msg in error_strs:
-            print "TEST-UNEXPECTED-FAIL | %s | %s" % (self.test_name, error_msg)
+        for error_msg in self.format_errors(error_strs):
+            print error_msg
 
     # Note that we don't store dependent libs in listmap. This makes
     # save_baseline cleaner. Since a baseline whitelist should not include
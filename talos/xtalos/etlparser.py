@@ -5,10 +5,12 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import csv
+import multiprocessing
 import re
 import os
 import sys
 import xtalos
+import pathmatch
 import subprocess
 
 try:
@@ -32,102 +34,363 @@ CEVT_XPCOM_SHUTDOWN   = "{26d1e091-0ae7-4f49-a554-4214445c505c}"
 stages = ["startup", "normal", "shutdown"]
 net_events = {"TcpDataTransferReceive": "recv", "UdpEndpointReceiveMessages": "recv",
               "TcpDataTransferSend": "send", "UdpEndpointSendMessages": "send"}
-gThreads = {}
-gConnectionIDs = {}
-gHeaders = {}
-
-
-def filterOutHeader(data):
-    # -1 means we have not yet found the header
-    # 0 means we are in the header
-    # 1+ means that we are past the header
-    state = -1
-    for row in data:
-
-        if not len(row):
-            continue
-
-        if state < 0:
-            # Keep looking for the header (denoted by "BeginHeader").
-            if row[0] == "BeginHeader":
-                state = 0
-            continue
-
-
-        if state == 0:
-            # Eventually, we'll find the end (denoted by "EndHeader").
-            if row[0] == "EndHeader":
-                state = 1
-                continue
+FILE_COUNTERS = ("DiskReadBytes", "DiskReadCount", "DiskWriteBytes", "DiskWriteCount")
+file_events = {"FileIoRead": ("DiskReadCount", "DiskReadBytes", "read"),
+               "FileIoWrite": ("DiskWriteCount", "DiskWriteBytes", "write")}
+# "firefox.exe (1234)" -> ("firefox.exe", "1234")
+PROCESS_RE = re.compile(r"^(.*) \(\s*(\d+)\)$")
+# "firefox.exe!wmainCRTStartup" -> "firefox.exe"
+IMAGE_RE = re.compile(r"([^!]+)!")
+# "Microsoft-Windows-TCPIP/TcpDataTransferSend" -> "TcpDataTransferSend"
+NET_EVENT_RE = re.compile(r"[\w-]+\/([\w-]+)")
+
+# Number of chunks per process when parsing in parallel, so that a slow
+# chunk doesn't leave the other processes idle
+CHUNKS_PER_JOB = 2
+
+# how file names are rewritten before looking them up in xperf_whitelist.json
+WHITELIST_PATH_SUBSTITUTIONS = [('%s\\' % path, '{%s}\\' % path)
+                                for path in ('profile', 'firefox', 'desktop', 'talos')]
+WHITELIST_NAME_SUBSTITUTIONS = [('\\installtime', '\\{time}'),
+                                # this is Prefetch or prefetch, not case sensitive operating system
+                                ('refetch', 'refetch\\{prefetch}.pf')]
+# take care of 'program files (x86)' matching 'program files'
+WHITELIST_REMOVALS = [' (x86)']
+
+
+def getIndex(header, colName):
+    if colName not in header:
+        return None
+    return header.index(colName)
+
+def getHandler(event):
+    """name of the EtlParser method that handles rows of |event|"""
+    if event in ("T-DCStart", "T-Start"):
+        return "trackThreadStart"
+    if event in ("T-DCEnd", "T-End"):
+        return "trackThreadEnd"
+    if event in file_events:
+        return "trackThreadFileIO"
+    if event.endswith("Event/Classic"):
+        return "updateStage"
+    if event.startswith("Microsoft-Windows-TCPIP"):
+        return "trackThreadNetIO"
+    return None
+
+class EventPlan(object):
+    """
+    How rows of one event type are handled: the handler, and the indices of
+    the columns it reads, resolved once from the event's header row.
+    """
 
-            gHeaders[row[EVENTNAME_INDEX]] = row
-            continue
+    __slots__ = ('kind', 'handler', 'fnameIndex', 'sizeIndex', 'imageIndex', 'guidIndex',
+                 'activityIndex', 'numBytesIndex', 'countKey', 'bytesKey', 'counters', 'ioKeys')
+
+    # the column each kind of handler can't do without
+    required = {"trackThreadStart": "imageIndex",
+                "trackThreadFileIO": "sizeIndex",
+                "updateStage": "guidIndex",
+                "trackThreadNetIO": "activityIndex"}
+
+    def __init__(self, header):
+        event = header[EVENTNAME_INDEX]
+        self.fnameIndex = getIndex(header, FNAME_COL)
+        self.sizeIndex = getIndex(header, DISKBYTES_COL)
+        self.imageIndex = getIndex(header, IMAGEFUNC_COL)
+        self.guidIndex = getIndex(header, EVENTGUID_COL)
+        self.activityIndex = getIndex(header, ACTIVITY_ID_COL)
+        self.numBytesIndex = getIndex(header, NUMBYTES_COL)
+
+        # the io counters a row adds to, for each (thread, stage)
+        self.counters = ()
+        self.countKey = self.bytesKey = None
+        if event in file_events:
+            self.countKey, self.bytesKey, opType = file_events[event]
+            self.counters = ("file_%s_ops" % opType, "file_%s_bytes" % opType, "file_io_bytes")
+        else:
+            match = NET_EVENT_RE.match(event)
+            if match and match.group(1) in net_events:
+                self.counters = ("net_%s_bytes" % net_events[match.group(1)], "net_io_bytes")
+        self.ioKeys = {}
+        for thread in ("main", "nonmain"):
+            for stage in range(len(stages)):
+                self.ioKeys[(thread, stage)] = tuple((thread, stages[stage], counter) for counter in self.counters)
+
+        self.kind = getHandler(event)
+        if self.kind in self.required and getattr(self, self.required[self.kind]) is None:
+            self.kind = None
+        # bound by the EtlParser that uses this plan
+        self.handler = None
+
+class InsertionOrderedDict(dict):
+    """a dict that remembers the order in which its keys were added"""
+
+    def __init__(self):
+        dict.__init__(self)
+        self.order = []
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self.order.append(key)
+        dict.__setitem__(self, key, value)
+
+class FileSummary(object):
+    """
+    Aggregates file I/O per (file, thread, stage) into |files|. The "all"
+    entry of a file and thread is the same dict as its entry for the latest
+    stage.
+    """
 
-        if state >= 1:
-            state = state + 1
+    def __init__(self):
+        # The order in which entries are added is kept, so that merged
+        # chunks iterate like a serial parse.
+        self.files = InsertionOrderedDict()
+
+    def fileIO(self, row, plan, thread, stage, bytes):
+        # We only care about events that have a file name.
+        fname_index = plan.fnameIndex
+        if fname_index is None:
+            return
+
+        # Some data rows are missing the filename?
+        if len(row) <= fname_index:
+            return
+
+        thread_name = row[THREAD_ID_INDEX]
+        if thread == "main":
+            thread_name += " (main)"
+        key_tuple = (row[fname_index], thread_name, stages[stage])
+        total_tuple = (row[fname_index], thread_name, "all")
+
+        retVal = self.files
+        if key_tuple not in retVal:
+            retVal[key_tuple] = {"DiskReadBytes": 0, "DiskReadCount": 0, "DiskWriteBytes": 0, "DiskWriteCount": 0}
+            retVal[total_tuple] = retVal[key_tuple]
+
+        key_counts, total_counts = retVal[key_tuple], retVal[total_tuple]
+        key_counts[plan.countKey] += 1
+        total_counts[plan.countKey] += 1
+        key_counts[plan.bytesKey] += bytes
+        total_counts[plan.bytesKey] += bytes
+
+    def merge(self, other):
+        files = self.files
+        for key in other.files.order:
+            counts = other.files[key]
+            if key[2] == "all":
+                if key not in files:
+                    files[key] = None
+            elif key in files:
+                merged = files[key]
+                for counter in FILE_COUNTERS:
+                    merged[counter] += counts[counter]
+            else:
+                files[key] = dict(counts)
+        self._linkTotals()
+
+    def _linkTotals(self):
+        """point each "all" entry at the entry of the latest stage, as fileIO does"""
+        files = self.files
+        for key in files.order:
+            if key[2] == "all":
+                for stage in reversed(stages):
+                    if (key[0], key[1], stage) in files:
+                        files[key] = files[(key[0], key[1], stage)]
+                        break
+
+    def __getstate__(self):
+        # much smaller and quicker to pickle than the dicts
+        state = []
+        for key in self.files.order:
+            if key[2] == "all":
+                state.append((key, None))
+            else:
+                state.append((key, tuple(self.files[key][counter] for counter in FILE_COUNTERS)))
+        return state
 
-        # The line after "EndHeader" is also not useful, so we want to strip that
-        # in addition to the header.
-        if state > 2:
-            yield row
+    def __setstate__(self, state):
+        self.files = InsertionOrderedDict()
+        for key, counts in state:
+            self.files[key] = counts and dict(zip(FILE_COUNTERS, counts))
+        self._linkTotals()
 
-def getIndex(eventType, colName):
-    if colName not in gHeaders[eventType]:
-        return None
-    return gHeaders[eventType].index(colName)
+class ThreadIO(object):
+    """Aggregates file I/O per (thread, stage) into |io|."""
 
-def readFile(filename):
-    print "etlparser: in readfile: %s" % filename
-    data = csv.reader(open(filename, 'rb'), delimiter=',', quotechar='"', skipinitialspace=True)
-    data = filterOutHeader(data)
-    return data
+    def __init__(self):
+        self.io = {}
 
-def fileSummary(row, stage, retVal):
-    event = row[EVENTNAME_INDEX]
+    def fileIO(self, row, plan, thread, stage, bytes):
+        io = self.io
+        opsKey, bytesKey, totalKey = plan.ioKeys[(thread, stage)]
+        io[opsKey] = io.get(opsKey, 0) + 1
+        io[bytesKey] = io.get(bytesKey, 0) + bytes
+        io[totalKey] = io.get(totalKey, 0) + bytes
 
-    # TODO: do we care about the other events?
-    if not event in ("FileIoRead", "FileIoWrite"):
-        return
-    fname_index = getIndex(event, FNAME_COL)
+    def merge(self, other):
+        for key, value in other.io.iteritems():
+            self.io[key] = self.io.get(key, 0) + value
 
-    # We only care about events that have a file name.
-    if fname_index is None:
-        return
+class NetIO(ThreadIO):
+    """Aggregates network I/O per (thread, stage) into |io|."""
 
-    # Some data rows are missing the filename?
-    if len(row) <= fname_index:
-        return
+    def fileIO(self, row, plan, thread, stage, bytes):
+        pass
 
-    thread_extra = ""
-    if gThreads[row[THREAD_ID_INDEX]] == "main":
-        thread_extra = " (main)"
-    key_tuple = (row[fname_index], "%s%s" % (row[THREAD_ID_INDEX], thread_extra), stages[stage])
-    total_tuple = (row[fname_index], "%s%s" % (row[THREAD_ID_INDEX], thread_extra), "all")
-
-    if key_tuple not in retVal:
-        retVal[key_tuple] = {"DiskReadBytes": 0, "DiskReadCount": 0, "DiskWriteBytes": 0, "DiskWriteCount": 0}
-        retVal[total_tuple] = retVal[key_tuple]
-
-    if event == "FileIoRead":
-        retVal[key_tuple]['DiskReadCount'] += 1
-        retVal[total_tuple]['DiskReadCount'] += 1
-        idx = getIndex(event, DISKBYTES_COL)
-        retVal[key_tuple]['DiskReadBytes'] += int(row[idx], 16)
-        retVal[total_tuple]['DiskReadBytes'] += int(row[idx], 16)
-    elif event == "FileIoWrite":
-        retVal[key_tuple]['DiskWriteCount'] += 1
-        retVal[total_tuple]['DiskWriteCount'] += 1
-        idx = getIndex(event, DISKBYTES_COL)
-        retVal[key_tuple]['DiskWriteBytes'] += int(row[idx], 16)
-        retVal[total_tuple]['DiskWriteBytes'] += int(row[idx], 16)
+    def netIO(self, row, plan, thread, stage, bytes):
+        io = self.io
+        bytesKey, totalKey = plan.ioKeys[(thread, stage)]
+        io[bytesKey] = io.get(bytesKey, 0) + bytes
+        io[totalKey] = io.get(totalKey, 0) + bytes
 
-def etl2csv(xperf_path, etl_filename, debug=False):
+class EtlParser(object):
     """
-    Convert etl_filename to etl_filename.csv (temp file) which is the .csv representation of the .etl file
-    Etlparser will read this .csv and parse the information we care about into the final output.
-    This is done to keep things simple and to preserve resources on talos machines (large files == high memory + cpu)
+    Tracks the threads of process |processID| and the startup stage through
+    the rows of an xperf CSV fed to it, and hands their file and network I/O
+    to |aggregators|. An aggregator has a fileIO and/or a netIO method,
+    called as (row, plan, thread, stage, bytes), and a merge method that adds
+    up the results of another aggregator of its type fed with later rows.
+
+    A parser can start in the middle of a CSV from the |headers| and the
+    |state| of a parser that read the rows before.
     """
 
+    # the parser is looking for the header, in the header, on the line after
+    # the header, and in the data
+    BEFORE_HEADER, IN_HEADER, AFTER_HEADER, IN_DATA = range(4)
+
+    def __init__(self, processID, aggregators=(), headers=None, state=None):
+        self.processID = str(processID)
+        self.aggregators = list(aggregators)
+        self.fileIOHandlers = [a.fileIO for a in self.aggregators if hasattr(a, 'fileIO')]
+        self.netIOHandlers = [a.netIO for a in self.aggregators if hasattr(a, 'netIO')]
+        self.threads = {}
+        self.connectionIDs = {}
+        self.stage = 0
+        self.headers = {}
+        # EventPlan of each event type we handle, keyed by event name
+        self.plans = {}
+        self.position = self.BEFORE_HEADER
+        if headers is not None:
+            for header in headers:
+                self.addHeader(header)
+            self.position = self.IN_DATA
+        if state is not None:
+            self.setState(state)
+
+    def getState(self):
+        """the threads, connections and stage, to start another parser from"""
+        return (dict(self.threads), dict(self.connectionIDs), self.stage)
+
+    def setState(self, state):
+        threads, connectionIDs, self.stage = state
+        self.threads = dict(threads)
+        self.connectionIDs = dict(connectionIDs)
+
+    def addHeader(self, row):
+        event = row[EVENTNAME_INDEX]
+        self.headers[event] = row
+        plan = EventPlan(row)
+        if plan.kind:
+            plan.handler = getattr(self, plan.kind)
+            self.plans[event] = plan
+
+    def feed(self, row):
+        """handle one row of an xperf CSV"""
+        if not row:
+            return
+        if self.position == self.IN_DATA:
+            plan = self.plans.get(row[EVENTNAME_INDEX])
+            if plan is not None:
+                plan.handler(row, plan)
+        elif self.position == self.BEFORE_HEADER:
+            # Keep looking for the header (denoted by "BeginHeader").
+            if row[0] == "BeginHeader":
+                self.position = self.IN_HEADER
+        elif self.position == self.IN_HEADER:
+            # Eventually, we'll find the end (denoted by "EndHeader").
+            if row[0] == "EndHeader":
+                self.position = self.AFTER_HEADER
+            else:
+                self.addHeader(row)
+        else:
+            # The line after "EndHeader" is also not useful
+            self.position = self.IN_DATA
+
+    def parse(self, rows):
+        feed = self.feed
+        for row in rows:
+            feed(row)
+        return self
+
+    def trackThreadStart(self, row, plan):
+        procName, procID = PROCESS_RE.match(row[PROCESS_INDEX]).group(1, 2)
+        if procID == self.processID:
+            img = IMAGE_RE.match(row[plan.imageIndex]).group(1)
+            if img == procName:
+                self.threads[row[THREAD_ID_INDEX]] = "main"
+            else:
+                self.threads[row[THREAD_ID_INDEX]] = "nonmain"
+
+    def trackThreadEnd(self, row, plan):
+        self.threads.pop(row[THREAD_ID_INDEX], None)
+
+    def trackThreadFileIO(self, row, plan):
+        thread = self.threads.get(row[THREAD_ID_INDEX])
+        if thread is None:
+            return
+        bytes = int(row[plan.sizeIndex], 16)
+        for handler in self.fileIOHandlers:
+            handler(row, plan, thread, self.stage, bytes)
+
+    def trackThreadNetIO(self, row, plan):
+        origThread = self.connectionIDs.setdefault(row[plan.activityIndex], row[THREAD_ID_INDEX])
+        thread = self.threads.get(origThread)
+        if thread is not None and plan.counters:
+            bytes = int(row[plan.numBytesIndex])
+            for handler in self.netIOHandlers:
+                handler(row, plan, thread, self.stage, bytes)
+
+    def updateStage(self, row, plan):
+        if row[THREAD_ID_INDEX] not in self.threads:
+            return
+        guid = row[plan.guidIndex]
+        if guid == CEVT_WINDOWS_RESTORED and self.stage == 0:
+            self.stage = 1
+        elif guid == CEVT_XPCOM_SHUTDOWN and self.stage == 1:
+            self.stage = 2
+
+# what etlparser aggregates
+DEFAULT_AGGREGATORS = (FileSummary, ThreadIO, NetIO)
+
+def results(aggregators):
+    """(files, io) from the default aggregators"""
+    summary, threadIO, netIO = aggregators
+    io = dict(threadIO.io)
+    io.update(netIO.io)
+    return summary.files, io
+
+def csvReader(lines):
+    return csv.reader(lines, delimiter=',', quotechar='"', skipinitialspace=True)
+
+def parseLines(lines, processID):
+    """
+    gather file and network I/O of the threads of process |processID| from
+    the lines of an xperf CSV; returns (files, io)
+    """
+    parser = EtlParser(processID, [aggregatorType() for aggregatorType in DEFAULT_AGGREGATORS])
+    parser.parse(csvReader(lines))
+    return results(parser.aggregators)
+
+def parseCSV(csvname, processID, jobs=1):
+    if jobs > 1:
+        return results(parseCSVParallel(csvname, processID, jobs))
+    print "etlparser: in readfile: %s" % csvname
+    with open(csvname, 'rb') as f:
+        return parseLines(f, processID)
+
+def mergeETL(xperf_path, etl_filename, debug=False):
+    """merge the user and kernel traces into etl_filename"""
     xperf_cmd = [xperf_path,
                  '-merge',
                  '%s.user' % etl_filename,
@@ -137,6 +400,15 @@ def etl2csv(xperf_path, etl_filename, debug=False):
         print "executing '%s'" % subprocess.list2cmdline(xperf_cmd)
     subprocess.call(xperf_cmd)
 
+def etl2csv(xperf_path, etl_filename, debug=False):
+    """
+    Convert etl_filename to etl_filename.csv (temp file) which is the .csv representation of the .etl file
+    Etlparser will read this .csv and parse the information we care about into the final output.
+    This is done to keep things simple and to preserve resources on talos machines (large files == high memory + cpu)
+    """
+
+    mergeETL(xperf_path, etl_filename, debug=debug)
+
     csv_filename = '%s.csv' % etl_filename
     xperf_cmd = [xperf_path,
                  '-i', etl_filename,
@@ -146,54 +418,130 @@ def etl2csv(xperf_path, etl_filename, debug=False):
     subprocess.call(xperf_cmd)
     return csv_filename
 
-def trackThread(row, firefoxPID):
-    event, proc, tid = row[EVENTNAME_INDEX], row[PROCESS_INDEX], row[THREAD_ID_INDEX]
-    if event in ["T-DCStart", "T-Start"]:
-        procName, procID = re.search("^(.*) \(\s*(\d+)\)$", proc).group(1, 2)
-        if procID == str(firefoxPID):
-            imgIdx = getIndex(event, IMAGEFUNC_COL)
-            img = re.match("([^!]+)!", row[imgIdx]).group(1)
-            if img == procName:
-                gThreads[tid] = "main"
-            else:
-                gThreads[tid] = "nonmain"
-    elif event in ["T-DCEnd", "T-End"] and tid in gThreads:
-        del gThreads[tid]
-
-def trackThreadFileIO(row, io, stage):
-    event, tid = row[EVENTNAME_INDEX], row[THREAD_ID_INDEX]
-    opType = {"FileIoWrite": "write", "FileIoRead": "read"}[event]
-    th, stg = gThreads[tid], stages[stage]
-    sizeIdx = getIndex(event, DISKBYTES_COL)
-    bytes = int(row[sizeIdx], 16)
-    io[(th, stg, "file_%s_ops" % opType)] = io.get((th, stg, "file_%s_ops" % opType), 0) + 1
-    io[(th, stg, "file_%s_bytes" % opType)] = io.get((th, stg, "file_%s_bytes" % opType), 0) + bytes
-    io[(th, stg, "file_io_bytes")] = io.get((th, stg, "file_io_bytes"), 0) + bytes
-
-def trackThreadNetIO(row, io, stage):
-    event, tid = row[EVENTNAME_INDEX], row[THREAD_ID_INDEX]
-    connIdIdx = getIndex(event, ACTIVITY_ID_COL)
-    connID = row[connIdIdx]
-    if connID not in gConnectionIDs:
-        gConnectionIDs[connID] = tid
-    origThread = gConnectionIDs[connID]
-    if origThread in gThreads:
-        netEvt = re.match("[\w-]+\/([\w-]+)", event).group(1)
-        if netEvt in net_events:
-            opType = net_events[netEvt]
-            th, stg = gThreads[origThread], stages[stage]
-            lenIdx = getIndex(event, NUMBYTES_COL)
-            bytes = int(row[lenIdx])
-            io[(th, stg, "net_%s_bytes" % opType)] = io.get((th, stg, "net_%s_bytes" % opType), 0) + bytes
-            io[(th, stg, "net_io_bytes")] = io.get((th, stg, "net_io_bytes"), 0) + bytes
-
-def updateStage(row, stage):
-    guidIdx = getIndex(row[EVENTNAME_INDEX], EVENTGUID_COL)
-    if row[guidIdx] == CEVT_WINDOWS_RESTORED and stage == 0:
-        stage = 1
-    elif row[guidIdx] == CEVT_XPCOM_SHUTDOWN and stage == 1:
-        stage = 2
-    return stage
+def teeLines(lines, filename):
+    """yield |lines|, writing them to |filename| on the way"""
+    f = open(filename, 'wb')
+    try:
+        for line in lines:
+            f.write(line)
+            yield line
+    finally:
+        f.close()
+
+def parseETL(xperf_path, etl_filename, processID, csv_filename=None, debug=False):
+    """
+    Parse the .csv representation of etl_filename as xperf exports it to
+    its standard output, so that the export doesn't go through the disk and
+    the parsing overlaps with it. The export is also written to
+    csv_filename, if given. Returns what parseCSV does.
+    """
+
+    mergeETL(xperf_path, etl_filename, debug=debug)
+
+    # without -o, xperf writes the export to its standard output
+    xperf_cmd = [xperf_path, '-i', etl_filename]
+    if debug:
+        print "executing '%s'" % subprocess.list2cmdline(xperf_cmd)
+    xperf = subprocess.Popen(xperf_cmd, stdout=subprocess.PIPE)
+    try:
+        lines = xperf.stdout
+        if csv_filename:
+            lines = teeLines(lines, csv_filename)
+        return parseLines(lines, processID)
+    finally:
+        # if parsing failed, this makes xperf stop on a broken pipe
+        xperf.stdout.close()
+        xperf.wait()
+
+def parseLine(line):
+    return csvReader([line]).next()
+
+def scanCSV(csvname, processID, chunks):
+    """
+    split the rows of an xperf CSV into |chunks| byte ranges, and track the
+    threads, connections and stage on the way. Only thread, stage and
+    network rows are parsed, so this is much quicker than a full parse.
+    Returns the header rows and a list of (start, end, state) with the
+    EtlParser state at the start of each range.
+    """
+    print "etlparser: in scanCSV: %s" % csvname
+    parser = EtlParser(processID)
+    ranges = []
+    f = open(csvname, 'rb')
+    try:
+        # the header, and the line after it
+        offset = 0
+        for line in iter(f.readline, ''):
+            offset += len(line)
+            parser.feed(parseLine(line))
+            if parser.position == parser.IN_DATA:
+                break
+        dataStart = offset
+        size = os.fstat(f.fileno()).st_size
+        boundaries = [dataStart + (size - dataStart) * i / chunks for i in range(1, chunks)]
+
+        start = dataStart
+        startState = parser.getState()
+        plans = parser.plans
+        f.seek(dataStart)
+        for line in f:
+            if boundaries and offset >= boundaries[0]:
+                while boundaries and offset >= boundaries[0]:
+                    boundaries.pop(0)
+                if offset > start:
+                    ranges.append((start, offset, startState))
+                    start = offset
+                    startState = parser.getState()
+            offset += len(line)
+            # file I/O rows don't change the state
+            plan = plans.get(line[:line.find(',')])
+            if plan is not None and plan.kind != "trackThreadFileIO":
+                plan.handler(parseLine(line), plan)
+        ranges.append((start, size, startState))
+    finally:
+        f.close()
+    return parser.headers.values(), ranges
+
+def readRange(f, start, end):
+    f.seek(start)
+    offset = start
+    for line in f:
+        if offset >= end:
+            break
+        offset += len(line)
+        yield line
+
+def parseChunk(args):
+    """parse one byte range of an xperf CSV, starting from the state scanCSV found"""
+    csvname, processID, headers, start, end, state, aggregatorTypes = args
+    parser = EtlParser(processID, [aggregatorType() for aggregatorType in aggregatorTypes], headers, state)
+    f = open(csvname, 'rb')
+    try:
+        parser.parse(csvReader(readRange(f, start, end)))
+    finally:
+        f.close()
+    return parser.aggregators
+
+def parseCSVParallel(csvname, processID, jobs, aggregatorTypes=DEFAULT_AGGREGATORS):
+    """
+    parseCSV in |jobs| processes: a first pass finds the parser state at the
+    start of each chunk of rows, then the chunks are parsed in a process
+    pool and their aggregators merged. Returns the merged aggregators.
+    """
+    headers, ranges = scanCSV(csvname, processID, jobs * CHUNKS_PER_JOB)
+    pool = multiprocessing.Pool(jobs)
+    try:
+        chunks = pool.map(parseChunk, [(csvname, processID, headers, start, end, state, aggregatorTypes)
+                                       for start, end, state in ranges])
+    finally:
+        pool.close()
+        pool.join()
+
+    aggregators = chunks[0]
+    for chunk in chunks[1:]:
+        for aggregator, later in zip(aggregators, chunk):
+            aggregator.merge(later)
+    return aggregators
 
 def loadWhitelist(filename):
     if not filename:
@@ -204,36 +552,26 @@ def loadWhitelist(filename):
     lines = file(filename).readlines()
     # Expand paths
     lines = [os.path.expandvars(elem.strip()) for elem in lines]
-    files = set()
-    dirs = set()
-    recur = set()
+    whitelist = pathmatch.PathTrie()
     for line in lines:
         if line.startswith("#"):
             continue
         elif line.endswith("\\*\\*"):
-            recur.add(line[:-4])
+            whitelist.add(line[:-4], pathmatch.TREE)
         elif line.endswith("\\*"):
-            dirs.add(line[:-2])
+            whitelist.add(line[:-2], pathmatch.DIR)
         else:
-            files.add(line)
-    return (files, dirs, recur)
+            whitelist.add(line, pathmatch.FILE)
+    return whitelist
 
 def checkWhitelist(filename, whitelist):
     if not whitelist:
         return False
-    if filename in whitelist[0]:
-        return True
-    if os.path.dirname(filename) in whitelist[1]:
-        return True
-    head = filename
-    while len(head) > 3: # Length 3 implies root directory, e.g. C:\
-        head, tail = os.path.split(head)
-        if head in whitelist[2]:
-            return True
-    return False
+    return whitelist.match(filename)
 
 def etlparser(xperf_path, etl_filename, processID, approot=None, configFile=None, outputFile=None,
-              whitelist_file=None, error_filename=None, all_stages=False, all_threads=False, debug=False):
+              whitelist_file=None, error_filename=None, all_stages=False, all_threads=False, debug=False,
+              jobs=1, keep_csv=False):
 
     # setup output file
     if outputFile:
@@ -241,30 +579,24 @@ def etlparser(xperf_path, etl_filename, processID, approot=None, configFile=None
     else:
         outFile = sys.stdout
 
-    files = {}
-    io = {}
-    stage = 0
-
     print "reading etl filename: %s" % etl_filename
-    csvname = etl2csv(xperf_path, etl_filename, debug=debug)
-    for row in readFile(csvname):
-        event = row[EVENTNAME_INDEX]
-        if event in ["T-DCStart", "T-Start", "T-DCEnd", "T-End"]:
-            trackThread(row, processID)
-        elif event in ["FileIoRead", "FileIoWrite"] and row[THREAD_ID_INDEX] in gThreads:
-            fileSummary(row, stage, files)
-            trackThreadFileIO(row, io, stage)
-        elif event.endswith("Event/Classic") and row[THREAD_ID_INDEX] in gThreads:
-            stage = updateStage(row, stage)
-        elif event.startswith("Microsoft-Windows-TCPIP"):
-            trackThreadNetIO(row, io, stage)
-
-    # remove the csv file
-    if not debug:
-        try:
-            os.remove(csvname)
-        except:
-            pass
+    keep_csv = keep_csv or debug
+    if jobs > 1:
+        # parallel parsing needs the whole export on disk
+        csvname = etl2csv(xperf_path, etl_filename, debug=debug)
+        files, io = parseCSV(csvname, processID, jobs)
+
+        # remove the csv file
+        if not keep_csv:
+            try:
+                os.remove(csvname)
+            except:
+                pass
+    else:
+        csvname = None
+        if keep_csv:
+            csvname = '%s.csv' % etl_filename
+        files, io = parseETL(xperf_path, etl_filename, processID, csvname, debug=debug)
 
     output = "thread, stage, counter, value\n"
     for cntr in sorted(io.iterkeys()):
@@ -334,29 +666,12 @@ def etlparser(xperf_path, etl_filename, processID, approot=None, configFile=None
     wl = {}
     for item in wl_temp:
         wl[item.lower()] = wl_temp[item]
+    normalizer = pathmatch.PathNormalizer(WHITELIST_PATH_SUBSTITUTIONS, WHITELIST_NAME_SUBSTITUTIONS,
+                                          WHITELIST_REMOVALS)
 
     errors = []
     for row in filekeys:
-        filename = row[0]
-        filename = filename.lower()
-        # take care of 'program files (x86)' matching 'program files'
-        filename = filename.replace(" (x86)", '')
-
-        paths = ['profile', 'firefox', 'desktop', 'talos']
-        for path in paths:
-            pathname = '%s\\' % path
-            parts = filename.split(pathname)
-            if len(parts) >= 2:
-                filename = "{%s}\\%s" % (path, pathname.join(parts[1:]))
-
-        parts = filename.split('\\installtime')
-        if len(parts) >= 2:
-            filename = "%s\\{time}" % parts[0]
-
-        #NOTE: this is Prefetch or prefetch, not case sensitive operating system
-        parts = filename.split('refetch')
-        if len(parts) >= 2:
-            filename = "%srefetch\\{prefetch}.pf" % parts[0]
+        filename = normalizer.normalize(row[0])
 
         if filename in wl:
             if 'ignore' in wl[filename] and wl[filename]['ignore']:
@@ -397,8 +712,8 @@ def etlparser(xperf_path, etl_filename, processID, approot=None, configFile=None
             mud_filename = os.path.join(mud, etl_filename)
             os.rename(etl_filename, mud_filename)
 
-def etlparser_from_config(config_file, **kwargs):
-    """start from a YAML config file"""
+def etlparser_from_config(config_file, config=None, **kwargs):
+    """start from a YAML config file, or a config dictionary"""
 
     # option defaults
     args = {'xperf_path': 'xperf.exe',
@@ -409,12 +724,17 @@ def etlparser_from_config(config_file, **kwargs):
             'whitelist_file': None,
             'error_filename': None,
             'all_stages': False,
-            'all_threads': False
+            'all_threads': False,
+            'jobs': 1,
+            'keep_csv': False
             }
     args.update(kwargs)
 
-    # override from YAML config file
-    args = xtalos.options_from_config(args, config_file)
+    # override from YAML config file, or the config talos passed in process
+    if config_file:
+        args = xtalos.options_from_config(args, config_file)
+    if config:
+        args = xtalos.options_from_dict(args, config)
 
     # ensure process ID is given
     if not args.get('processID'):
@@ -445,7 +765,7 @@ def main(args=sys.argv[1:]):
     etlparser(args.xperf_path, args.etl_filename, args.processID, args.approot,
               args.configFile, args.outputFile, args.whitelist_file, args.error_filename,
               args.all_stages, args.all_threads,
-              debug=args.debug_level >= xtalos.DEBUG_INFO)
+              debug=args.debug_level >= xtalos.DEBUG_INFO, jobs=args.jobs, keep_csv=args.keep_csv)
 
 if __name__ == "__main__":
     main()
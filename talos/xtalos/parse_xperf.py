@@ -16,8 +16,8 @@ def stop(xperf_path, debug=False):
         print "executing '%s'" % subprocess.list2cmdline(xperf_cmd)
     subprocess.call(xperf_cmd)
 
-def stop_from_config(config_file=None, debug=False, **kwargs):
-    """start from a YAML config file"""
+def stop_from_config(config_file=None, debug=False, config=None, **kwargs):
+    """stop from a YAML config file, or a config dictionary"""
 
     # required options and associated error messages
     required = {'xperf_path': "xperf_path not given",
@@ -29,6 +29,8 @@ def stop_from_config(config_file=None, debug=False, **kwargs):
     if config_file:
         # override options from YAML config file
         kwargs = xtalos.options_from_config(kwargs, config_file)
+    if config:
+        kwargs = xtalos.options_from_dict(kwargs, config)
 
     # ensure the required options are given
     for key, msg in required.items():
@@ -48,11 +50,24 @@ def stop_from_config(config_file=None, debug=False, **kwargs):
     stop(**stopargs)
 
     etlparser.etlparser_from_config(config_file,
+                                    config=config,
                                     approot=kwargs['approot'],
                                     error_filename=kwargs['error_filename'],
-                                    processID=kwargs['processID']
+                                    processID=kwargs['processID'],
+                                    jobs=kwargs.get('jobs', 1),
+                                    keep_csv=kwargs.get('keep_csv', False)
                                     )
 
+def talos_cleanup(config, args):
+    """talos cleanup hook: stops xperf and parses its output with the config
+    talos passes in process"""
+
+    options = xtalos.XtalosOptions().parse_args(args)
+    options.configFile = None
+    stop_from_config(config=config,
+                     debug=options.debug_level >= xtalos.DEBUG_INFO,
+                     **options.__dict__)
+
 def main(args=sys.argv[1:]):
 
     # parse command line arguments
@@ -0,0 +1,172 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+file name matching for the xperf and main thread I/O whitelists:
+ - PathNormalizer rewrites file names with substitution rules, e.g.
+   c:\\program files\\mozilla firefox\\omni.ja -> {firefox}\\omni.ja
+ - PathTrie matches file names against whitelisted files, directories
+   and directory trees
+Both remember their answer for the file names they have seen most recently,
+so checking a file that is accessed over and over costs one cache lookup.
+"""
+
+import re
+
+# number of file names whose answer is remembered
+CACHE_SIZE = 8192
+
+# whitelist entry kinds
+FILE = 1 # the path itself
+DIR = 2 # files directly in the directory
+TREE = 4 # files anywhere below the directory
+
+separators = re.compile(r'[\\/]+')
+
+def splitPath(path):
+    """the case folded components of a Windows path"""
+    return [component for component in separators.split(path.lower()) if component]
+
+class LRUCache(object):
+    """
+    a mapping that forgets its least recently used entries beyond |size|.
+    Lookups only stamp the entry with a counter; the least recently used
+    quarter of the entries is forgotten at once when the cache overflows.
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = {} # key -> [value, time of last use]
+        self.clock = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            return default
+        self.clock += 1
+        entry[1] = self.clock
+        return entry[0]
+
+    def __setitem__(self, key, value):
+        self.clock += 1
+        self.entries[key] = [value, self.clock]
+        if len(self.entries) > self.size:
+            keep = self.size * 3 / 4
+            lastUses = sorted(entry[1] for entry in self.entries.itervalues())
+            oldest = lastUses[-keep - 1] if keep else lastUses[-1]
+            for key, entry in self.entries.items():
+                if entry[1] <= oldest:
+                    del self.entries[key]
+
+    def clear(self):
+        self.entries.clear()
+
+class PathTrie(object):
+    """whitelisted files, directories and trees, keyed one path component at a time"""
+
+    def __init__(self, files=(), dirs=(), trees=(), cacheSize=CACHE_SIZE):
+        # a node is [kinds, {component: node}]
+        self.root = [0, {}]
+        self.cache = LRUCache(cacheSize)
+        for kind, paths in ((FILE, files), (DIR, dirs), (TREE, trees)):
+            for path in paths:
+                self.add(path, kind)
+
+    def add(self, path, kind=FILE):
+        node = self.root
+        for component in splitPath(path):
+            node = node[1].setdefault(component, [0, {}])
+        node[0] |= kind
+        self.cache.clear()
+
+    def match(self, path):
+        matched = self.cache.get(path)
+        if matched is not None:
+            return matched
+
+        matched = False
+        components = splitPath(path)
+        last = len(components) - 1
+        node = self.root
+        for index, component in enumerate(components):
+            node = node[1].get(component)
+            if node is None:
+                break
+            if index == last:
+                matched = bool(node[0] & FILE)
+            elif node[0] & TREE or (index == last - 1 and node[0] & DIR):
+                matched = True
+                break
+        self.cache[path] = matched
+        return matched
+
+    __contains__ = match
+
+class PathNormalizer(object):
+    """
+    lower cases file names, drops the |removals| from them and rewrites
+    them with two ordered lists of (text, replacement) substitutions:
+     - a path substitution replaces everything up to and including the first
+       occurrence of its text;
+     - a name substitution replaces the first occurrence of its text and
+       everything after it.
+    A replacement may not contain the text of a substitution applied after
+    it, so that all substitutions can be found in the original file name
+    instead of rewriting it after each one.
+    """
+
+    def __init__(self, pathSubstitutions=(), nameSubstitutions=(), removals=(), strip=None,
+                 cacheSize=CACHE_SIZE):
+        if isinstance(pathSubstitutions, dict):
+            pathSubstitutions = pathSubstitutions.items()
+        if isinstance(nameSubstitutions, dict):
+            nameSubstitutions = nameSubstitutions.items()
+        self.pathSubstitutions = list(pathSubstitutions)
+        self.nameSubstitutions = list(nameSubstitutions)
+        self.removals = list(removals)
+        self.strip = strip
+        self.cache = LRUCache(cacheSize)
+
+        substitutions = self.pathSubstitutions + self.nameSubstitutions
+        for index, (text, replacement) in enumerate(substitutions):
+            for other, otherReplacement in substitutions[index + 1:]:
+                if other in replacement:
+                    raise ValueError("Replacement '%s' contains the substituted text '%s'" % (replacement, other))
+
+    def normalize(self, filename):
+        normalized = self.cache.get(filename)
+        if normalized is not None:
+            return normalized
+
+        normalized = filename.lower()
+        for text in self.removals:
+            normalized = normalized.replace(text, '')
+
+        # str.find beats a regular expression over all the texts here
+        head = ''
+        start = 0
+        for text, replacement in self.pathSubstitutions:
+            position = normalized.find(text, start)
+            if position != -1:
+                head = replacement
+                start = position + len(text)
+        end = len(normalized)
+        tail = ''
+        for text, replacement in self.nameSubstitutions:
+            position = normalized.find(text, start, end)
+            if position != -1:
+                end = position
+                tail = replacement
+        normalized = head + normalized[start:end] + tail
+        if self.strip is not None:
+            normalized = normalized.strip(self.strip)
+
+        self.cache[filename] = normalized
+        return normalized
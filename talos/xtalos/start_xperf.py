@@ -27,8 +27,8 @@ def start(xperf_path, xperf_providers, xperf_stackwalk, xperf_user_providers, et
         print "executing '%s'" % subprocess.list2cmdline(xperf_cmd)
     subprocess.call(xperf_cmd)
 
-def start_from_config(config_file=None, debug=False, **kwargs):
-    """start from a YAML config file"""
+def start_from_config(config_file=None, debug=False, config=None, **kwargs):
+    """start from a YAML config file, or a config dictionary"""
 
     # required options and associated error messages
     required = {'xperf_path': "xperf_path not given",
@@ -43,6 +43,8 @@ def start_from_config(config_file=None, debug=False, **kwargs):
     if config_file:
         # override options from YAML config file
         kwargs = xtalos.options_from_config(kwargs, config_file)
+    if config:
+        kwargs = xtalos.options_from_dict(kwargs, config)
 
     # ensure the required options are given
     for key, msg in required.items():
@@ -60,6 +62,15 @@ def start_from_config(config_file=None, debug=False, **kwargs):
     # call start
     start(**args)
 
+def talos_setup(config, args):
+    """talos setup hook: starts xperf with the config talos passes in process"""
+
+    options = xtalos.XtalosOptions().parse_args(args)
+    options.configFile = None
+    start_from_config(config=config,
+                      debug=options.debug_level >= xtalos.DEBUG_INFO,
+                      **options.__dict__)
+
 def main(args=sys.argv[1:]):
 
     # parse command line options
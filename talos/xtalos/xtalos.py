@@ -24,8 +24,14 @@ def options_from_config(options, config_file):
     config = open(config_file, 'r')
     yaml_config = yaml.load(config)
     config.close()
+    return options_from_dict(options, yaml_config)
+
+def options_from_dict(options, config):
+    """override options from a dictionary, e.g. the config talos passes to
+    its in-process hooks; returns the dictionary"""
+
     for obj in options.keys():
-        options[obj] = yaml_config.get(obj, options[obj])
+        options[obj] = config.get(obj, options[obj])
     return options
 
 class XtalosOptions(argparse.ArgumentParser):
@@ -94,6 +100,14 @@ class XtalosOptions(argparse.ArgumentParser):
                         help="Filename to store the failures detected while runnning the test")
         defaults["error_filename"] = None
 
+        self.add_argument("-j", "--jobs", dest="jobs", type=int,
+                        help="Number of processes to parse the xperf output with, defaults to 1")
+        defaults["jobs"] = 1
+
+        self.add_argument("--keep-csv", dest="keep_csv", action="store_true",
+                        help="Keep the .csv export of the .etl file next to it, for debugging")
+        defaults["keep_csv"] = False
+
         self.set_defaults(**defaults)
 
     def verifyOptions(self, options):
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+benchmark xtalos' xperf CSV parsing on a synthetic trace.
+
+usage: bench_etlparser.py [size in MB] [number of processes]
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+from talos.xtalos import etlparser
+
+FIREFOX_PID = 1234
+
+HEADER = """BeginHeader
+T-DCStart, TimeStamp, Process Name ( PID), ThreadID, StackBase, StackLimit, UsrStackBase, UsrStackLimit, Affinity, Win32StartAddr, TebBase, SubProcessTag, BasePriority, PagePriority, IoPriority, ThreadFlags, Image!Function
+T-Start, TimeStamp, Process Name ( PID), ThreadID, StackBase, StackLimit, UsrStackBase, UsrStackLimit, Affinity, Win32StartAddr, TebBase, SubProcessTag, BasePriority, PagePriority, IoPriority, ThreadFlags, Image!Function
+T-End, TimeStamp, Process Name ( PID), ThreadID, StackBase, StackLimit, UsrStackBase, UsrStackLimit, Affinity, Win32StartAddr, TebBase, SubProcessTag, BasePriority, PagePriority, IoPriority, ThreadFlags, Image!Function
+FileIoRead, TimeStamp, Process Name ( PID), ThreadID, LoggingAddr, IrpPtr, FileObject, ByteOffset, Size, Flags, ExtraFlags, Priority, FileName, ParsedFlags
+FileIoWrite, TimeStamp, Process Name ( PID), ThreadID, LoggingAddr, IrpPtr, FileObject, ByteOffset, Size, Flags, ExtraFlags, Priority, FileName, ParsedFlags
+FileIoCreate, TimeStamp, Process Name ( PID), ThreadID, LoggingAddr, IrpPtr, FileObject, Options, Attributes, ShareAccess, FileName, ParsedOptions
+Mozilla Generic Provider/Event/Classic, TimeStamp, Process Name ( PID), ThreadID, EventGuid, Data
+Microsoft-Windows-TCPIP/TcpDataTransferReceive, TimeStamp, Process Name ( PID), ThreadID, etw:ActivityId, NumBytes, SeqNo
+Microsoft-Windows-TCPIP/TcpDataTransferSend, TimeStamp, Process Name ( PID), ThreadID, etw:ActivityId, NumBytes, SeqNo
+Microsoft-Windows-TCPIP/TcpConnectionRundown, TimeStamp, Process Name ( PID), ThreadID, etw:ActivityId, State
+EndHeader
+Trace data follows
+"""
+
+def thread_row(event, timestamp, pid, tid, image):
+    return '%s, %d, firefox.exe (%d), %d, 0x1, 0x2, 0x3, 0x4, 0xff, 0x5, 0x6, 0, 8, 5, 2, 0x0, "%s!wmainCRTStartup"\n' % (
+        event, timestamp, pid, tid, image)
+
+def file_row(event, timestamp, tid, size, filename):
+    return '%s, %d, firefox.exe (%d), %d, 0x1, 0x2, 0x3, 0x0, 0x%x, 0x0, 0x0, 2, "%s", None\n' % (
+        event, timestamp, FIREFOX_PID, tid, size, filename)
+
+def write_trace(f, size, seed=0):
+    """write a synthetic xperf CSV of about |size| bytes to |f|"""
+    rand = random.Random(seed)
+    f.write(HEADER)
+    threads = [FIREFOX_PID * 10 + i for i in range(8)]
+    f.write(thread_row("T-DCStart", 0, FIREFOX_PID, threads[0], "firefox.exe"))
+    for tid in threads[1:]:
+        f.write(thread_row("T-Start", 0, FIREFOX_PID, tid, "xul.dll"))
+    f.write(thread_row("T-Start", 0, 99, 7, "svchost.exe"))
+    filenames = ['C:\\Program Files\\Mozilla Firefox\\file_%d.dll' % i for i in range(3000)]
+    timestamp = 1
+    guids = [(size / 3, etlparser.CEVT_WINDOWS_RESTORED), (size * 2 / 3, etlparser.CEVT_XPCOM_SHUTDOWN)]
+    while f.tell() < size:
+        timestamp += 1
+        choice = rand.random()
+        tid = rand.choice(threads)
+        if choice < 0.8:
+            f.write(file_row(rand.choice(["FileIoRead", "FileIoWrite"]), timestamp, tid,
+                             rand.randrange(1 << 16), rand.choice(filenames)))
+        elif choice < 0.9:
+            f.write('FileIoCreate, %d, firefox.exe (%d), %d, 0x1, 0x2, 0x3, 0x0, 0x0, 0x0, "%s", None\n' % (
+                timestamp, FIREFOX_PID, tid, rand.choice(filenames)))
+        elif choice < 0.98:
+            event = rand.choice(["TcpDataTransferReceive", "TcpDataTransferSend", "TcpConnectionRundown"])
+            if event == "TcpConnectionRundown":
+                f.write('Microsoft-Windows-TCPIP/%s, %d, firefox.exe (%d), %d, {%08d-0000}, 1\n' % (
+                    event, timestamp, FIREFOX_PID, tid, rand.randrange(50)))
+            else:
+                f.write('Microsoft-Windows-TCPIP/%s, %d, firefox.exe (%d), %d, {%08d-0000}, %d, 1\n' % (
+                    event, timestamp, FIREFOX_PID, tid, rand.randrange(50), rand.randrange(1 << 12)))
+        else:
+            f.write('CSwitch, %d, firefox.exe (%d), %d, 0\n' % (timestamp, FIREFOX_PID, tid))
+        if guids and f.tell() > guids[0][0]:
+            f.write('Mozilla Generic Provider/Event/Classic, %d, firefox.exe (%d), %d, %s, 0\n' % (
+                timestamp, FIREFOX_PID, threads[0], guids.pop(0)[1]))
+    f.write(thread_row("T-End", timestamp + 1, FIREFOX_PID, threads[-1], "xul.dll"))
+
+def main(args=sys.argv[1:]):
+    size = int(float(args[0]) * 1024 * 1024) if args else 64 * 1024 * 1024
+    jobs = int(args[1]) if len(args) > 1 else 1
+    tempdir = tempfile.mkdtemp()
+    try:
+        csv_path = os.path.join(tempdir, 'trace.csv')
+        with open(csv_path, 'w') as f:
+            write_trace(f, size)
+        size = os.path.getsize(csv_path)
+        start = time.time()
+        files, io = etlparser.parseCSV(csv_path, FIREFOX_PID, jobs)
+        elapsed = time.time() - start
+        print "%d bytes in %.2fs with %d process(es): %.1f MB/s (%d files, %d counters)" % (
+            size, elapsed, jobs, size / elapsed / 1024 / 1024, len(files), len(io))
+    finally:
+        shutil.rmtree(tempdir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+benchmark SPS profile post-processing: the three-step
+symbolicate_profile + compress_profile path against the fused
+sps.symbolicate_and_compress and its streaming counterpart.
+
+usage: bench_sps.py [number of samples]
+"""
+
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+from talos.profiler import sps
+from talos.profiler import symbolication
+
+def make_profile(samples, depth=30, functions=5000, seed=0):
+    """a synthetic raw profile with |samples| samples over one library"""
+    rand = random.Random(seed)
+    start = 0x7f0000000000
+    libs = [{"start": start, "end": start + functions * 0x100,
+             "name": "/builds/firefox/libxul.so", "breakpadId": "BENCH0"}]
+    frames = ["0x%x" % (start + i * 0x100 + rand.randrange(0x100)) for i in range(functions * 4)]
+    return {"libs": json.dumps(libs),
+            "meta": {"version": 2, "interval": 1},
+            "threads": [{"name": "GeckoMain",
+                         "samples": [{"time": float(i),
+                                      "frames": [{"location": "(root)"}] +
+                                                [{"location": rand.choice(frames)} for j in range(depth)]}
+                                     for i in range(samples)]}]}
+
+def write_symbols(symbol_dir, functions=5000):
+    path = os.path.join(symbol_dir, 'libxul.so', 'BENCH0')
+    os.makedirs(path)
+    with open(os.path.join(path, 'libxul.so.sym'), 'w') as f:
+        f.write("MODULE Linux x86_64 BENCH0 libxul.so\n")
+        for i in range(functions):
+            f.write("FUNC %x 100 0 function_%d\n" % (i * 0x100, i))
+
+def make_symbolicator(symbol_dir):
+    return symbolication.ProfileSymbolicator({
+        "remoteSymbolServer": None,
+        "maxCacheEntries": 2000000,
+        "defaultApp": "FIREFOX",
+        "defaultOs": "WINDOWS",
+        "symbolPaths": {"FIREFOX": symbol_dir, "WINDOWS": symbol_dir}
+    })
+
+def timed(name, function):
+    start = time.time()
+    function()
+    print "%-30s %.3fs" % (name, time.time() - start)
+
+def main(args=sys.argv[1:]):
+    samples = int(args[0]) if args else 20000
+    tempdir = tempfile.mkdtemp()
+    try:
+        write_symbols(tempdir)
+        raw_profile = make_profile(samples)
+        profile_path = os.path.join(tempdir, 'profile.sps')
+        with open(profile_path, 'w') as f:
+            json.dump(raw_profile, f)
+        print "%d samples, %d bytes" % (samples, os.path.getsize(profile_path))
+
+        # warm the symbol file cache so that sym file parsing isn't measured
+        make_symbolicator(tempdir).symbolicate_profile(make_profile(1))
+
+        profile = json.loads(json.dumps(raw_profile))
+        def three_step():
+            make_symbolicator(tempdir).symbolicate_profile(profile)
+            sps.compress_profile(profile)
+        timed("symbolicate + compress", three_step)
+
+        profile = json.loads(json.dumps(raw_profile))
+        timed("symbolicate_and_compress", lambda: sps.symbolicate_and_compress(profile, make_symbolicator(tempdir)))
+
+        output_path = os.path.join(tempdir, 'compressed.sps')
+        def streaming():
+            libs = sps.read_libs(profile_path)
+            sps.symbolicate_and_compress_file(profile_path, output_path, make_symbolicator(tempdir), libs)
+        timed("symbolicate_and_compress_file", streaming)
+    finally:
+        shutil.rmtree(tempdir)
+
+if __name__ == '__main__':
+    main()
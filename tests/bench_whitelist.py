@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+benchmark checking a synthetic main thread I/O log against mtio-whitelist.json.
+
+usage: bench_whitelist.py [number of rows] [number of distinct files]
+"""
+
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+from talos import mainthreadio
+from talos import whitelist
+
+DIRS = {'{profile}': 'C:\\Users\\cltbld\\AppData\\Local\\Temp\\tmpk2rxyz\\profile',
+        '{xre}': 'C:\\Program Files (x86)\\Mozilla Firefox',
+        '{fonts}': 'C:\\Windows\\Fonts',
+        '{appdata}': 'C:\\Users\\cltbld\\AppData',
+        '{desktop}': 'C:\\Users\\cltbld\\Desktop'}
+
+def filenames(count, seed=0):
+    """|count| file names: the whitelisted ones, then made up ones"""
+    rand = random.Random(seed)
+    with open(mainthreadio.WHITELIST_FILENAME) as f:
+        entries = json.load(f).keys()
+    names = []
+    for entry in entries:
+        subst = entry[:entry.find('}') + 1].lower()
+        names.append(DIRS.get(subst, subst) + entry[len(subst):] if subst in DIRS else entry)
+    while len(names) < count:
+        names.append('%s\\cache2\\entries\\%08X' % (DIRS['{profile}'], rand.getrandbits(32)))
+    return names[:count]
+
+def write_log(f, rows, files, seed=0):
+    rand = random.Random(seed)
+    f.write('0,NEXT-STAGE\n')
+    for row in range(rows):
+        f.write('%d,%s,%f,PoisonIOInterposer,%s\n' % (row, rand.choice(['read', 'write', 'stat']),
+                                                      rand.random() * 0.01, rand.choice(files)))
+
+def main(args=sys.argv[1:]):
+    rows = int(args[0]) if args else 100000
+    files = filenames(int(args[1]) if len(args) > 1 else 5000)
+    tempdir = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(tempdir, 'dependentlibs.list'), 'w') as f:
+            f.write('xul.dll\n')
+        log = os.path.join(tempdir, 'mainthread_io.log')
+        with open(log, 'w') as f:
+            write_log(f, rows, files)
+
+        wl = whitelist.Whitelist(test_name='mainthreadio',
+                                 paths={'{xre}': tempdir},
+                                 path_substitutions=mainthreadio.PATH_SUBSTITUTIONS,
+                                 name_substitutions=mainthreadio.NAME_SUBSTITUTIONS)
+        wl.load(mainthreadio.WHITELIST_FILENAME)
+
+        names = [line.rstrip().split(',')[mainthreadio.INDEX_FILENAME] for line in open(log).readlines()[1:]]
+        for label in ('cold', 'warm'):
+            start = time.time()
+            for name in names:
+                wl.sanitize_filename(name)
+            elapsed = time.time() - start
+            print "sanitize_filename, %s: %d rows in %.3fs (%.2f us/row)" % (label, len(names), elapsed,
+                                                                            elapsed * 1e6 / len(names))
+
+        data = mainthreadio.IOData()
+        start = time.time()
+        mainthreadio.parse(log, data)
+        wl.allow_profile_dirs(data, mainthreadio.TUPLE_FILENAME_INDEX)
+        errors = wl.check(data, mainthreadio.TUPLE_FILENAME_INDEX)
+        wl.checkDuration(data, mainthreadio.TUPLE_FILENAME_INDEX, mainthreadio.KEY_DURATION)
+        print "parse and check: %d rows, %d keys, %d unexpected files in %.3fs" % (rows, len(data), len(errors),
+                                                                                   time.time() - start)
+    finally:
+        shutil.rmtree(tempdir)
+
+if __name__ == '__main__':
+    main()
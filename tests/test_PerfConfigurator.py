@@ -181,6 +181,10 @@ class PerfConfiguratorUnitTest(unittest.TestCase):
                                         'except_fault' : '--ignoreFirst and --filter raised an error that is not ConfigurationError',
                                         'non_raises_fault' : '--ignoreFirst and --filter together passed test '\
                                                              '(Should raise ConfigurationError when called together)'},
+                       '--spsProfileCompressionLevel':{'error':ConfigurationError,
+                                   'args' : ['--activeTests', 'ts', '--develop',  '-e', ffox_path, '--spsProfileCompressionLevel', '10', '-o', outfile],
+                                   'except_fault' : 'invalid --spsProfileCompressionLevel raised an error that is not ConfigurationError',
+                                   'non_raises_fault' : 'invalid --spsProfileCompressionLevel passed test'},
                        '--remoteDevice':{'error':BaseException,
                                          'args':['--activeTests', 'ts', '--develop',  '-e', ffox_path,'--remoteDevice', '0.0.0.0',
                                                  '-o', outfile],
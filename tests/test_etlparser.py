@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+test xtalos' xperf CSV parsing:
+
+http://hg.mozilla.org/build/talos/file/tip/talos/xtalos/etlparser.py
+"""
+
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+from talos.xtalos import etlparser
+from talos.xtalos import parse_xperf
+
+here = os.path.dirname(os.path.abspath(__file__))
+fake_xperf = os.path.join(here, 'xperf', 'fake_xperf.py')
+
+# a whitelisted file, so that the whole parse doesn't report errors
+OMNIJA = 'C:\\Program Files\\Mozilla Firefox\\omni.ja'
+
+TRACE = """Some preamble
+BeginHeader
+T-DCStart, TimeStamp, Process Name ( PID), ThreadID, Image!Function
+T-End, TimeStamp, Process Name ( PID), ThreadID, Image!Function
+FileIoRead, TimeStamp, Process Name ( PID), ThreadID, Size, FileName
+FileIoWrite, TimeStamp, Process Name ( PID), ThreadID, Size, FileName
+FileIoCreate, TimeStamp, Process Name ( PID), ThreadID, FileName
+Mozilla Generic Provider/Event/Classic, TimeStamp, Process Name ( PID), ThreadID, EventGuid
+Microsoft-Windows-TCPIP/TcpDataTransferSend, TimeStamp, Process Name ( PID), ThreadID, etw:ActivityId, NumBytes
+Microsoft-Windows-TCPIP/TcpConnectionRundown, TimeStamp, Process Name ( PID), ThreadID, etw:ActivityId
+EndHeader
+Trace data follows
+T-DCStart, 1, firefox.exe (  42), 100, "firefox.exe!wmainCRTStartup"
+T-DCStart, 1, firefox.exe (  42), 101, "xul.dll!ThreadFunc"
+T-DCStart, 1, other.exe (  43), 200, "other.exe!main"
+FileIoRead, 2, firefox.exe (  42), 100, 0x10, "C:\\Program Files\\Mozilla Firefox\\omni.ja"
+FileIoRead, 2, firefox.exe (  42), 101, 0x20, "C:\\Program Files\\Mozilla Firefox\\omni.ja"
+FileIoWrite, 2, other.exe (  43), 200, 0x30, "C:\\Program Files\\Mozilla Firefox\\omni.ja"
+FileIoCreate, 2, firefox.exe (  42), 100, "C:\\b.dll"
+CSwitch, 2, firefox.exe (  42), 100
+Microsoft-Windows-TCPIP/TcpConnectionRundown, 3, System (  4), 0, {conn}
+Microsoft-Windows-TCPIP/TcpDataTransferSend, 3, firefox.exe (  42), 101, {conn}, 500
+Mozilla Generic Provider/Event/Classic, 4, firefox.exe (  42), 100, {917b96b1-ecad-4dab-a760-8d49027748ae}
+FileIoWrite, 5, firefox.exe (  42), 100, 0x100, "C:\\Program Files\\Mozilla Firefox\\omni.ja"
+Microsoft-Windows-TCPIP/TcpDataTransferSend, 5, firefox.exe (  42), 101, {sock}, 7
+T-End, 6, firefox.exe (  42), 101, "xul.dll!ThreadFunc"
+FileIoRead, 7, firefox.exe (  42), 101, 0x40, "C:\\Program Files\\Mozilla Firefox\\omni.ja"
+"""
+
+class FileCount(object):
+    """an aggregator that counts the file I/O rows of each thread"""
+
+    def __init__(self):
+        self.counts = {}
+
+    def fileIO(self, row, plan, thread, stage, bytes):
+        self.counts[thread] = self.counts.get(thread, 0) + 1
+
+    def merge(self, other):
+        for thread, count in other.counts.items():
+            self.counts[thread] = self.counts.get(thread, 0) + count
+
+class TestEtlParser(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.tempdir, 'trace.csv')
+        with open(self.csv_path, 'w') as f:
+            f.write(TRACE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def rows(self):
+        return etlparser.csvReader(TRACE.splitlines(True))
+
+    def test_column_plans(self):
+        """column indices are resolved once from the header"""
+        parser = etlparser.EtlParser(42).parse(self.rows())
+        self.assertEqual(sorted(parser.plans.keys()),
+                         ['FileIoRead', 'FileIoWrite',
+                          'Microsoft-Windows-TCPIP/TcpConnectionRundown',
+                          'Microsoft-Windows-TCPIP/TcpDataTransferSend',
+                          'Mozilla Generic Provider/Event/Classic',
+                          'T-DCStart', 'T-End'])
+        plan = parser.plans['FileIoRead']
+        self.assertEqual((plan.sizeIndex, plan.fnameIndex), (4, 5))
+        self.assertEqual(parser.plans['Microsoft-Windows-TCPIP/TcpDataTransferSend'].numBytesIndex, 5)
+
+    def test_parse(self):
+        """file and network I/O is attributed to threads and stages"""
+        files, io = etlparser.parseCSV(self.csv_path, 42)
+        self.assertEqual(io, {('main', 'startup', 'file_read_ops'): 1,
+                              ('main', 'startup', 'file_read_bytes'): 0x10,
+                              ('main', 'startup', 'file_io_bytes'): 0x10,
+                              ('nonmain', 'startup', 'file_read_ops'): 1,
+                              ('nonmain', 'startup', 'file_read_bytes'): 0x20,
+                              ('nonmain', 'startup', 'file_io_bytes'): 0x20,
+                              ('main', 'normal', 'file_write_ops'): 1,
+                              ('main', 'normal', 'file_write_bytes'): 0x100,
+                              ('main', 'normal', 'file_io_bytes'): 0x100,
+                              # {conn} was opened by a thread of another process
+                              ('nonmain', 'normal', 'net_send_bytes'): 7,
+                              ('nonmain', 'normal', 'net_io_bytes'): 7})
+        self.assertEqual(sorted(files.keys()),
+                         [(OMNIJA, '100 (main)', 'all'),
+                          (OMNIJA, '100 (main)', 'normal'),
+                          (OMNIJA, '100 (main)', 'startup'),
+                          (OMNIJA, '101', 'all'),
+                          (OMNIJA, '101', 'startup')])
+        self.assertEqual(files[(OMNIJA, '100 (main)', 'normal')]['DiskWriteBytes'],
+                         files[(OMNIJA, '100 (main)', 'all')]['DiskWriteBytes'])
+        self.assertTrue(files[(OMNIJA, '101', 'startup')]['DiskReadBytes'] > 0)
+
+    def test_interleaved(self):
+        """parsers don't share state, and take custom aggregators"""
+        first = etlparser.EtlParser(42, [FileCount()])
+        second = etlparser.EtlParser(43, [FileCount(), etlparser.ThreadIO()])
+        for row in self.rows():
+            first.feed(row)
+            second.feed(row)
+        self.assertEqual(first.threads, {'100': 'main'})
+        self.assertEqual(first.aggregators[0].counts, {'main': 2, 'nonmain': 1})
+        self.assertEqual(second.threads, {'200': 'main'})
+        self.assertEqual(second.aggregators[0].counts, {'main': 1})
+        self.assertEqual(second.aggregators[1].io, {('main', 'startup', 'file_write_ops'): 1,
+                                                    ('main', 'startup', 'file_write_bytes'): 0x30,
+                                                    ('main', 'startup', 'file_io_bytes'): 0x30})
+
+    def test_parallel(self):
+        """parsing in chunks in a process pool gives the same result"""
+        serial = etlparser.parseCSV(self.csv_path, 42)
+        for jobs in (2, 3):
+            files, io = etlparser.parseCSV(self.csv_path, 42, jobs)
+            self.assertEqual((files, io), serial)
+            self.assertEqual(files.keys(), serial[0].keys())
+            # the "all" entry of a file is its latest stage's entry
+            self.assertTrue(files[(OMNIJA, '100 (main)', 'all')] is files[(OMNIJA, '100 (main)', 'normal')])
+
+        aggregators = etlparser.parseCSVParallel(self.csv_path, 42, 2, (FileCount,))
+        self.assertEqual(aggregators[0].counts, {'main': 2, 'nonmain': 1})
+
+    def test_chunks(self):
+        """chunks start at row boundaries, with the state of the rows before them"""
+        headers, ranges = etlparser.scanCSV(self.csv_path, 42, 6)
+        self.assertEqual(len(headers), 8)
+        self.assertEqual(ranges[0][0], TRACE.index('T-DCStart, 1'))
+        self.assertEqual(ranges[-1][1], len(TRACE))
+        for start, end, state in ranges:
+            self.assertEqual(TRACE[start - 1], '\n')
+        self.assertEqual(ranges[0][2], ({}, {}, 0))
+        self.assertEqual(ranges[-1][2], ({'100': 'main', '101': 'nonmain'}, {'{conn}': '0', '{sock}': '101'}, 1))
+
+class TestEtlParserWithXperf(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.etl_filename = os.path.join(self.tempdir, 'test.etl')
+        with open(self.etl_filename + '.user', 'w') as f:
+            f.write(TRACE)
+        open(self.etl_filename + '.kernel', 'w').close()
+        self.output = os.path.join(self.tempdir, 'etl_output.csv')
+
+        # a stand-in for xperf that runs in this python
+        self.xperf_path = os.path.join(self.tempdir, 'xperf')
+        with open(self.xperf_path, 'w') as f:
+            f.write('#!/bin/sh\nexec "%s" "%s" "$@"\n' % (sys.executable, fake_xperf))
+        os.chmod(self.xperf_path, stat.S_IRWXU)
+
+        self.upload_dir = os.environ.pop('MOZ_UPLOAD_DIR', None)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        if self.upload_dir is not None:
+            os.environ['MOZ_UPLOAD_DIR'] = self.upload_dir
+
+    def etlparser(self, **kwargs):
+        etlparser.etlparser(self.xperf_path, self.etl_filename, 42, outputFile=self.output, **kwargs)
+        with open(self.output) as f:
+            return f.read()
+
+    def test_piped(self):
+        """the export is parsed from xperf's output, without a CSV file"""
+        output = self.etlparser()
+        self.assertEqual(output, "filename, tid, stage, readcount, readbytes, writecount, writebytes\n"
+                                 "%s, 100 (main), startup, 2, 32, 0, 0\n" % OMNIJA)
+        self.assertFalse(os.path.exists(self.etl_filename + '.csv'))
+        with open(os.path.join(self.tempdir, 'etl_output_thread_stats.csv')) as f:
+            self.assertTrue("main, startup, file_read_bytes, 16\n" in f.read())
+
+    def test_keep_csv(self):
+        """the export can be kept for debugging, serially or in parallel"""
+        piped = self.etlparser(keep_csv=True)
+        with open(self.etl_filename + '.csv') as f:
+            self.assertEqual(f.read(), TRACE)
+        os.remove(self.etl_filename + '.csv')
+
+        self.setUp()
+        self.assertEqual(self.etlparser(jobs=2, keep_csv=True), piped)
+        with open(self.etl_filename + '.csv') as f:
+            self.assertEqual(f.read(), TRACE)
+
+    def test_stop_from_config(self):
+        """the jobs and keep_csv options of parse_xperf.py reach the parser"""
+        config = {'xperf_path': self.xperf_path, 'etl_filename': self.etl_filename,
+                  'outputFile': self.output, 'processID': 42, 'approot': None, 'error_filename': None}
+        calls = []
+        parseCSVParallel = etlparser.parseCSVParallel
+        def parallel(csvname, processID, jobs, *args):
+            calls.append(jobs)
+            return parseCSVParallel(csvname, processID, jobs, *args)
+        etlparser.parseCSVParallel = parallel
+        try:
+            parse_xperf.stop_from_config(config=config, approot=None, error_filename=None, processID=42, jobs=2)
+            self.assertEqual(calls, [2])
+            self.assertFalse(os.path.exists(self.etl_filename + '.csv'))
+
+            # and from the command line of the in process cleanup hook
+            self.setUp()
+            config['etl_filename'] = self.etl_filename
+            config['outputFile'] = self.output
+            config['xperf_path'] = self.xperf_path
+            parse_xperf.talos_cleanup(config, ['-j', '3', '--keep-csv'])
+            self.assertEqual(calls, [2, 3])
+            self.assertTrue(os.path.exists(self.etl_filename + '.csv'))
+        finally:
+            etlparser.parseCSVParallel = parseCSVParallel
+
+if __name__ == '__main__':
+    unittest.main()
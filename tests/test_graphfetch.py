@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+test fetching graph server data concurrently, against a local graph server:
+
+http://hg.mozilla.org/build/talos/file/tip/talos/graphfetch.py
+"""
+
+import BaseHTTPServer
+import json
+import os
+import shutil
+import SocketServer
+import tempfile
+import threading
+import time
+import unittest
+import urlparse
+from talos import compare
+from talos import graphfetch
+
+class GraphServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """a graph server answering /api/test/runs with a run of the value of the test id"""
+
+    daemon_threads = True
+
+    def __init__(self, delay=0):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), GraphHandler)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.requests = []
+        self.connections = 0
+        self.running = 0
+        self.max_running = 0
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def host(self):
+        return '%s:%d' % self.server_address
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class GraphHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        params = dict(urlparse.parse_qsl(self.rfile.read(int(self.headers['Content-Length']))))
+        with self.server.lock:
+            self.server.requests.append((int(params['id']), int(params['branchid']), int(params['platformid'])))
+            self.server.running += 1
+            self.server.max_running = max(self.server.max_running, self.server.running)
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.running -= 1
+
+        if params['id'] == '0':
+            body = json.dumps({'stat': 'fail'})
+        else:
+            body = json.dumps({'stat': 'ok',
+                               'test_runs': [[1, [10, None, 'aaa'], int(time.time()), float(params['id'])]]})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class TestGraphFetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.server = GraphServer()
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tempdir)
+
+    def fetcher(self, **kwargs):
+        fetcher = graphfetch.GraphFetcher(self.server.host, **kwargs)
+        self.addCleanup(fetcher.close)
+        return fetcher
+
+    def test_fetch(self):
+        """each series is requested once, over a kept-alive connection"""
+        fetcher = self.fetcher(jobs=1)
+        data = fetcher.fetch(25, 131, 35)
+        self.assertEqual(data['test_runs'][0][3], 25.)
+        self.assertTrue(fetcher.fetch(25, 131, 35) is data)
+        self.assertEqual(fetcher.fetch(26, 131, 35)['test_runs'][0][3], 26.)
+        self.assertEqual(fetcher.fetch(0, 131, 35), None)
+        self.assertEqual(self.server.requests, [(25, 131, 35), (26, 131, 35), (0, 131, 35)])
+        self.assertEqual(self.server.connections, 1)
+
+    def test_fetch_all(self):
+        """requests run |jobs| at a time, and the same series is only requested once"""
+        self.server.delay = 0.05
+        fetcher = self.fetcher(jobs=4)
+        keys = [(testid, 131, 35) for testid in range(1, 13)]
+        results = fetcher.fetch_all(keys + keys)
+        self.assertEqual(sorted(results.keys()), keys)
+        self.assertEqual([results[key]['test_runs'][0][3] for key in keys], range(1, 13))
+        self.assertEqual(sorted(self.server.requests), keys)
+        self.assertTrue(1 < self.server.max_running <= 4)
+        self.assertTrue(self.server.connections <= 4)
+        self.assertEqual(fetcher.fetch_all([]), {})
+
+    def test_pending(self):
+        """asking for a series while it is being requested waits for that request"""
+        self.server.delay = 0.1
+        fetcher = self.fetcher()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(fetcher.fetch(25, 131, 35))) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.server.requests, [(25, 131, 35)])
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(result is results[0] for result in results))
+
+    def test_cache(self):
+        """responses are kept on disk for |ttl| seconds, failures aren't"""
+        cache_dir = os.path.join(self.tempdir, 'cache')
+        data = self.fetcher(cache_dir=cache_dir).fetch(25, 131, 35)
+        self.assertEqual(self.fetcher(cache_dir=cache_dir).fetch(25, 131, 35), data)
+        self.assertEqual(self.server.requests, [(25, 131, 35)])
+
+        self.fetcher(cache_dir=cache_dir).fetch(0, 131, 35)
+        self.fetcher(cache_dir=cache_dir).fetch(0, 131, 35)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+        # once they expire, they are requested again
+        for filename in os.listdir(cache_dir):
+            old = time.time() - 120
+            os.utime(os.path.join(cache_dir, filename), (old, old))
+        self.fetcher(cache_dir=cache_dir, ttl=60).fetch(25, 131, 35)
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_closed_connection(self):
+        """a kept-alive connection the server closed is replaced"""
+        fetcher = self.fetcher(jobs=1)
+        fetcher.fetch(25, 131, 35)
+        connection, reused = fetcher.pool(self.server.host).acquire()
+        connection.sock.close()
+        fetcher.pool(self.server.host).release(connection)
+        self.assertEqual(fetcher.fetch(26, 131, 35)['test_runs'][0][3], 26.)
+        self.assertEqual(self.server.connections, 2)
+
+class TestCompare(unittest.TestCase):
+
+    def setUp(self):
+        self.server = GraphServer()
+        self.original = compare.fetcher
+        compare.fetcher = graphfetch.GraphFetcher(self.server.host, compare.selector)
+
+    def tearDown(self):
+        compare.fetcher.close()
+        compare.fetcher = self.original
+        self.server.stop()
+
+    def test_compare(self):
+        """the series of all the platforms and tests are fetched once, up front"""
+        platforms = ['Linux', 'Win7']
+        tests = ['tp5o', 'ts_paint', 'tsvgx']
+        compare.compareResults('aaa', 'Try', 'Firefox', 0, 14, platforms, list(tests))
+        expected = set()
+        for p in platforms:
+            test_bid, bid = compare.branchIds(p, 'Try', 'Firefox')
+            for t in tests:
+                expected.add((compare.test_map[t]['id'], bid, compare.platform_map[p]))
+                expected.add((compare.test_map[t]['id'], test_bid, compare.platform_map[p]))
+        self.assertEqual(sorted(self.server.requests), sorted(expected))
+
+    def test_branch_ids(self):
+        self.assertEqual(compare.branchIds('Linux', 'Try', 'Firefox'), (113, 94))
+        self.assertEqual(compare.branchIds('Linux', 'Try', 'Firefox', pgo=True), (23, 1))
+        self.assertEqual(compare.branchIds('Android', 'Inbound', 'Firefox'), (63, 11))
+
+if __name__ == '__main__':
+    unittest.main()
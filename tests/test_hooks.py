@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+test the setup and cleanup hooks:
+
+http://hg.mozilla.org/build/talos/file/tip/talos/hooks.py
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from talos import hooks
+from talos import talosconfig
+from talos.xtalos import start_xperf
+from talos.xtalos import parse_xperf
+
+here = os.path.dirname(os.path.abspath(__file__))
+talos_dir = os.path.join(os.path.dirname(here), 'talos')
+
+HOOK_SCRIPT = """
+import json
+import sys
+from helper import OUTPUT
+
+calls = []
+
+def talos_setup(config, args):
+    calls.append(len(calls))
+    with open(OUTPUT, 'w') as f:
+        json.dump([config, args, calls], f)
+
+if __name__ == '__main__':
+    talos_setup({}, sys.argv[1:])
+"""
+
+PLAIN_SCRIPT = """
+open(%r, 'w').close()
+"""
+
+class TestHooks(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.output = os.path.join(self.tempdir, 'output.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def script(self, name, content):
+        path = os.path.join(self.tempdir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_in_process(self):
+        """a script with a hook function is imported once, and the function called every cycle"""
+        self.script('helper.py', 'OUTPUT = %r\n' % self.output)
+        path = self.script('hook.py', HOOK_SCRIPT)
+        hook = hooks.Hook('setup', '%s -c bcontroller.yml' % path)
+        self.assertTrue(hook.in_process)
+        self.assertFalse(hooks.Hook('cleanup', path).in_process)
+        for cycle in range(2):
+            hook({'processID': 123})
+        with open(self.output) as f:
+            self.assertEqual(json.load(f), [{'processID': 123}, ['-c', 'bcontroller.yml'], [0, 1]])
+        self.assertTrue(hooks.Hook('setup', path).function is hook.function)
+
+    def test_external(self):
+        """a script without hook functions isn't imported, it is run with python"""
+        path = self.script('plain.py', PLAIN_SCRIPT % self.output)
+        self.assertFalse(hooks.Hook('setup', path).in_process)
+        self.assertFalse(os.path.exists(self.output))
+        self.assertFalse(hooks.Hook('setup', os.path.join(self.tempdir, 'missing.py')).in_process)
+
+    def test_failure(self):
+        """a failing hook is reported, it doesn't stop the test"""
+        hook = hooks.Hook('setup', self.script('failing.py', 'def talos_setup(config, args):\n    raise SystemExit(2)\n'))
+        self.assertTrue(hook.in_process)
+        hook({})
+        self.assertFalse(hooks.Hook('setup', self.script('broken.py', 'def talos_setup(\n')).in_process)
+
+    def test_xtalos(self):
+        """the xperf scripts are run in process, as modules of talos"""
+        setup = hooks.Hook('setup', '%s -c bcontroller.yml' % os.path.join(talos_dir, 'xtalos', 'start_xperf.py'))
+        self.assertEqual(setup.function, start_xperf.talos_setup)
+        cleanup = hooks.Hook('cleanup', '%s -c bcontroller.yml' % os.path.join(talos_dir, 'xtalos', 'parse_xperf.py'))
+        self.assertEqual(cleanup.function, parse_xperf.talos_cleanup)
+
+    def test_config(self):
+        """the hooks get what bcontroller.yml would contain"""
+        browser_config = {'browser_path': 'path/to/firefox', 'browser_wait': 5, 'browser_log': 'browser_output.txt',
+                          'child_process': 'plugin-container', 'process': 'firefox', 'test_timeout': 1200,
+                          'error_filename': 'errors', 'webserver': 'localhost',
+                          'bcontroller_config': os.path.join(self.tempdir, 'bcontroller.yml')}
+        config = talosconfig.talosConfig(['firefox', '-profile', 'profile'], dict(browser_config), {})
+        content = talosconfig.generateTalosConfig(['firefox', '-profile', 'profile'], dict(browser_config), {})
+        self.assertEqual(content, ''.join('%s: %s\n' % item for item in config.items()))
+        self.assertEqual(config['command'], 'firefox -profile profile')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+test the main thread I/O log analysis:
+
+http://hg.mozilla.org/build/talos/file/tip/talos/mainthreadio.py
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from talos import mainthreadio
+from talos.results import BrowserLogResults
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+PROFILE = 'C:\\Users\\cltbld\\AppData\\Local\\Temp\\tmpk2rxyz\\profile'
+
+LOG = """0.1,open,0.010,PoisonIOInterposer,C:\\Windows\\System32\\startup.dll
+0.2,NEXT-STAGE
+0.3,read,0.020,PoisonIOInterposer,%(profile)s\\prefs.js
+0.4,read,0.030,PoisonIOInterposer,%(profile)s\\prefs.js
+0.5,stat,0.001,NTFS,C:\\Windows\\System32\\evil.dll
+0.6,open,0.000,PoisonIOInterposer,(not available)
+0.7,open,0.000,PoisonIOInterposer,::\\{leaked-symlink}
+0.8,write,1.500,PoisonIOInterposer,%(profile)s\\places.sqlite
+0.9,NEXT-STAGE
+1.0,write,0.002,PoisonIOInterposer,%(profile)s\\prefs.js""" % {'profile': PROFILE}
+
+DATA = {('normal', 'PoisonIOInterposer', PROFILE + '\\prefs.js', 'read'): {'Count': 2, 'RunCount': 2, 'Duration': 0.05},
+        ('normal', 'NTFS', 'C:\\Windows\\System32\\evil.dll', 'stat'): {'Count': 1, 'RunCount': 1, 'Duration': 0.001},
+        ('normal', 'PoisonIOInterposer', PROFILE + '\\places.sqlite', 'write'): {'Count': 1, 'RunCount': 1, 'Duration': 1.5},
+        ('shutdown', 'PoisonIOInterposer', PROFILE + '\\prefs.js', 'write'): {'Count': 1, 'RunCount': 1, 'Duration': 0.002}}
+
+class TestAnalyzer(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tempdir, 'mainthread_io.log')
+        with open(os.path.join(self.tempdir, 'dependentlibs.list'), 'w') as f:
+            f.write('xul.dll\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def assertData(self, data, expected=DATA):
+        self.assertEqual(sorted(data.keys()), sorted(expected.keys()))
+        for key, value in expected.items():
+            self.assertEqual(data[key]['Count'], value['Count'])
+            self.assertEqual(data[key]['RunCount'], value['RunCount'])
+            self.assertAlmostEqual(data[key]['Duration'], value['Duration'])
+
+    def test_parse(self):
+        """the log is accumulated per stage, event source, file and operation"""
+        with open(self.log, 'w') as f:
+            f.write(LOG)
+        data = mainthreadio.IOData()
+        self.assertTrue(mainthreadio.parse(self.log, data))
+        self.assertData(data)
+        self.assertFalse(mainthreadio.parse(os.path.join(self.tempdir, 'missing.log'), mainthreadio.IOData()))
+
+    def test_feed(self):
+        """the log can be fed in pieces that split lines anywhere"""
+        for size in (1, 7, 64):
+            analyzer = mainthreadio.Analyzer()
+            for start in range(0, len(LOG), size):
+                analyzer.feed(LOG[start:start + size])
+            analyzer.finish()
+            self.assertData(analyzer.data)
+
+    def test_tail(self):
+        """the log is read while it is being written"""
+        analyzer = mainthreadio.Analyzer(mainthreadio.load_whitelist(self.tempdir))
+        analyzer.start_tailing(self.log, interval=0.01)
+        lines = LOG.splitlines(True)
+        with open(self.log, 'w') as f:
+            for line in lines[:5]:
+                f.write(line)
+                f.flush()
+            # wait for the reader to catch up on the first lines
+            for i in range(500):
+                if analyzer.offset == f.tell():
+                    break
+                time.sleep(0.01)
+            self.assertEqual(analyzer.offset, f.tell())
+            for line in lines[5:]:
+                f.write(line)
+        self.assertEqual(len(analyzer.analyze(self.log)), 2)
+        self.assertEqual(analyzer.tail_thread, None)
+        self.assertData(analyzer.data)
+
+    def test_analyze(self):
+        """files that aren't whitelisted are reported"""
+        with open(self.log, 'w') as f:
+            f.write(LOG)
+        wl = mainthreadio.load_whitelist(self.tempdir)
+        self.assertTrue(wl is mainthreadio.load_whitelist(self.tempdir))
+        listmap = dict(wl.listmap)
+
+        analyzer = mainthreadio.Analyzer(wl)
+        errors = analyzer.analyze(self.log)
+        self.assertEqual(sorted(errors), [
+            "TEST-UNEXPECTED-FAIL | mainthreadio | File '%s' was accessed and we were not expecting it: %r" % (
+                'c:\\windows\\system32\\evil.dll', {'Count': 1, 'RunCount': 1, 'Duration': 0.001}),
+            "TEST-UNEXPECTED-FAIL | mainthreadio | File '{profile}\\places.sqlite' was accessed and we were not expecting it: 'Duration 1.5 > 1.0'"])
+        self.assertData(analyzer.data)
+        # the profile location is not remembered across cycles
+        self.assertEqual(wl.listmap, listmap)
+
+        self.assertEqual(mainthreadio.Analyzer(None).analyze(self.log), ["Failed to load whitelist"])
+
+    def test_results(self):
+        """the analyzed data are handed to the test results as they are written out"""
+        analyzer = mainthreadio.Analyzer()
+        analyzer.feed(LOG)
+        analyzer.finish()
+        global_counters = {}
+        browser_log = BrowserLogResults(os.path.join(here, 'browser_output.ts.txt'), global_counters=global_counters,
+                                        mainthread_io=analyzer.data)
+        self.assertTrue(browser_log.using_xperf)
+        output = os.path.join(self.tempdir, 'mainthread_io.json')
+        self.assertTrue(mainthreadio.write_output(output, analyzer.data))
+        with open(output) as f:
+            self.assertEqual(global_counters['mainthreadio'], [f.read()])
+        self.assertEqual(mainthreadio.format_output({}), "[\n]\n")
+
+        global_counters = {}
+        browser_log = BrowserLogResults(os.path.join(here, 'browser_output.ts.txt'), global_counters=global_counters)
+        self.assertFalse(browser_log.using_xperf)
+        self.assertFalse('mainthreadio' in global_counters)
+
+class TestIOData(unittest.TestCase):
+
+    def setUp(self):
+        self.data = mainthreadio.IOData()
+        for key, value in sorted(DATA.items()):
+            self.data.add(mainthreadio.STAGE_STRINGS.index(key[0]), key[1], key[2], key[3],
+                          value['Duration'], value['Count'], value['RunCount'])
+
+    def test_strings(self):
+        """the strings of the keys are kept once"""
+        self.assertEqual(sorted(self.data.strings), sorted(['PoisonIOInterposer', 'NTFS', 'read', 'write', 'stat',
+                                                            PROFILE + '\\prefs.js', PROFILE + '\\places.sqlite',
+                                                            'C:\\Windows\\System32\\evil.dll']))
+        self.assertEqual(len(self.data.counts), 4)
+        # the rows are keyed on the stage and the ids of the strings
+        for key in self.data.rows:
+            self.assertTrue(all(isinstance(value, int) for value in key))
+
+    def test_dict(self):
+        """the data reads like a dict, in the order the keys were added"""
+        self.assertEqual(self.data.keys(), sorted(DATA.keys()))
+        self.assertEqual(len(self.data), 4)
+        key = ('normal', 'NTFS', 'C:\\Windows\\System32\\evil.dll', 'stat')
+        self.assertTrue(key in self.data)
+        self.assertEqual(self.data[key], DATA[key])
+        del self.data[key]
+        self.assertFalse(key in self.data)
+        self.assertEqual(len(self.data), 3)
+        self.assertEqual(self.data.keys(), sorted(k for k in DATA.keys() if k != key))
+        self.assertRaises(KeyError, self.data.__getitem__, key)
+        self.assertRaises(KeyError, self.data.__delitem__, key)
+        self.assertFalse(('normal', 'NTFS', 'C:\\unseen.dll', 'stat') in self.data)
+        self.assertFalse(('later', 'NTFS', 'C:\\Windows\\System32\\evil.dll', 'stat') in self.data)
+
+    def test_binary(self):
+        """the binary form gives back the data, less the deleted keys"""
+        data = mainthreadio.IOData.fromstring(self.data.tostring())
+        self.assertEqual(data.items(), self.data.items())
+        self.assertEqual(data.rows, self.data.rows)
+        self.assertEqual(mainthreadio.format_output(data), mainthreadio.format_output(self.data))
+
+        del self.data[('shutdown', 'PoisonIOInterposer', PROFILE + '\\prefs.js', 'write')]
+        del self.data[('normal', 'PoisonIOInterposer', PROFILE + '\\prefs.js', 'read')]
+        data = mainthreadio.IOData.fromstring(self.data.tostring())
+        self.assertEqual(data.items(), self.data.items())
+        self.assertFalse(PROFILE + '\\prefs.js' in data.strings)
+
+        self.assertEqual(mainthreadio.IOData.fromstring(mainthreadio.IOData().tostring()).items(), [])
+        self.assertRaises(ValueError, mainthreadio.IOData.fromstring, self.data.tostring()[:-1])
+        self.assertRaises(ValueError, mainthreadio.IOData.fromstring, 'XXXX' + self.data.tostring()[4:])
+
+    def test_read_output(self):
+        """data written with the binary extension can be read back"""
+        tempdir = tempfile.mkdtemp()
+        try:
+            output = os.path.join(tempdir, 'mainthread_io' + mainthreadio.BINARY_EXTENSION)
+            self.assertTrue(mainthreadio.write_output(output, self.data))
+            self.assertEqual(mainthreadio.read_output(output).items(), self.data.items())
+            self.assertEqual(mainthreadio.read_output(os.path.join(tempdir, 'missing.mtio')), None)
+            with open(output, 'wb') as f:
+                f.write('[\n]\n')
+            self.assertEqual(mainthreadio.read_output(output), None)
+        finally:
+            shutil.rmtree(tempdir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+test the perfherder and datazilla output formats:
+
+http://hg.mozilla.org/build/talos/file/tip/talos/output.py
+"""
+
+import BaseHTTPServer
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import urllib
+import urlparse
+import zlib
+from talos import filter
+from talos import output
+from talos.results import PageloaderResults, TalosResults, TestResults, TsResults
+
+here = os.path.dirname(os.path.abspath(__file__))
+schema_path = os.path.join(os.path.dirname(here), 'talos', 'perfherder-schema.json')
+
+RESULTS = """_x_x_mozilla_page_load
+_x_x_mozilla_page_load_details
+|i|pagename|runs|
+|0;gearflowers.svg;74;65;68;66;62
+|1;composite-scale.svg;43;44;35;41;41
+|2;composite-scale-opacity.svg;19;16;19;19;21
+"""
+
+TYPES = {'object': dict, 'array': list, 'string': basestring, 'integer': (int, long),
+         'number': (int, long, float), 'boolean': bool, 'null': type(None)}
+
+def validate(test, document, schema, path='document'):
+    """check |document| against the parts of JSON schema perfherder-schema.json uses"""
+    types = schema.get('type', [])
+    types = [types] if isinstance(types, basestring) else types
+    if types:
+        test.assertTrue(any(isinstance(document, TYPES[t]) and not (t in ('integer', 'number') and isinstance(document, bool))
+                            for t in types), "%s is not %s: %r" % (path, types, document))
+    if 'enum' in schema:
+        test.assertTrue(document in schema['enum'], "%s is not one of %s" % (path, schema['enum']))
+    for key in schema.get('required', []):
+        test.assertTrue(key in document, "%s has no %s" % (path, key))
+    for key, value in schema.get('properties', {}).items():
+        if isinstance(document, dict) and key in document:
+            validate(test, document[key], value, '%s.%s' % (path, key))
+    if 'items' in schema:
+        for index, item in enumerate(document):
+            validate(test, item, schema['items'], '%s[%d]' % (path, index))
+
+def talos_results():
+    browser_config = {'branch_name': 'Mozilla-Inbound-Non-PGO', 'sourcestamp': 'abc', 'buildid': '20140601030203',
+                      'browser_name': 'Firefox', 'browser_version': '32.0a1'}
+    results = TalosResults(title='qm-pxp01', date=1234, browser_config=browser_config,
+                           filters=filter.filters_args([['ignore_first', [1]], ['median', []]]))
+
+    tsvg = TestResults({'name': 'tsvgr_opacity', 'test_name_extension': '_paint', 'tpcycles': 1, 'mainthread': False},
+                       global_counters={})
+    tsvg.format = 'tpformat'
+    tsvg.results.append(PageloaderResults(RESULTS))
+    tsvg.all_counter_results.append({'Private Bytes': [100, 200], 'mainthreadio': ['[\n]\n']})
+    tsvg.all_counter_results.append({'Private Bytes': [300]})
+    results.add(tsvg)
+
+    ts = TestResults({'name': 'ts_paint', 'filters': [['median', []]], 'mainthread': False})
+    ts.format = 'tsformat'
+    ts.results.append(TsResults('600|700|800'))
+    results.add(ts)
+    return results
+
+class TestPerfherderOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        with open(schema_path) as f:
+            self.schema = json.load(f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def check_document(self, document):
+        validate(self, document, self.schema)
+        self.assertEqual(document['build']['revision'], 'abc')
+        self.assertEqual(document['machine']['name'], 'qm-pxp01')
+        tsvg, ts = document['suites']
+        self.assertEqual(tsvg['name'], 'tsvgr_opacity')
+        self.assertEqual(tsvg['extension'], '_paint')
+        self.assertEqual(tsvg['options'], {'tpcycles': 1})
+        self.assertEqual([subtest['name'] for subtest in tsvg['subtests']],
+                         ['gearflowers.svg', 'composite-scale.svg', 'composite-scale-opacity.svg'])
+        self.assertEqual(tsvg['subtests'][0]['replicates'], [74, 65, 68, 66, 62])
+        self.assertEqual([subtest['value'] for subtest in tsvg['subtests']], [65.5, 41, 19])
+        # as the graph server shows it: the mean but the max
+        self.assertEqual(tsvg['value'], 30)
+        self.assertEqual(tsvg['counters'], [{'name': 'pbytes', 'value': 200, 'values': [100, 200, 300]}])
+        self.assertEqual(ts['subtests'], [{'name': 'ts_paint', 'value': 700, 'replicates': [600, 700, 800]}])
+        self.assertEqual(ts['value'], 700)
+        self.assertTrue(ts['lower_is_better'])
+
+    def test_file(self):
+        """the document is written to files, gzipped if they end in .gz"""
+        _output = output.PerfherderOutput(talos_results())
+        results = _output()
+        path = os.path.join(self.tempdir, 'perfherder.json')
+        _output.output(results, 'file://' + path, {})
+        with open(path) as f:
+            text = f.read()
+        self.assertFalse('": ' in text or ', ' in text)
+        self.check_document(json.loads(text))
+
+        _output.output(results, 'file://' + path + '.gz', {})
+        with gzip.open(path + '.gz') as f:
+            self.assertEqual(f.read(), text)
+
+        _output = output.PerfherderOutput(talos_results(), perfherder_gzip=True)
+        _output.output(_output(), path, {})
+        with gzip.open(path) as f:
+            self.assertEqual(f.read(), text)
+
+    def test_develop(self):
+        """a develop run without a revision or build id still follows the schema"""
+        results = talos_results()
+        results.browser_config.update({'develop': True, 'sourcestamp': None, 'buildid': None})
+        document = json.loads(''.join(output.PerfherderOutput(results)()))
+        validate(self, document, self.schema)
+        self.assertEqual((document['build']['revision'], document['build']['id']), ('', ''))
+        self.assertEqual(results.browser_config['sourcestamp'], None)
+
+    def test_chunks(self):
+        """the document is written in pieces of about chunk_size"""
+        _output = output.PerfherderOutput(talos_results())
+        _output.chunk_size = 100
+        text = ''.join(_output())
+        chunks = list(_output.encode(_output()))
+        self.assertEqual(''.join(chunks), text)
+        self.assertTrue(len(chunks) > 2)
+        self.assertTrue(all(len(chunk) >= 100 for chunk in chunks[:-1]))
+        self.assertEqual(zlib.decompress(''.join(_output.encode(_output(), gzip=True)), 16 + zlib.MAX_WBITS), text)
+
+    def test_post(self):
+        """the document is posted in chunks, gzipped with perfherder_gzip"""
+        posts = []
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = []
+                while True:
+                    size = int(self.rfile.readline().strip(), 16)
+                    body.append(self.rfile.read(size))
+                    self.rfile.readline()
+                    if not size:
+                        break
+                posts.append((self.path, self.headers.get('Transfer-Encoding'),
+                              self.headers.get('Content-Encoding'), ''.join(body)))
+                self.send_response(200)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write('OK')
+            def log_message(self, *args):
+                pass
+        server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            url = 'http://127.0.0.1:%d/api/talos' % server.server_address[1]
+            tbpl_output = {}
+            _output = output.PerfherderOutput(talos_results())
+            _output.output(_output(), url, tbpl_output)
+            _output = output.PerfherderOutput(talos_results(), perfherder_gzip=True)
+            _output.output(_output(), url, tbpl_output)
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        self.assertEqual([post[:3] for post in posts], [('/api/talos', 'chunked', None), ('/api/talos', 'chunked', 'gzip')])
+        self.check_document(json.loads(posts[0][3]))
+        self.assertEqual(zlib.decompress(posts[1][3], 16 + zlib.MAX_WBITS), posts[0][3])
+        self.assertEqual(tbpl_output, {'perfherder': {url: {'status': 200}}})
+
+    def test_generated_once(self):
+        """the same chunks go to every URL and retry, the document is generated once"""
+        _output = output.PerfherderOutput(talos_results())
+        document = _output.document
+        generated = []
+        def generate():
+            generated.append(True)
+            return document()
+        _output.document = generate
+        results = _output()
+
+        bodies = []
+        def post_chunked(results, server, path, scheme):
+            bodies.append(''.join(_output.encode(results, _output.gzip)))
+            return (500, 'Internal Server Error', '') if len(bodies) == 1 else (200, 'OK', '')
+        _output.post_chunked = post_chunked
+        sleep = output.time.sleep
+        output.time.sleep = lambda seconds: None
+        try:
+            _output.output(results, 'http://127.0.0.1/api/talos', {})
+        finally:
+            output.time.sleep = sleep
+        path = os.path.join(self.tempdir, 'perfherder.json')
+        _output.output(results, 'file://' + path, {})
+        with open(path) as f:
+            bodies.append(f.read())
+
+        self.assertEqual(len(generated), 1)
+        self.assertEqual(len(bodies), 3)
+        self.assertEqual(set(bodies), set([''.join(results)]))
+        self.check_document(json.loads(bodies[0]))
+
+    def test_format(self):
+        self.assertTrue(output.formats['perfherder_urls'] is output.PerfherderOutput)
+
+class TestDatazillaOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_payload(self):
+        """the datasets are those dzclient gave, serialized once"""
+        results = talos_results()
+        results.browser_config['develop'] = False
+        payload = output.DatazillaOutput(results)()
+        tsvg, ts = payload.datasets
+        self.assertEqual(tsvg['testrun'], {'date': 1234, 'suite': 'tsvgr_opacity', 'options': {'tpcycles': 1}})
+        self.assertEqual(tsvg['test_build'], {'name': 'Firefox', 'version': '32.0a1', 'revision': 'abc',
+                                              'branch': 'Mozilla-Inbound-Non-PGO', 'id': '20140601030203'})
+        self.assertEqual(tsvg['test_machine']['name'], 'qm-pxp01')
+        self.assertEqual(tsvg['results']['gearflowers.svg'], [74, 65, 68, 66, 62])
+        self.assertEqual(tsvg['talos_aux'], {'Private Bytes': [100, 200, 300], 'mainthreadio': ['[\n]\n']})
+        self.assertEqual(ts['results'], {'ts_paint': [600, 700, 800]})
+        self.assertFalse('talos_aux' in ts or 'options' in ts['testrun'])
+
+        self.assertTrue(payload.dataset_json is payload.dataset_json)
+        self.assertEqual([json.loads(data) for data in payload.dataset_json], payload.datasets)
+        talosdata, left_out = payload.talosdata()
+        self.assertEqual((talosdata, left_out), (json.dumps(payload.datasets), 0))
+        self.assertEqual(payload.talosdata(len(payload.dataset_json[0]) + 2), ('[%s]' % payload.dataset_json[0], 1))
+        self.assertEqual(payload.talosdata(10), ('[]', 2))
+
+        path = os.path.join(self.tempdir, 'datazilla.json')
+        _output = output.DatazillaOutput(results)
+        logged = []
+        info = output.utils.info
+        output.utils.info = lambda message, *args: logged.append(message % args)
+        try:
+            _output.output(payload, 'file://' + path, {})
+            with open(path) as f:
+                self.assertEqual(f.read(), json.dumps(payload.datasets, indent=2, sort_keys=True))
+            self.assertEqual(len([message for message in logged if message.startswith('TALOSDATA')]), 1)
+
+            # a local copy only writes the file
+            del logged[:]
+            _output.write_file(payload, path + '.copy')
+        finally:
+            output.utils.info = info
+        self.assertEqual(logged, [])
+        with open(path + '.copy') as f:
+            self.assertEqual(f.read(), json.dumps(payload.datasets, indent=2, sort_keys=True))
+
+    def test_json_once(self):
+        """the JSON is built once, however many output threads ask for it at once"""
+        results = talos_results()
+        results.browser_config['develop'] = False
+        payload = output.DatazillaOutput(results)()
+        dumps = output.json.dumps
+        calls = []
+        def slow_dumps(*args, **kwargs):
+            calls.append(args[0])
+            time.sleep(0.01)
+            return dumps(*args, **kwargs)
+        output.json.dumps = slow_dumps
+        try:
+            threads = [threading.Thread(target=lambda: (payload.dataset_json, payload.file_json))
+                       for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            output.json.dumps = dumps
+        self.assertEqual(len(calls), len(payload.datasets) + 1)
+
+    def test_post(self):
+        """each dataset is posted as dzclient posted it"""
+        posts = []
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                posts.append((self.path, dict(urlparse.parse_qsl(body))))
+                self.send_response(200)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write('OK')
+            def log_message(self, *args):
+                pass
+        server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            results = talos_results()
+            results.browser_config['develop'] = False
+            _output = output.DatazillaOutput(results, datazilla_no_log=True)
+            _output.oauth = {'talos': {'oauthKey': 'key', 'oauthSecret': 'secret'}}
+            payload = _output()
+            _output.output(payload, 'http://127.0.0.1:%d/talos' % server.server_address[1], {})
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        self.assertEqual([path for path, params in posts], ['/talos/api/load_test'] * 2)
+        self.assertEqual([json.loads(urllib.unquote(params['data'])) for path, params in posts], payload.datasets)
+        self.assertEqual(posts[0][1]['oauth_consumer_key'], 'key')
+        self.assertTrue(posts[0][1]['oauth_signature'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+test evicting the browser's files from the page cache for cold startups:
+
+http://hg.mozilla.org/build/talos/file/tip/talos/startup_test/cold/pagecache.py
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from talos.startup_test.cold import pagecache
+from talos.startup_test.cold import setup
+
+SIZE = 256 * 1024
+
+@unittest.skipUnless(pagecache.supported(), "the page cache is only evicted on Linux")
+class TestPageCache(unittest.TestCase):
+
+    def setUp(self):
+        # not in /tmp, which may be a tmpfs that is never evicted
+        self.tempdir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(__file__)))
+        self.browser = os.path.join(self.tempdir, 'firefox')
+        self.profile = os.path.join(self.tempdir, 'profile')
+        os.makedirs(os.path.join(self.browser, 'browser'))
+        os.makedirs(self.profile)
+        self.filenames = [os.path.join(self.browser, 'libxul.so'),
+                          os.path.join(self.browser, 'browser', 'omni.ja'),
+                          os.path.join(self.profile, 'prefs.js')]
+        for filename in self.filenames:
+            with open(filename, 'wb') as f:
+                f.write(os.urandom(SIZE))
+        os.symlink(self.filenames[0], os.path.join(self.profile, 'libxul.so'))
+        os.mkfifo(os.path.join(self.profile, 'fifo'))
+        with open(os.path.join(self.profile, 'empty'), 'w'):
+            pass
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def load(self):
+        for filename in self.filenames:
+            with open(filename, 'rb') as f:
+                f.read()
+        return pagecache.residency(self.filenames)
+
+    def test_resident_bytes(self):
+        """mincore tells what was just read is resident"""
+        self.load()
+        self.assertEqual(pagecache.resident_bytes(self.filenames[0]), SIZE)
+        self.assertEqual(pagecache.resident_bytes(os.path.join(self.profile, 'empty')), 0)
+
+    def test_files(self):
+        """the regular files are evicted, symbolic links aren't followed"""
+        self.assertEqual(sorted(pagecache.files([self.browser, self.profile])),
+                         sorted(self.filenames + [os.path.join(self.profile, 'empty')]))
+        self.assertEqual(list(pagecache.files([self.filenames[0]])), [self.filenames[0]])
+
+    def test_evict(self):
+        """the files are evicted, and what is left is measured"""
+        resident = self.load()
+        eviction = pagecache.evict([self.browser, self.profile], allow_drop_caches=False)
+        self.assertEqual(eviction.files, 4)
+        self.assertEqual(eviction.size, 3 * SIZE)
+        self.assertEqual(eviction.resident_before, resident)
+        self.assertEqual(eviction.resident_after, pagecache.residency(self.filenames))
+        self.assertEqual(eviction.evicted, resident - eviction.resident_after)
+        self.assertEqual(eviction.resident_after, 0)
+        self.assertFalse(eviction.dropped_caches)
+
+    def test_setup_hook(self):
+        """ts_paint_cold's setup evicts the install directory and the profile, and records counters"""
+        self.load()
+        config = {'browser_path': os.path.join(self.browser, 'firefox'), 'profile_dir': self.profile}
+        counters = setup.talos_setup(config, ['--no-drop-caches'])
+        self.assertEqual(sorted(counters.keys()), ['cold_evict_time', 'cold_evicted_bytes', 'cold_resident_bytes'])
+        self.assertEqual(counters['cold_evicted_bytes'], 3 * SIZE)
+        self.assertEqual(counters['cold_resident_bytes'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+test the file name matching shared by the xperf and main thread I/O whitelists:
+
+http://hg.mozilla.org/build/talos/file/tip/talos/xtalos/pathmatch.py
+"""
+
+import json
+import ntpath
+import os
+import unittest
+from talos import mainthreadio
+from talos.xtalos import etlparser
+from talos.xtalos import pathmatch
+
+here = os.path.dirname(os.path.abspath(__file__))
+talos_dir = os.path.join(os.path.dirname(here), 'talos')
+
+PROFILE = 'C:\\Users\\cltbld\\AppData\\Local\\Temp\\tmpk2rxyz\\profile'
+XRE = 'C:\\Program Files (x86)\\Mozilla Firefox'
+FILENAMES = [PROFILE + '\\prefs.js',
+             PROFILE + '\\extensions\\pageloader@mozilla.org\\chrome.manifest',
+             PROFILE + '\\thumbnails\\0123abcd.png',
+             XRE + '\\omni.ja',
+             XRE + '\\browser\\omni.ja',
+             XRE + '\\Crash Reports\\InstallTime20140101',
+             'C:\\Windows\\Prefetch\\FIREFOX.EXE-1234ABCD.pf',
+             'C:\\Program Files\\Windows Media Player\\wmpnetwk.exe',
+             'C:\\talos-slave\\talos-data\\talos\\page_load_test\\tp5n\\tp5n.manifest',
+             'C:\\Users\\cltbld\\Desktop\\desktop.ini',
+             'C:\\Users\\cltbld\\AppData\\Roaming\\Mozilla\\Firefox\\Profiles\\x.default\\prefs.js',
+             'C:\\Windows\\Fonts\\ARIAL.TTF',
+             'C:\\',
+             '']
+
+def substitute(filename, pathSubstitutions, nameSubstitutions):
+    """how whitelist.py used to rewrite file names, one substitution at a time"""
+    for path, subst in pathSubstitutions:
+        parts = filename.split(path)
+        if len(parts) >= 2:
+            filename = "%s%s" % (subst, path.join(parts[1:]))
+    for old_name, new_name in nameSubstitutions:
+        parts = filename.split(old_name)
+        if len(parts) >= 2:
+            filename = "%s%s" % (parts[0], new_name)
+    return filename
+
+def checkWhitelist(filename, whitelist):
+    """how etlparser used to match file names against the xperf whitelist"""
+    if filename in whitelist[0]:
+        return True
+    if ntpath.dirname(filename) in whitelist[1]:
+        return True
+    head = filename
+    while len(head) > 3: # Length 3 implies root directory, e.g. C:\
+        head, tail = ntpath.split(head)
+        if head in whitelist[2]:
+            return True
+    return False
+
+class TestPathNormalizer(unittest.TestCase):
+
+    def filenames(self, whitelist):
+        """file names to check: the shipped whitelist's entries, and ones
+        that look like the files they match"""
+        with open(whitelist) as f:
+            entries = json.load(f).keys()
+        filenames = list(FILENAMES)
+        for entry in entries:
+            filenames.append(entry)
+            filenames.append(entry.replace('{profile}', PROFILE).replace('{xre}', XRE)
+                                  .replace('{firefox}', XRE).replace('{time}', 'InstallTime2014')
+                                  .replace('{prefetch}', 'FIREFOX.EXE-1234'))
+        return filenames
+
+    def test_mainthreadio(self):
+        """main thread I/O file names are rewritten as they were one substitution at a time"""
+        path_substitutions = mainthreadio.PATH_SUBSTITUTIONS.items()
+        name_substitutions = mainthreadio.NAME_SUBSTITUTIONS.items()
+        normalizer = pathmatch.PathNormalizer(path_substitutions, name_substitutions, strip='/\\ \t')
+        for filename in self.filenames(mainthreadio.WHITELIST_FILENAME):
+            expected = substitute(filename.lower(), path_substitutions, name_substitutions).strip('/\\ \t')
+            self.assertEqual(normalizer.normalize(filename), expected)
+            self.assertEqual(normalizer.normalize(filename), expected)
+        self.assertEqual(normalizer.normalize(PROFILE + '\\Thumbnails\\0123abcd.png'), '{profile}\\{thumbnails}')
+
+    def test_xperf(self):
+        """xperf file names are rewritten as they were one substitution at a time"""
+        normalizer = pathmatch.PathNormalizer(etlparser.WHITELIST_PATH_SUBSTITUTIONS,
+                                              etlparser.WHITELIST_NAME_SUBSTITUTIONS,
+                                              etlparser.WHITELIST_REMOVALS)
+        for filename in self.filenames(os.path.join(talos_dir, 'xtalos', 'xperf_whitelist.json')):
+            expected = substitute(filename.lower().replace(' (x86)', ''),
+                                  etlparser.WHITELIST_PATH_SUBSTITUTIONS,
+                                  etlparser.WHITELIST_NAME_SUBSTITUTIONS)
+            self.assertEqual(normalizer.normalize(filename), expected)
+        self.assertEqual(normalizer.normalize(XRE + '\\omni.ja'), '{firefox}\\omni.ja')
+        self.assertEqual(normalizer.normalize('C:\\Windows\\Prefetch\\FIREFOX.EXE-1234ABCD.pf'),
+                         'c:\\windows\\prefetch\\{prefetch}.pf')
+
+    def test_overlapping_replacement(self):
+        """replacements that later substitutions would rewrite are refused"""
+        self.assertRaises(ValueError, pathmatch.PathNormalizer, [('b', '{ab}'), ('a', '{a}')])
+        self.assertRaises(ValueError, pathmatch.PathNormalizer, [('b', '{ab}')], [('a', '{a}')])
+        pathmatch.PathNormalizer([('a', '{a}'), ('b', '{ab}')])
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_eviction(self):
+        """the least recently used entries are forgotten first"""
+        cache = pathmatch.LRUCache(4)
+        for name in 'abcd':
+            cache[name] = name.upper()
+        self.assertEqual(cache.get('a'), 'A')
+        cache['e'] = 'E'
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(sorted(cache.entries.keys()), ['a', 'd', 'e'])
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('b', False), False)
+
+    def test_normalizer_cache(self):
+        """a normalizer gives the same answers once its cache overflows"""
+        normalizer = pathmatch.PathNormalizer(etlparser.WHITELIST_PATH_SUBSTITUTIONS,
+                                              etlparser.WHITELIST_NAME_SUBSTITUTIONS,
+                                              cacheSize=3)
+        expected = [normalizer.normalize(filename) for filename in FILENAMES]
+        self.assertEqual([normalizer.normalize(filename) for filename in FILENAMES], expected)
+        self.assertTrue(len(normalizer.cache) <= 3)
+
+class TestPathTrie(unittest.TestCase):
+
+    def test_match(self):
+        """files, directories and trees match as they did with os.path on Windows"""
+        files = ['C:\\Windows\\System32\\ntdll.dll', PROFILE + '\\prefs.js']
+        dirs = ['C:\\Windows\\Fonts', XRE]
+        trees = ['C:\\Program Files\\Common Files', PROFILE + '\\cache2']
+        whitelist = pathmatch.PathTrie(files, dirs, trees)
+        filenames = FILENAMES + files + dirs + trees + [
+            'C:\\Windows\\System32\\kernel32.dll',
+            'C:\\Windows\\Fonts\\Sub\\ARIAL.TTF',
+            'C:\\Program Files\\Common Files\\a\\b\\c.dll',
+            'C:\\Program Files\\Common Filesystem\\c.dll',
+            PROFILE + '\\cache2\\entries\\0123',
+            PROFILE + '\\cache2.tmp']
+        for filename in filenames:
+            expected = checkWhitelist(filename, (set(files), set(dirs), set(trees)))
+            self.assertEqual(filename in whitelist, expected, filename)
+            self.assertEqual(whitelist.match(filename), expected, filename)
+
+        # Windows file names aren't case sensitive
+        self.assertTrue('c:\\windows\\fonts\\arial.ttf' in whitelist)
+        self.assertTrue('C:/Windows/System32/NTDLL.DLL' in whitelist)
+
+    def test_load(self):
+        """etlparser builds the trie from an xperf whitelist file"""
+        whitelist_file = os.path.join(here, 'xperf', 'whitelist.txt')
+        whitelist = etlparser.loadWhitelist(whitelist_file)
+        self.assertTrue(etlparser.checkWhitelist('C:\\Windows\\Fonts\\ARIAL.TTF', whitelist))
+        self.assertTrue(etlparser.checkWhitelist('C:\\Windows\\WinSxS\\x86\\a\\b.dll', whitelist))
+        self.assertTrue(etlparser.checkWhitelist('C:\\$Mft', whitelist))
+        self.assertFalse(etlparser.checkWhitelist('C:\\Windows\\Fonts\\a\\b.ttf', whitelist))
+        self.assertFalse(etlparser.checkWhitelist('C:\\Windows\\WinSxS', whitelist))
+        self.assertFalse(etlparser.checkWhitelist('C:\\$Mft', None))
+
+if __name__ == '__main__':
+    unittest.main()
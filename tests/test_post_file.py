@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+test the streamed, gzipped and batched multipart posts to the graph server,
+against a local stand-in graph server:
+
+http://hg.mozilla.org/build/talos/file/tip/talos/post_file.py
+"""
+
+import unittest
+import zlib
+import mozhttpd
+from talos import output
+from talos import post_file
+from test_output import talos_results
+
+class FakeGraphServer(object):
+    """
+    a graph server collecting the data_string files of multipart posts, and
+    answering a RETURN line for each; it refuses gzip unless |gzip|
+    """
+
+    def __init__(self, gzip=True):
+        self.gzip = gzip
+        self.posts = [] # (Content-Encoding, [data strings])
+        self.httpd = mozhttpd.MozHttpd(port=0, urlhandlers=[
+            {'method': 'POST', 'path': '/server/collect.cgi', 'function': self.collect}])
+        self.httpd.start(block=False)
+        self.host = '127.0.0.1:%d' % self.httpd.httpd.server_address[1]
+
+    def stop(self):
+        self.httpd.stop()
+
+    def collect(self, request):
+        encoding = request.headers.get('Content-Encoding')
+        if encoding == 'gzip' and not self.gzip:
+            return (415, {}, 'gzip not supported')
+        body = request.body
+        if encoding == 'gzip':
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+
+        # the files of the multipart body
+        boundary = request.headers['Content-Type'].split('boundary=', 1)[1]
+        parts = body.split('--%s' % boundary)
+        assert parts[0] == '' and parts[-1] == '--\r\n', "bad multipart body"
+        data_strings = []
+        for part in parts[1:-1]:
+            headers, value = part.split('\r\n\r\n', 1)
+            assert 'name="filename"; filename="data_string"' in headers
+            assert value.endswith('\r\n')
+            data_strings.append(value[:-2])
+        self.posts.append((encoding, data_strings))
+
+        lines = []
+        for data_string in data_strings:
+            start, _type, info = data_string.splitlines()[:3]
+            testname = info.split(',')[1]
+            lines.append('RETURN\t%s\t42.00\tgraph.html#tests=[[%s]]' % (testname, len(self.posts)))
+        return (200, {}, '\n'.join(lines) + '\n')
+
+class TestPostFile(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeGraphServer()
+        post_file.gzip_refused.clear()
+
+    def tearDown(self):
+        self.server.stop()
+        post_file.gzip_refused.clear()
+
+    def test_encoding(self):
+        """the streamed body is that of the whole body of before"""
+        fields = [('a', '1'), ('b', 'two')]
+        files = [('filename', 'data_string', 'START\nVALUES\n'), ('filename', 'results.json', '{}')]
+        CRLF = '\r\n'
+        L = []
+        for (key, value) in fields:
+            L.extend(['--' + post_file.BOUNDARY, 'Content-Disposition: form-data; name="%s"' % key, '', value])
+        for (key, filename, value) in files:
+            L.extend(['--' + post_file.BOUNDARY,
+                      'Content-Disposition: form-data; name="%s"; filename="%s"' % (key, filename),
+                      'Content-Type: %s' % post_file.get_content_type(filename), '', value])
+        L.extend(['--' + post_file.BOUNDARY + '--', ''])
+        self.assertEqual(post_file.encode_multipart_formdata(fields, files)[1], CRLF.join(L))
+
+        pieces = list(post_file.chunks(post_file.iter_multipart_formdata(fields, files), size=100))
+        self.assertEqual(''.join(pieces), CRLF.join(L))
+        self.assertTrue(len(pieces) > 1)
+        self.assertTrue(all(len(piece) >= 100 for piece in pieces[:-1]))
+        self.assertEqual(zlib.decompress(''.join(post_file.gzip_chunks(pieces)), 16 + zlib.MAX_WBITS), CRLF.join(L))
+
+    def test_gzip(self):
+        """the posts are gzipped if asked, and sent again as is to a server refusing gzip"""
+        files = [('filename', 'data_string', 'START\nAVERAGE\nqm-pxp01,ts_paint,b,c,d,1\n700\nEND')]
+        response = post_file.post_multipart(self.server.host, '/server/collect.cgi', files=files, gzip=True)
+        self.assertTrue(response.startswith('RETURN\tts_paint\t42.00'))
+        self.assertEqual(self.server.posts, [('gzip', [files[0][2]])])
+
+        self.server.gzip = False
+        del self.server.posts[:]
+        post_file.post_multipart(self.server.host, '/server/collect.cgi', files=files, gzip=True)
+        post_file.post_multipart(self.server.host, '/server/collect.cgi', files=files, gzip=True)
+        self.assertEqual(self.server.posts, [(None, [files[0][2]]), (None, [files[0][2]])])
+        self.assertEqual(post_file.gzip_refused, set([self.server.host]))
+
+    def test_graphserver_output(self):
+        """the graphserver results are posted in batches, with a link for each"""
+        for batch, gzip in ((1, False), (2, True), (10, True)):
+            del self.server.posts[:]
+            _output = output.GraphserverOutput(talos_results(), results_gzip=gzip, results_batch=batch)
+            results = _output()
+            tbpl_output = {}
+            _output.output(results, 'http://%s/server/collect.cgi' % self.server.host, tbpl_output)
+
+            self.assertEqual([data_strings for encoding, data_strings in self.server.posts],
+                             [results[i:i + batch] for i in range(0, len(results), batch)])
+            self.assertEqual(set(encoding for encoding, data_strings in self.server.posts),
+                             set(['gzip' if gzip else None]))
+            self.assertEqual(set(tbpl_output['graphserver'].keys()),
+                             set(result.splitlines()[2].split(',')[1] for result in results))
+
+    def test_split_links(self):
+        links = ('tsvgr_opacity\tgraph.html#tests=[[1]]\ntsvgr_opacity\t30.00\tgraph.html#tests=[[1]]\n'
+                 'ts_paint\t700.00\tgraph.html#tests=[[2]]\n')
+        self.assertEqual(output.GraphserverOutput.split_links(links),
+                         ['tsvgr_opacity\tgraph.html#tests=[[1]]\ntsvgr_opacity\t30.00\tgraph.html#tests=[[1]]\n',
+                          'ts_paint\t700.00\tgraph.html#tests=[[2]]\n'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+test talos' SPS profile archive writer:
+
+http://hg.mozilla.org/build/talos/file/tip/talos/profiler/profileArchive.py
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from talos.profiler.profileArchive import ProfileArchive
+
+class TestProfileArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.profile_path = os.path.join(self.tempdir, 'profile.sps')
+        self.archive_path = os.path.join(self.tempdir, 'profile_test.sps.zip')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def write_profile(self, contents):
+        with open(self.profile_path, 'wb') as f:
+            f.write(contents)
+
+    def test_cycles(self):
+        """profiles of all cycles end up in one valid archive"""
+        contents = ['{"cycle": %d, "samples": [%s]}' % (i, ','.join(['1'] * 10000 * i)) for i in range(3)]
+        archive = ProfileArchive(self.archive_path)
+        for i, data in enumerate(contents):
+            self.write_profile(data)
+            archive.add(self.profile_path, 'profile_test/page/cycle_%d.sps' % i)
+            # the profile was taken over, so the next cycle can reuse its name
+            self.assertFalse(os.path.exists(self.profile_path))
+        self.assertTrue('profile_test/page/cycle_1.sps' in archive)
+        self.assertFalse('profile_test/page/cycle_3.sps' in archive)
+        self.assertRaises(ValueError, archive.add, self.profile_path, 'profile_test/page/cycle_0.sps')
+        archive.close()
+
+        arc = zipfile.ZipFile(self.archive_path)
+        self.assertEqual(arc.testzip(), None)
+        self.assertEqual(arc.namelist(), ['profile_test/page/cycle_%d.sps' % i for i in range(3)])
+        for i, data in enumerate(contents):
+            self.assertEqual(arc.read('profile_test/page/cycle_%d.sps' % i), data)
+        arc.close()
+
+    def test_compression_level(self):
+        """the compression level can be traded for speed"""
+        data = ''.join('{"location": "function_%d", "line": %d}' % ((i * 7919) % 700, i) for i in range(20000))
+        sizes = {}
+        for level in (0, 1, 9, -1):
+            self.write_profile(data)
+            archive = ProfileArchive(self.archive_path, level)
+            archive.add(self.profile_path, 'cycle_0.sps')
+            self.write_profile(data[::-1])
+            archive.add(self.profile_path, 'cycle_1.sps')
+            archive.close()
+            arc = zipfile.ZipFile(self.archive_path)
+            self.assertEqual(arc.testzip(), None)
+            self.assertEqual(arc.read('cycle_0.sps'), data)
+            self.assertEqual(arc.read('cycle_1.sps'), data[::-1])
+            sizes[level] = arc.getinfo('cycle_0.sps').compress_size
+            arc.close()
+        self.assertTrue(sizes[9] < sizes[0] / 5)
+        # the levels aren't all zlib's default
+        self.assertTrue(sizes[9] < sizes[1])
+        self.assertRaises(ValueError, ProfileArchive, self.archive_path, 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+test the detection of performance changes:
+
+http://hg.mozilla.org/build/talos/file/tip/talos/regression.py
+"""
+
+import random
+import sys
+import time
+import unittest
+from StringIO import StringIO
+from talos import compare
+from talos import regression
+
+def runs(means, start=0, sigma=1., seed=0):
+    """a run of each push, with the values of |means| for each of them, starting at date |start|"""
+    rand = random.Random(seed)
+    return [(start + i * 100, 'rev%d' % i, rand.gauss(mean, sigma)) for i, mean in enumerate(means)]
+
+class TestStatistics(unittest.TestCase):
+
+    def test_welch(self):
+        """the t value, degrees of freedom and p-value are those of scipy.stats.ttest_ind(a, b, equal_var=False)"""
+        t, df, p = regression.welch_ttest([1, 2, 3, 4, 5], [2, 4, 6, 8, 10])
+        self.assertAlmostEqual(t, 1.897367, places=5)
+        self.assertAlmostEqual(df, 5.882353, places=5)
+        self.assertAlmostEqual(p, 0.107531, places=5)
+        self.assertEqual(regression.welch_ttest([1, 1], [1, 1])[2], 1.)
+        self.assertEqual(regression.welch_ttest([1, 1], [2, 2])[2], 0.)
+        self.assertRaises(ValueError, regression.welch_ttest, [1], [1, 2])
+
+    def test_prediction(self):
+        t, p = regression.prediction_ttest([1, 2, 3, 4, 5], 9)
+        self.assertAlmostEqual(t, 6 / (2.5 ** 0.5 * 1.2 ** 0.5))
+        self.assertAlmostEqual(p, regression.t_pvalue(t, 4))
+        self.assertEqual(regression.prediction_ttest([1, 1], 1), (0., 1.))
+
+    def test_pvalue(self):
+        self.assertAlmostEqual(regression.t_pvalue(2., 10), 0.073388, places=5)
+        self.assertAlmostEqual(regression.t_pvalue(0., 10), 1.)
+        self.assertAlmostEqual(regression.normal_pvalue(1.959964), 0.05, places=5)
+
+    def test_mann_whitney(self):
+        """U and the p-value are those of scipy.stats.mannwhitneyu(a, b, alternative='two-sided')"""
+        u, p = regression.mann_whitney_u([1, 2, 3], [4, 5, 6])
+        self.assertEqual(u, 0)
+        self.assertAlmostEqual(p, 0.080856, places=5)
+        u, p = regression.mann_whitney_u([1, 2, 2, 3], [2, 3, 3, 4, 5])
+        self.assertEqual(u, 3)
+        self.assertAlmostEqual(p, 0.099342, places=5)
+        self.assertEqual(regression.ranks([3, 1, 3, 2]), ([3.5, 1., 3.5, 2.], [2]))
+
+    def test_differs(self):
+        self.assertFalse(regression.differs([value for date, revision, value in runs([100] * 20)],
+                                            [value for date, revision, value in runs([100] * 5, seed=1)]))
+        self.assertTrue(regression.differs([value for date, revision, value in runs([100] * 20)],
+                                           [value for date, revision, value in runs([110] * 5, seed=1)]))
+        # a single value is tested against the prediction interval
+        self.assertTrue(regression.differs(range(100, 120), [130]))
+        self.assertFalse(regression.differs(range(100, 120), [115]))
+        self.assertFalse(regression.differs(range(100, 120), [130], test='mannwhitney'))
+        self.assertTrue(regression.differs(range(100, 120), range(125, 135), test='mannwhitney'))
+
+class TestChanges(unittest.TestCase):
+
+    def test_pushes(self):
+        """runs of a push are averaged, in date order"""
+        self.assertEqual(regression.pushes([(300, 'b', 3.), (100, 'a', 1.), (200, 'a', 2.)]),
+                         [('a', 100, 1.5), ('b', 300, 3.)])
+
+    def test_t_values(self):
+        """the running t values are those of welch_ttest() on the windows"""
+        values = [value for date, revision, value in runs([100] * 10 + [105] * 10)]
+        ts = regression.t_values(values, back=5, fore=4)
+        self.assertEqual(ts[:3], [None] * 3)
+        self.assertEqual(ts[-2:], [None] * 2)
+        for i in range(3, 18):
+            self.assertAlmostEqual(ts[i], regression.welch_ttest(values[max(i - 5, 0):i], values[i:i + 4])[0])
+        self.assertEqual(regression.t_values([]), [])
+
+    def test_detect(self):
+        """a change is found at the push it happened, and tells if it is a regression"""
+        history = runs([100] * 30 + [110] * 30 + [104] * 30)
+        changes = regression.detect_changes(history)
+        self.assertEqual([change.revision for change in changes], ['rev30', 'rev60'])
+        self.assertTrue(changes[0].regression)
+        self.assertAlmostEqual(changes[0].percent, 10., places=0)
+        self.assertFalse(changes[1].regression)
+
+        changes = regression.detect_changes(history, lower_is_better=False)
+        self.assertEqual([change.regression for change in changes], [False, True])
+
+        # noise alone isn't a change
+        self.assertEqual(regression.detect_changes(runs([100] * 90, sigma=5.)), [])
+        self.assertEqual(regression.detect_changes(runs([100] * 90, sigma=0.)), [])
+
+    def test_reverse_tests(self):
+        """which tests are better higher comes from test.py"""
+        self.assertEqual(sorted(compare.reverse_tests), ['dromaeo_css', 'dromaeo_dom', 'tcanvasmark', 'v8_7'])
+        self.assertTrue(compare.lowerIsBetter('remote-tsvgx'))
+        self.assertTrue(compare.lowerIsBetter('unknown'))
+
+class TestMain(unittest.TestCase):
+
+    def test_main(self):
+        """the changes of each series and the difference of the revision are reported"""
+        now = int(time.time())
+        history = runs([100] * 30 + [110] * 30 + [110.5] * 3, start=now - 100 * 63)
+        requests = []
+        def getGraphData(testid, branchid, platformid, store=None, series=None):
+            requests.append((testid, branchid, platformid))
+            return {'stat': 'ok', 'test_runs': [[i, [i, None, revision], date, value]
+                                                for i, (date, revision, value) in enumerate(history)]}
+        original, compare.getGraphData = compare.getGraphData, getGraphData
+        originalPrefetch, compare.prefetchGraphData = compare.prefetchGraphData, lambda *args, **kwargs: None
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            regression.main(['--platform', 'Linux', '--testname', 'tp5o', '--testname', 'v8_7', '--revision', 'rev30'])
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+            compare.getGraphData = original
+            compare.prefetchGraphData = originalPrefetch
+        self.assertEqual(requests, [(255, 131, 33), (230, 131, 33)])
+        lines = output.splitlines()
+        self.assertEqual(lines[0], 'Linux:')
+        self.assertTrue(lines[1].startswith('   :( tp5o') and 'rev30' in lines[1])
+        self.assertTrue(lines[2].startswith('   :( tp5o') and 'rev30 differs from the 30 runs before it' in lines[2])
+        self.assertTrue(lines[3].startswith('   :) v8_7') and 'rev30' in lines[3])
+        self.assertEqual(len(lines), 5)
+
+if __name__ == '__main__':
+    unittest.main()
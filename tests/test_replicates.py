@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+test the columnar binary files of raw replicates:
+
+http://hg.mozilla.org/build/talos/file/tip/talos/replicates.py
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from talos import output
+from talos import replicates
+from talos import utils
+from test_output import talos_results
+
+class TestReplicates(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def check_run(self, data):
+        """the Replicates of test_output.talos_results()"""
+        self.assertEqual(data.run['title'], 'qm-pxp01')
+        self.assertEqual(data.run['sourcestamp'], 'abc')
+        self.assertEqual(data.strings['suite'], ['tsvgr_opacity', 'ts_paint'])
+        self.assertEqual(data.strings['page'], ['gearflowers.svg', 'composite-scale.svg',
+                                                'composite-scale-opacity.svg', 'NULL'])
+        self.assertEqual(data.strings['counter'], ['Private Bytes'])
+        table = data['replicates']
+        self.assertEqual(len(table), 18)
+        self.assertEqual(list(table['suite']), [0] * 15 + [1] * 3)
+        self.assertEqual(list(table['page']), [0] * 5 + [1] * 5 + [2] * 5 + [3] * 3)
+        self.assertEqual(list(table['value'][:5]), [74, 65, 68, 66, 62])
+        self.assertEqual(list(table['value'][15:]), [600, 700, 800])
+        # the main thread I/O isn't a counter sample
+        table = data['counters']
+        self.assertEqual(list(table['cycle']), [0, 0, 1])
+        self.assertEqual(list(table['value']), [100, 200, 300])
+
+    def test_roundtrip(self):
+        data = replicates.Replicates.from_talos_results(talos_results())
+        self.check_run(data)
+        path = os.path.join(self.tempdir, 'run.trep')
+        data.write(path)
+        self.check_run(replicates.read(path))
+
+    def test_errors(self):
+        string = replicates.Replicates.from_talos_results(talos_results()).tostring()
+        self.assertRaises(ValueError, replicates.parse, string[:-1])
+        self.assertRaises(ValueError, replicates.parse, 'MTIO' + string[4:])
+        self.assertRaises(ValueError, replicates.parse, 'TR')
+
+    def test_load(self):
+        """the runs of a directory are read in one set of columns, of the strings of all the runs"""
+        first = replicates.Replicates.from_talos_results(talos_results())
+        first.write(os.path.join(self.tempdir, 'a.trep'))
+        second = replicates.Replicates({'title': 'second'})
+        second['replicates'].extend(3, suite=second.string_id('suite', 'tp5o'), cycle=0,
+                                    page=second.string_id('page', 'composite-scale.svg'), value=[1., 2., 3.])
+        second.write(os.path.join(self.tempdir, 'b.trep'))
+        with open(os.path.join(self.tempdir, 'notes.txt'), 'w') as f:
+            f.write('not a run')
+
+        collection = replicates.load([self.tempdir])
+        self.assertEqual([run['title'] for run in collection.runs], ['qm-pxp01', 'second'])
+        self.assertEqual(collection.strings['suite'], ['tsvgr_opacity', 'ts_paint', 'tp5o'])
+        table = collection['replicates']
+        self.assertEqual(list(table['run']), [0] * 18 + [1] * 3)
+        self.assertEqual(list(table['suite'][-3:]), [2] * 3)
+        self.assertEqual(list(table['page'][-3:]), [1] * 3)
+        self.assertEqual(list(table['value'][-3:]), [1., 2., 3.])
+        self.assertEqual(list(collection['counters']['run']), [0] * 3)
+
+        # numpy or not
+        numpy = replicates.numpy
+        replicates.numpy = None
+        try:
+            pure = replicates.load([os.path.join(self.tempdir, 'b.trep'), os.path.join(self.tempdir, 'a.trep')])
+        finally:
+            replicates.numpy = numpy
+        self.assertEqual(list(pure['replicates']['run']), [0] * 3 + [1] * 18)
+        self.assertEqual(list(pure['replicates']['value']), list(table['value'][-3:]) + list(table['value'][:-3]))
+        self.assertEqual(list(replicates.load([])['replicates']['value']), [])
+
+    def test_output(self):
+        self.assertTrue(output.formats['replicates_urls'] is output.ReplicatesOutput)
+        self.assertRaises(utils.TalosError, output.ReplicatesOutput.check, ['http://localhost/'])
+
+        _output = output.ReplicatesOutput(talos_results())
+        path = os.path.join(self.tempdir, 'run.trep')
+        _output.output(_output(), 'file://' + path, {})
+        self.check_run(replicates.read(path))
+        _output.output(_output(), 'file://' + self.tempdir, {})
+        self.assertEqual(sorted(os.listdir(self.tempdir)), ['qm-pxp01-1234.trep', 'run.trep'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -28,9 +28,20 @@ _x_x_mozilla_page_load_details
 |11;hixie-007.xml;1628;1623;1623;1617;1622
 """
 
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
 import unittest
+from StringIO import StringIO
 import talos.filter
+import talos.output
 import talos.results
+import talos.utils
+from test_output import talos_results
 
 class TestPageloaderResults(unittest.TestCase):
 
@@ -78,5 +89,166 @@ class TestPageloaderResults(unittest.TestCase):
         self.assertEqual(filtered[0][0], 68.)
         self.assertEqual(filtered[-1][0], 1623.)
 
+class SlowOutput(talos.output.Output):
+    """
+    output to ok:// and error:// URLs, failing for error://; the outputs to
+    meet://<count> URLs wait for <count> of them to be outputting at once,
+    and those to block:// URLs until |released| is set
+    """
+
+    output_timeout = 10
+    calls = []
+    meeting = threading.Condition()
+    met = []
+    released = threading.Event()
+
+    def __call__(self):
+        self.calls.append('build')
+        return 'results'
+
+    def write_file(self, results, path):
+        with open(path, 'w') as f:
+            f.write(results)
+
+    def output(self, results, results_url, tbpl_output):
+        scheme, value = results_url.split('://')
+        if scheme == 'file':
+            self.write_file(results, value)
+            return
+        if scheme == 'meet':
+            with self.meeting:
+                self.met.append(results_url)
+                self.meeting.notify_all()
+                while len(self.met) < int(value):
+                    self.meeting.wait()
+        elif scheme == 'block':
+            self.released.wait()
+        elif scheme == 'error':
+            raise talos.utils.TalosError("error from %s" % results_url)
+        tbpl_output.setdefault('slow', {})[results_url] = results
+
+class TestOutput(unittest.TestCase):
+
+    def setUp(self):
+        talos.output.formats['slow_urls'] = SlowOutput
+        del SlowOutput.calls[:]
+        del SlowOutput.met[:]
+        SlowOutput.released.clear()
+
+    def tearDown(self):
+        SlowOutput.released.set()
+        del talos.output.formats['slow_urls']
+
+    def test_fan_out(self):
+        """the results are built once and output to all the URLs at once"""
+        results = talos.results.TalosResults(title='qm-pxp01', date=1234, browser_config={}, filters=[])
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            # each output only returns once all three are outputting
+            results.output({'slow_urls': ['meet://3', 'ok://0', 'meet://3', 'meet://3']})
+        finally:
+            printed = sys.stdout.getvalue()
+            sys.stdout = stdout
+        self.assertEqual(SlowOutput.calls, ['build'])
+        self.assertEqual(len(SlowOutput.met), 3)
+
+        prefix = 'TinderboxPrint: TalosResult: '
+        tbpl_output = json.loads([line for line in printed.splitlines() if line.startswith(prefix)][0][len(prefix):])
+        self.assertEqual(tbpl_output['slow'], {'meet://3': 'results', 'ok://0': 'results'})
+        self.assertEqual(sorted(tbpl_output['outputs'].keys()), ['meet://3', 'ok://0'])
+        self.assertEqual(tbpl_output['outputs']['ok://0']['format'], 'slow_urls')
+        self.assertEqual(tbpl_output['outputs']['ok://0']['status'], 'ok')
+        self.assertTrue(tbpl_output['outputs']['ok://0']['seconds'] >= 0)
+
+    def test_failures(self):
+        """
+        every output is done or timed out before the first failure, in
+        order, is raised
+        """
+        results = talos.results.TalosResults(title='qm-pxp01', date=1234, browser_config={}, filters=[])
+        tbpl_output = {}
+        _output = SlowOutput(results)
+        _output.output_timeout = 0.5
+        destinations = [talos.output.Destination('slow_urls', _output, 'results', url)
+                        for url in ('ok://0', 'block://', 'error://0', 'ok://1')]
+        try:
+            talos.output.fan_out(destinations, tbpl_output)
+        except talos.utils.TalosError, e:
+            self.assertTrue('Timed out outputting slow_urls results to block://' in str(e))
+        else:
+            self.fail("no error")
+        # the blocked output is left running
+        self.assertTrue(destinations[1].thread.is_alive())
+        SlowOutput.released.set()
+        destinations[1].thread.join()
+        self.assertEqual(dict((url, output['status']) for url, output in tbpl_output['outputs'].items()),
+                         {'ok://0': 'ok', 'block://': 'timed out', 'error://0': 'failed', 'ok://1': 'ok'})
+        self.assertEqual(sorted(tbpl_output['slow'].keys()), ['ok://0', 'ok://1'])
+
+        # as before, the TalosError of an output is raised by TalosResults.output
+        self.assertRaises(talos.utils.TalosError, results.output, {'slow_urls': ['error://0', 'ok://2']})
+        self.assertEqual(SlowOutput.calls, ['build'])
+
+class TestSpool(unittest.TestCase):
+
+    def setUp(self):
+        talos.output.formats['slow_urls'] = SlowOutput
+        del SlowOutput.calls[:]
+        self.tempdir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.tempdir)
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tempdir)
+        del talos.output.formats['slow_urls']
+
+    def test_spool(self):
+        """every format is spooled, and a failed output reuses the results built for results.out"""
+        results = talos_results()
+        spool = os.path.join(self.tempdir, 'spool')
+        results.browser_config['results_spool'] = spool
+        graph = os.path.join(self.tempdir, 'graph.txt')
+        output_formats = {'results_urls': ['file://' + graph],
+                          'perfherder_urls': ['file://' + os.path.join(self.tempdir, 'perfherder.json')],
+                          'slow_urls': ['error://0']}
+        self.assertRaises(talos.utils.TalosError, results.output, output_formats)
+        graphserver = results.payload('results_urls')
+
+        self.assertEqual(sorted(os.listdir(spool)),
+                         ['qm-pxp01-1234-perfherder.json', 'qm-pxp01-1234-results.txt', 'qm-pxp01-1234-slow.txt'])
+        with open(graph) as f:
+            text = f.read()
+        for path in (os.path.join(spool, 'qm-pxp01-1234-results.txt'), 'results.out'):
+            with open(path) as f:
+                self.assertEqual(f.read(), text)
+        with open(os.path.join(spool, 'qm-pxp01-1234-perfherder.json')) as f:
+            self.assertEqual(json.load(f)['suites'][0]['name'], 'tsvgr_opacity')
+
+        # a retry doesn't build the results again
+        self.assertRaises(talos.utils.TalosError, results.output, output_formats)
+        self.assertEqual(SlowOutput.calls, ['build'])
+        self.assertTrue(results.payload('results_urls') is graphserver)
+        self.assertEqual(len(os.listdir(spool)), 3)
+
+        # new results are
+        results.add(results.results[0])
+        self.assertFalse(results.payload('results_urls') is graphserver)
+
+    def test_spool_gzip(self):
+        """gzipped perfherder copies are named so"""
+        results = talos_results()
+        spool = os.path.join(self.tempdir, 'spool')
+        results.browser_config['results_spool'] = spool
+        results.output({'perfherder_urls': ['file://' + os.path.join(self.tempdir, 'perfherder.json.gz')]},
+                       perfherder_urls={'perfherder_gzip': True})
+        self.assertEqual(os.listdir(spool), ['qm-pxp01-1234-perfherder.json.gz'])
+        with gzip.open(os.path.join(spool, 'qm-pxp01-1234-perfherder.json.gz')) as f:
+            self.assertEqual(json.load(f)['suites'][0]['name'], 'tsvgr_opacity')
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+test the local results store, and comparing with it:
+
+http://hg.mozilla.org/build/talos/file/tip/talos/resultstore.py
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from talos import compare
+from talos import filter
+from talos import resultstore
+from talos.results import PageloaderResults, TalosResults, TestResults
+
+RESULTS = """_x_x_mozilla_page_load
+_x_x_mozilla_page_load_details
+|i|pagename|runs|
+|0;gearflowers.svg;74;65;68;66;62
+|1;composite-scale.svg;43;44;35;41;41
+|2;composite-scale-opacity.svg;19;16;19;19;21
+"""
+
+# graph server runs: [run id, [push id, ?, revision], date, value]
+GRAPH_DATA = {'stat': 'ok',
+              'test_runs': [[1, [10, None, 'aaa'], 1000, 100.0],
+                            [2, [11, None, 'bbb'], 2000, 110.0],
+                            [3, [11, None, 'bbb'], 2100, 112.0],
+                            [4, [12, None, 'ccc'], 3000, 90.0]]}
+
+class TestResultsStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'results.sqlite')
+        self.store = resultstore.ResultsStore(self.path)
+        self.series = ('tp5o', 'Mozilla-Inbound-Non-PGO', 'Linux64')
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_runs(self):
+        """runs are queried by date and revision, and replaced by their run id"""
+        runs = [(run[2], run[1][2], run[3], run[0]) for run in GRAPH_DATA['test_runs']]
+        self.store.add_runs(*self.series, runs=runs)
+        self.assertEqual(self.store.values(*self.series), [100.0, 110.0, 112.0, 90.0])
+        self.assertEqual(self.store.values(*self.series, start=2000, end=2100), [110.0, 112.0])
+        self.assertEqual(self.store.values(*self.series, revision='bbb'), [110.0, 112.0])
+        self.assertEqual(self.store.values('tp5o', 'Mozilla-Inbound', 'Linux64'), [])
+
+        self.store.add_runs(*self.series, runs=[(3000, 'ccc', 95.0, 4), (4000, 'ddd', 80.0, None), (4000, 'ddd', 81.0, None)])
+        self.assertEqual(self.store.values(*self.series), [100.0, 110.0, 112.0, 95.0, 80.0, 81.0])
+
+        # the runs are kept
+        self.store.close()
+        self.store = resultstore.ResultsStore(self.path)
+        self.assertEqual(len(self.store.runs(*self.series)), 6)
+
+    def test_sync(self):
+        """the graph server is only asked for series that weren't fetched recently"""
+        self.assertTrue(self.store.is_stale(*self.series, max_age=60))
+        requests = []
+        def getGraphData(testid, branchid, platformid):
+            requests.append((testid, branchid, platformid))
+            return GRAPH_DATA
+        original, compare.getGraphData = compare.getGraphData, getGraphData
+        try:
+            for i in range(2):
+                compare.syncGraphData(self.store, self.series, 255, 131, 35)
+            data = original(255, 131, 35, store=self.store, series=self.series)
+        finally:
+            compare.getGraphData = original
+        self.assertEqual(requests, [(255, 131, 35)])
+        self.assertFalse(self.store.is_stale(*self.series, max_age=60))
+        self.assertTrue(self.store.synced(*self.series) <= time.time())
+        self.assertEqual(compare.parseGraphResultsByDate(data, 1500, 2500),
+                         compare.parseGraphResultsByDate(GRAPH_DATA, 1500, 2500))
+        self.assertEqual(compare.parseGraphResultsByChangeset(data, 'ccc'),
+                         compare.summarize([90.0]))
+
+    def test_branch_names(self):
+        """series of branches the graph server gives the same name to are kept apart"""
+        self.assertEqual(compare.branchName(131), 'Mozilla-Inbound-Non-PGO')
+        self.assertEqual(compare.branchName(26), 'Cedar')
+        self.assertEqual(compare.branchName(23), 'Try (23)')
+        self.assertEqual(compare.branchName(113), 'Try (113)')
+
+    def test_talos_results(self):
+        """talos records a run per test, of the mean of its filtered page values but the max"""
+        _filters = filter.filters_args([['ignore_first', [1]], ['median', []]])
+        test = TestResults({'name': 'tsvgr_opacity'})
+        test.results.append(PageloaderResults(RESULTS))
+        talos_results = TalosResults(title='qm-pxp01', date=1234, filters=_filters,
+                                     browser_config={'branch_name': 'Mozilla-Inbound-Non-PGO', 'sourcestamp': 'abc'})
+        talos_results.add(test)
+        self.store.add_talos_results(talos_results, 'Linux64')
+        self.assertEqual(self.store.runs('tsvgr_opacity', 'Mozilla-Inbound-Non-PGO', 'Linux64'),
+                         [(1234, 'abc', (41 + 19) / 2., None)])
+
+    def test_summary_value(self):
+        self.assertEqual(resultstore.summary_value([3, 1, 2]), 1.5)
+        self.assertEqual(resultstore.summary_value([3]), 3)
+        self.assertEqual(resultstore.summary_value([]), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+test the incremental per day statistics of the weekday reports:
+
+http://hg.mozilla.org/build/talos/file/tip/talos/rollingstats.py
+"""
+
+import datetime
+import os
+import random
+import shutil
+import tempfile
+import time
+import unittest
+from talos import filter
+from talos import rollingstats
+
+DAY = 24 * 60 * 60
+
+def graph_runs(days, per_day=20, start=None, seed=0):
+    """graph server runs of |days| days from |start|, of values around 1000 that vary more on weekends"""
+    rand = random.Random(seed)
+    start = start or int(time.mktime(datetime.date(2014, 6, 2).timetuple())) # a Monday
+    runs = []
+    for d in range(days):
+        sigma = 20. if d % 7 >= 5 else 10.
+        for i in range(per_day):
+            runs.append([len(runs) + 1, [len(runs), None, 'rev%d' % len(runs)],
+                         start + d * DAY + i * 600, rand.gauss(1000., sigma)])
+    return runs
+
+def exact_weekdays(runs, mode='variance'):
+    """the weekday statistics as report.py computed them from all the runs"""
+    data = sorted(runs, key=lambda x: x[3])
+    data = data[int(0.1*len(data)):int(0.9*len(data) + 1)]
+    by_date = {}
+    for run in data:
+        by_date.setdefault(datetime.date.fromtimestamp(run[2]), []).append(run[3])
+    result = dict((i, []) for i in range(7))
+    for date, values in sorted(by_date.items()):
+        result[date.weekday()].append(filter.variance(values) if mode == 'variance' else len(values))
+    return result
+
+class TestSeriesStats(unittest.TestCase):
+
+    def test_buckets(self):
+        """values in a bucket are within the accuracy of each other"""
+        for value in (0.5, 1., 3.14159, 1000., 123456.):
+            index = rollingstats.bucket(value)
+            self.assertTrue(rollingstats.GAMMA ** (index - 1) < value <= rollingstats.GAMMA ** index)
+        self.assertEqual(rollingstats.bucket(0), rollingstats.ZERO_BUCKET)
+        self.assertEqual(rollingstats.weekday(datetime.date(2014, 6, 2).toordinal()), 0)
+        self.assertEqual(rollingstats.weekday(datetime.date(2014, 6, 8).toordinal()), 6)
+
+    def test_untrimmed(self):
+        """without trimming, the moments of each day are exact"""
+        runs = graph_runs(3)
+        stats = rollingstats.SeriesStats()
+        stats.add_runs(runs)
+        moments = stats.moments()
+        self.assertEqual(len(moments), 3)
+        for d, (count, mean, variance) in moments.items():
+            values = [run[3] for run in runs if rollingstats.day(run[2]) == d]
+            self.assertEqual(count, len(values))
+            self.assertAlmostEqual(mean, filter.mean(values))
+            self.assertAlmostEqual(variance, filter.variance(values), places=6)
+
+    def test_trimmed(self):
+        """the weekday statistics of the trimmed series are close to those of the exact values"""
+        runs = graph_runs(28)
+        stats = rollingstats.SeriesStats()
+        stats.add_runs(runs)
+        fractions = stats.fractions()
+        self.assertAlmostEqual(sum(count * fractions.get(index, 0) for buckets in stats.days.values()
+                                   for index, (count, total, squares) in buckets.items()),
+                               int(0.9 * len(runs) + 1) - int(0.1 * len(runs)))
+
+        for mode in ('variance', 'count'):
+            expected = exact_weekdays(runs, mode)
+            weekdays = stats.weekdays(mode)
+            for day in range(7):
+                self.assertEqual(len(weekdays[day]), 4)
+                self.assertTrue(abs(filter.mean(weekdays[day]) - filter.mean(expected[day])) <=
+                                0.15 * filter.mean(expected[day]))
+
+    def test_incremental(self):
+        """runs are only added once, whether at once or night after night"""
+        runs = graph_runs(14)
+        all_at_once = rollingstats.SeriesStats()
+        self.assertEqual(all_at_once.add_runs(runs), len(runs))
+        self.assertEqual(all_at_once.add_runs(runs), 0)
+
+        nightly = rollingstats.SeriesStats()
+        for night in range(1, 15):
+            # the graph server gives all the history every night
+            history = [run for run in runs if run[2] < runs[0][2] + night * DAY]
+            self.assertEqual(nightly.add_runs(history), 20)
+        self.assertEqual(nightly.days.keys(), all_at_once.days.keys())
+        for d in nightly.days:
+            self.assertEqual(sorted(nightly.days[d].keys()), sorted(all_at_once.days[d].keys()))
+        self.assertEqual(nightly.weekdays('count'), all_at_once.weekdays('count'))
+
+class TestRollingStats(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'report-state.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_state(self):
+        """the state is kept between reports"""
+        runs = graph_runs(7)
+        stats = rollingstats.RollingStats(self.path)
+        stats.series('tp5o', 'Linux64').add_runs(runs[:70])
+        stats.save()
+        self.assertEqual(os.listdir(self.tempdir), ['report-state.json'])
+
+        stats = rollingstats.RollingStats(self.path)
+        series = stats.series('tp5o', 'Linux64')
+        self.assertEqual(series.add_runs(runs), len(runs) - 70)
+        expected = rollingstats.SeriesStats()
+        expected.add_runs(runs)
+        self.assertEqual(series.weekdays('count'), expected.weekdays('count'))
+        for day in range(7):
+            for variance, expected_variance in zip(series.weekdays()[day], expected.weekdays()[day]):
+                self.assertAlmostEqual(variance, expected_variance)
+        self.assertEqual(stats.series('tp5o', 'Win7').days, {})
+
+        # an in memory state isn't saved
+        rollingstats.RollingStats().save()
+        self.assertEqual(os.listdir(self.tempdir), ['report-state.json'])
+
+    def test_max_age(self):
+        """the days older than the maximum age are dropped on load and save"""
+        runs = graph_runs(10, start=int(time.time()) - 10 * DAY)
+        stats = rollingstats.RollingStats(self.path)
+        stats.series('tp5o', 'Linux64').add_runs(runs)
+        stats.save()
+        days = sorted(stats.series('tp5o', 'Linux64').days)
+
+        stats = rollingstats.RollingStats(self.path, max_age=5)
+        oldest = rollingstats.day(time.time()) - 5
+        self.assertEqual(stats.oldest, oldest)
+        self.assertEqual(sorted(stats.series('tp5o', 'Linux64').days), [d for d in days if d >= oldest])
+        self.assertEqual(min(stats.series('tp5o', 'Linux64').days), oldest)
+
+        # runs older than the maximum age are dropped again when saved, and not added back
+        series = stats.series('tp5o', 'Win7')
+        series.add_runs(runs)
+        stats.save()
+        stats = rollingstats.RollingStats(self.path)
+        self.assertEqual(stats.series('tp5o', 'Win7').days.keys(), stats.series('tp5o', 'Linux64').days.keys())
+        self.assertEqual(stats.series('tp5o', 'Linux64').add_runs(runs), 0)
+
+if __name__ == '__main__':
+    unittest.main()
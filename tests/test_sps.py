@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+test talos' SPS profile post-processing:
+
+http://hg.mozilla.org/build/talos/file/tip/talos/profiler/sps.py
+"""
+
+import json
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+from talos.profiler import sps
+from talos.profiler import symbolication
+
+here = os.path.dirname(os.path.abspath(__file__))
+sps_dir = os.path.join(here, 'sps')
+raw_profile_path = os.path.join(sps_dir, 'profile.sps')
+golden_profile_path = os.path.join(sps_dir, 'profile.golden.sps')
+
+def load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+def make_symbolicator():
+    """a symbolicator that only knows about the symbols in tests/sps/symbols"""
+    return symbolication.ProfileSymbolicator({
+        "remoteSymbolServer": None,
+        "maxCacheEntries": 2000000,
+        "defaultApp": "FIREFOX",
+        "defaultOs": "WINDOWS",
+        "symbolPaths": {"FIREFOX": os.path.join(sps_dir, 'symbols'),
+                        "WINDOWS": os.path.join(sps_dir, 'no-symbols')}
+    })
+
+def expand_profile(profile):
+    """turn a compressed profile back into its frame locations"""
+    table = profile["symbolicationTable"]
+    threads = []
+    for thread in profile["profileJSON"]["threads"]:
+        samples = []
+        for sample in thread["samples"]:
+            locations = []
+            for frame in sample["frames"]:
+                if isinstance(frame, basestring):
+                    locations.append(table[frame])
+                else:
+                    locations.append(table[frame["location"]])
+            samples.append(locations)
+        threads.append(samples)
+    return threads
+
+class TestJSONStreamReader(unittest.TestCase):
+
+    def test_small_chunks(self):
+        """values split across buffer boundaries are decoded correctly"""
+        data = json.dumps({"a": [1, 22, 333, {"b": "c d"}], "e": 123456789, "f": [], "g": {}})
+        for chunk_size in (1, 3, 7, 1024):
+            reader = sps.JSONStreamReader(StringIO.StringIO(data), chunk_size=chunk_size)
+            result = {}
+            for key in reader.object_items():
+                if key == "a":
+                    result[key] = []
+                    for _ in reader.array_items():
+                        result[key].append(reader.value())
+                else:
+                    result[key] = reader.value()
+            self.assertEqual(result, json.loads(data))
+
+    def test_large_value(self):
+        """a multi-megabyte value is read in growing chunks, not decoded again per chunk"""
+        markers = [{"name": "marker %d" % i, "time": i * 0.5, "data": {"category": "Paint"}}
+                   for i in range(60000)]
+        data = json.dumps({"markers": markers, "samples": []})
+        self.assertTrue(len(data) > 4 << 20)
+        reads = []
+        class CountingFile(StringIO.StringIO):
+            def read(self, size=-1):
+                reads.append(size)
+                return StringIO.StringIO.read(self, size)
+        reader = sps.JSONStreamReader(CountingFile(data))
+        result = {}
+        for key in reader.object_items():
+            result[key] = reader.value()
+        self.assertEqual(result, json.loads(data))
+        # a read per doubling of the buffer, not one per chunk
+        self.assertTrue(len(reads) < 16, "%d reads" % len(reads))
+
+    def test_truncated(self):
+        """truncated input is an error"""
+        reader = sps.JSONStreamReader(StringIO.StringIO('{"a": [1, 2'))
+        def consume():
+            for key in reader.object_items():
+                for _ in reader.array_items():
+                    reader.value()
+        self.assertRaises(ValueError, consume)
+
+class TestSymbolicateAndCompress(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_golden(self):
+        """the fused post-processor gives the checked-in golden profile"""
+        profile = load_json(raw_profile_path)
+        sps.symbolicate_and_compress(profile, make_symbolicator())
+        self.assertEqual(json.loads(json.dumps(profile)), load_json(golden_profile_path))
+
+    def test_matches_three_step_path(self):
+        """same profile as symbolicate_profile followed by compress_profile"""
+        fused = load_json(raw_profile_path)
+        sps.symbolicate_and_compress(fused, make_symbolicator())
+        fused = json.loads(json.dumps(fused))
+
+        three_step = load_json(raw_profile_path)
+        make_symbolicator().symbolicate_profile(three_step)
+        sps.compress_profile(three_step)
+        three_step = json.loads(json.dumps(three_step))
+
+        self.assertEqual(expand_profile(fused), expand_profile(three_step))
+        self.assertEqual(sorted(fused["symbolicationTable"].values()),
+                         sorted(three_step["symbolicationTable"].values()))
+        for key in ("format", "libs", "meta"):
+            self.assertEqual(fused[key], three_step[key])
+
+    def test_streaming_matches_in_memory(self):
+        """the streaming path writes exactly the in-memory result"""
+        output_path = os.path.join(self.tempdir, 'compressed.sps')
+        libs = sps.read_libs(raw_profile_path)
+        self.assertEqual(libs, load_json(raw_profile_path)["libs"])
+        sps.symbolicate_and_compress_file(raw_profile_path, output_path, make_symbolicator(), libs)
+        self.assertEqual(load_json(output_path), load_json(golden_profile_path))
+
+    def test_without_symbolicator(self):
+        """string frames and unsymbolicated profiles are compressed too"""
+        profile = {"meta": {"version": 2},
+                   "threads": [{"samples": [{"frames": ["(root)", "js::RunScript"]},
+                                            {"frames": ["(root)", {"location": "0x10"}]}]}]}
+        profile_path = os.path.join(self.tempdir, 'raw.sps')
+        output_path = os.path.join(self.tempdir, 'compressed.sps')
+        with open(profile_path, 'w') as f:
+            json.dump(profile, f)
+        self.assertEqual(sps.read_libs(profile_path), None)
+        sps.symbolicate_and_compress_file(profile_path, output_path)
+
+        sps.symbolicate_and_compress(profile)
+        profile = json.loads(json.dumps(profile))
+        self.assertEqual(load_json(output_path), profile)
+        self.assertEqual(profile["symbolicationTable"], {"0": "(root)", "1": "js::RunScript", "2": "0x10"})
+        self.assertEqual(expand_profile(profile), [[["(root)", "js::RunScript"], ["(root)", "0x10"]]])
+
+class StubRemoteResolver(object):
+    """defers every address to a remote symbol server that finds |symbols|"""
+
+    forward = True
+
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self.deferred = set()
+        self.requests = 0
+
+    def resolve(self, address):
+        self.deferred.add(address)
+        return "%s (in libxul.so)" % address
+
+    def resolve_deferred(self):
+        self.requests += 1
+        deferred, self.deferred = self.deferred, set()
+        return dict((address, self.symbols[address]) for address in deferred)
+
+class StubSymbolicator(object):
+
+    def __init__(self, resolver):
+        self.resolver = resolver
+
+    def address_resolver(self, libs):
+        return self.resolver
+
+class TestRemoteSymbols(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_same_symbol(self):
+        """addresses the remote symbol server resolves to the same symbol share an index"""
+        symbols = {"0x10": "js::Interpret", "0x20": "js::Interpret", "0x30": "js::RunScript"}
+        def profile():
+            return {"libs": "[]",
+                    "threads": [{"samples": [{"frames": ["(root)", {"location": "0x10"}]},
+                                             {"frames": ["(root)", {"location": "0x20"}, {"location": "0x30"}]}]}]}
+
+        resolver = StubRemoteResolver(symbols)
+        in_memory = profile()
+        sps.symbolicate_and_compress(in_memory, StubSymbolicator(resolver))
+        in_memory = json.loads(json.dumps(in_memory))
+        self.assertEqual(resolver.requests, 1)
+        self.assertEqual(in_memory["symbolicationTable"],
+                         {"0": "(root)", "1": "js::Interpret", "2": "js::RunScript"})
+        self.assertEqual(expand_profile(in_memory),
+                         [[["(root)", "js::Interpret"], ["(root)", "js::Interpret", "js::RunScript"]]])
+
+        profile_path = os.path.join(self.tempdir, 'raw.sps')
+        output_path = os.path.join(self.tempdir, 'compressed.sps')
+        with open(profile_path, 'w') as f:
+            json.dump(profile(), f)
+        resolver = StubRemoteResolver(symbols)
+        sps.symbolicate_and_compress_file(profile_path, output_path, StubSymbolicator(resolver),
+                                          sps.read_libs(profile_path))
+        self.assertEqual(resolver.requests, 1)
+        self.assertEqual(load_json(output_path), in_memory)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+test talos' profile symbolication against a local stand-in symbol server:
+
+http://hg.mozilla.org/build/talos/file/tip/talos/profiler/
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import zipfile
+import mozhttpd
+from talos.profiler import symRemoteResolver
+from talos.profiler import symbolication
+from talos.profiler import symbolicationRequest
+from talos.profiler.symFileManager import SymFileManager, SymbolInfo
+
+class FakeSymbolServer(object):
+    """
+    a symbol server that knows the modules in |symbols|, a dict of
+    {(libName, breakpadId): {offset: symbol}}
+    """
+
+    def __init__(self, symbols, delay=0):
+        self.symbols = symbols
+        self.delay = delay
+        self.requests = []
+        self.httpd = mozhttpd.MozHttpd(port=0, urlhandlers=[
+            {'method': 'POST', 'path': '/', 'function': self.symbolicate}])
+        self.httpd.start(block=False)
+        self.url = 'http://127.0.0.1:%d/' % self.httpd.httpd.server_address[1]
+
+    def stop(self):
+        self.httpd.stop()
+
+    @mozhttpd.handlers.json_response
+    def symbolicate(self, request):
+        request = json.loads(request.body)
+        self.requests.append(request)
+        time.sleep(self.delay)
+        modules = [tuple(module) for module in request['memoryMap']]
+        stacks = []
+        for stack in request['stacks']:
+            stacks.append([self.symbols.get(modules[index], {}).get(offset, hex(offset))
+                           for index, offset in stack])
+        return (200, {'knownModules': [module in self.symbols for module in modules],
+                      'symbolicatedStacks': stacks})
+
+class TestRemoteSymbolication(unittest.TestCase):
+
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.server = FakeSymbolServer({('libxul.so', 'ABC0'): {0x10: 'main', 0x20: 'XRE_main'}})
+        symRemoteResolver.gResolvers.clear()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.cachedir)
+        symRemoteResolver.gResolvers.clear()
+
+    def symbolicate(self, stack, memoryMap, deadline=120):
+        """symbolicate |stack| with no local symbols, so that every PC is forwarded"""
+        symFileManager = SymFileManager({
+            'remoteSymbolServer': self.server.url,
+            'remoteSymbolCache': self.cachedir,
+            'remoteSymbolTimeout': 5,
+            'remoteSymbolDeadline': deadline,
+            'symbolPaths': {'FIREFOX': self.cachedir},
+        })
+        request = symbolicationRequest.SymbolicationRequest(symFileManager, {
+            'stacks': [stack], 'memoryMap': memoryMap,
+            'version': 4, 'symbolSources': ['FIREFOX']})
+        self.assertTrue(request.isValidRequest)
+        return request.Symbolicate(0), request.knownModules
+
+    def test_forwarding(self):
+        """unresolved PCs are resolved by the remote server"""
+        stack, known = self.symbolicate([[0, 0x10], [0, 0x20], [1, 0x30]],
+                                        [['libxul.so', 'ABC0'], ['libc.so', 'DEF0']])
+        self.assertEqual(stack, ['main', 'XRE_main', '0x30 (in libc.so)'])
+        self.assertEqual(known, [True, False])
+        # one request per module
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_cache(self):
+        """cached symbols and unknown modules aren't requested again"""
+        memoryMap = [['libxul.so', 'ABC0'], ['libc.so', 'DEF0']]
+        self.symbolicate([[0, 0x10], [1, 0x30]], memoryMap)
+        self.assertEqual(len(self.server.requests), 2)
+
+        stack, known = self.symbolicate([[0, 0x10], [1, 0x40]], memoryMap)
+        self.assertEqual(stack, ['main', '0x40 (in libc.so)'])
+        self.assertEqual(known, [True, False])
+        self.assertEqual(len(self.server.requests), 2)
+
+        # only the new offset is requested
+        stack, known = self.symbolicate([[0, 0x10], [0, 0x20]], memoryMap)
+        self.assertEqual(stack, ['main', 'XRE_main'])
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.server.requests[-1]['stacks'], [[[0, 0x20]]])
+
+        # the on-disk cache outlives the resolver
+        symRemoteResolver.gResolvers.clear()
+        stack, known = self.symbolicate([[0, 0x10], [0, 0x20], [1, 0x30]], memoryMap)
+        self.assertEqual(stack, ['main', 'XRE_main', '0x30 (in libc.so)'])
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_deadline(self):
+        """a slow server doesn't hold up symbolication past the deadline"""
+        self.server.delay = 1
+        start = time.time()
+        stack, known = self.symbolicate([[0, 0x10]], [['libxul.so', 'ABC0']], deadline=0.2)
+        self.assertTrue(time.time() - start < 0.8)
+        self.assertEqual(stack, ['0x10 (in libxul.so)'])
+        self.assertEqual(known, [False])
+
+        # the late response still ends up in the cache
+        time.sleep(1.5)
+        stack, known = self.symbolicate([[0, 0x10]], [['libxul.so', 'ABC0']])
+        self.assertEqual(stack, ['main'])
+        self.assertEqual(len(self.server.requests), 1)
+
+class TestSymbolZipIntegration(unittest.TestCase):
+
+    libs = [{"start": 0x1000, "end": 0x2000, "name": "/builds/libxul.so", "breakpadId": "ZIP0"},
+            {"start": 0x3000, "end": 0x4000, "name": "/lib/libc.so", "breakpadId": "ZIP1"}]
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.symbol_dir = os.path.join(self.tempdir, 'symbols')
+        os.mkdir(self.symbol_dir)
+
+        # a symbols zip with symbols for both libraries
+        zip_path = os.path.join(self.tempdir, 'symbols.zip')
+        zf = zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED)
+        zf.writestr('libxul.so/ZIP0/libxul.so.sym',
+                    'MODULE Linux x86_64 ZIP0 libxul.so\nFUNC 10 10 0 main\nPUBLIC 20 0 XRE_main\n' +
+                    ''.join('FUNC %x 1 0 filler_%d\n' % (0x100 + i, i) for i in range(2000)))
+        zf.writestr('libc.so/ZIP1/libc.so.sym', 'MODULE Linux x86_64 ZIP1 libc.so\nFUNC 10 10 0 malloc\n')
+        zf.close()
+        with open(zip_path, 'rb') as f:
+            self.zip_data = f.read()
+
+        self.ranges = []
+        self.httpd = mozhttpd.MozHttpd(port=0, urlhandlers=[
+            {'method': 'GET', 'path': '/symbols.zip', 'function': self.serve_zip}])
+        self.httpd.start(block=False)
+        self.url = 'http://127.0.0.1:%d/symbols.zip' % self.httpd.httpd.server_address[1]
+
+    def tearDown(self):
+        self.httpd.stop()
+        shutil.rmtree(self.tempdir)
+
+    def serve_zip(self, request):
+        """serve the symbols zip, honouring range requests"""
+        range_header = request.headers.get('Range')
+        self.ranges.append(range_header)
+        if range_header:
+            start = int(range_header[len('bytes='):].rstrip('-'))
+            return (206, {'Content-Length': len(self.zip_data) - start}, self.zip_data[start:])
+        return (200, {'Content-Length': len(self.zip_data)}, self.zip_data)
+
+    def make_symbolicator(self):
+        return symbolication.ProfileSymbolicator({
+            "remoteSymbolServer": None,
+            "maxCacheEntries": 2000000,
+            "symbolPaths": {"FIREFOX": self.symbol_dir, "WINDOWS": self.symbol_dir}
+        })
+
+    def test_resumed_download(self):
+        """a partial download is resumed where it stopped"""
+        symbolicator = self.make_symbolicator()
+        zip_path = symbolicator._downloaded_zip_file(self.url)
+        os.makedirs(os.path.dirname(zip_path))
+        with open(zip_path + '.part', 'wb') as f:
+            f.write(self.zip_data[:100])
+
+        symbolicator.integrate_symbol_zip_from_url(self.url)
+        self.assertEqual(self.ranges, ['bytes=100-'])
+        with open(zip_path, 'rb') as f:
+            self.assertEqual(f.read(), self.zip_data)
+        symbolicator.close()
+
+        # the download is only done once
+        symbolicator = self.make_symbolicator()
+        symbolicator.integrate_symbol_zip_from_url(self.url)
+        self.assertEqual(len(self.ranges), 1)
+        symbolicator.close()
+
+    def test_lazy_extraction(self):
+        """only the symbols of libraries that are used get extracted"""
+        symbolicator = self.make_symbolicator()
+        symbolicator.integrate_symbol_zip_from_url(self.url)
+        self.assertFalse(os.path.exists(os.path.join(self.symbol_dir, 'libxul.so')))
+
+        resolver = symbolicator.address_resolver(json.dumps(self.libs))
+        self.assertEqual(resolver.resolve('0x1018'), 'main (in libxul.so)')
+        self.assertEqual(resolver.resolve('0x1024'), 'XRE_main (in libxul.so)')
+        symbolicator.close()
+
+        sym_path = os.path.join(self.symbol_dir, 'libxul.so', 'ZIP0', 'libxul.so.sym')
+        self.assertTrue(os.path.exists(sym_path))
+        self.assertTrue(os.path.exists(sym_path + '.idx'))
+        self.assertFalse(os.path.exists(os.path.join(self.symbol_dir, 'libc.so')))
+
+        # the index holds the same symbols as the .sym file
+        from_index = SymbolInfo.FromIndexFile(sym_path + '.idx')
+        from_sym = SymFileManager({}).ParseSymbolFile(sym_path)
+        self.assertEqual(list(from_index.sortedAddresses), from_sym.sortedAddresses)
+        self.assertEqual(from_index.sortedSymbols, from_sym.sortedSymbols)
+        self.assertEqual(from_index.Lookup(0x10), 'main')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+test the main thread I/O whitelist:
+
+http://hg.mozilla.org/build/talos/file/tip/talos/whitelist.py
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from talos import mainthreadio
+from talos import whitelist
+
+# where the substituted directories are on a test machine
+DIRS = [('{profile}', 'C:\\Users\\cltbld\\AppData\\Local\\Temp\\tmpk2rxyz\\profile'),
+        ('{xre}', 'C:\\Program Files (x86)\\Mozilla Firefox'),
+        ('{fonts}', 'C:\\Windows\\Fonts'),
+        ('{appdata}', 'C:\\Users\\cltbld\\AppData'),
+        ('{desktop}', 'C:\\Users\\cltbld\\Desktop'),
+        ('{talos}', 'C:\\slave\\talos-data\\talos')]
+
+# whitelist entries that no file name gets rewritten to
+UNREACHABLE = ['c:\\users\\public\\desktop.ini',
+               'c:\\users\\desktop.ini',
+               'c:\\programdata\\microsoft\\desktop.ini',
+               '{appdata}\\roaming\\microsoft\\desktop.ini',
+               'c:\\users\\cltbld\\appdata',
+               'c:\\users\\cltbld\\appdata\\local',
+               '{profile}\\',
+               '{profile}\\{thumbnails}']
+
+def real_path(entry):
+    """a file name that |entry| of the whitelist stands for"""
+    for subst, path in DIRS:
+        if entry.lower().startswith(subst):
+            return path + entry[len(subst):]
+    return entry
+
+class TestWhitelist(unittest.TestCase):
+
+    def setUp(self):
+        self.xre_path = tempfile.mkdtemp()
+        with open(os.path.join(self.xre_path, 'dependentlibs.list'), 'w') as f:
+            f.write('mozglue.dll\nxul.dll\n')
+        self.whitelist = self.create()
+        with open(mainthreadio.WHITELIST_FILENAME) as f:
+            self.entries = json.load(f).keys()
+
+    def tearDown(self):
+        shutil.rmtree(self.xre_path)
+
+    def create(self):
+        return whitelist.Whitelist(test_name='mainthreadio',
+                                   paths={'{xre}': self.xre_path},
+                                   path_substitutions=mainthreadio.PATH_SUBSTITUTIONS,
+                                   name_substitutions=mainthreadio.NAME_SUBSTITUTIONS)
+
+    def data(self, filenames):
+        return dict((('normal', 'PoisonIOInterposer', filename, 'read'),
+                     {mainthreadio.KEY_COUNT: 1, mainthreadio.KEY_RUN_COUNT: 1, mainthreadio.KEY_DURATION: 0.5})
+                    for filename in filenames)
+
+    def test_shipped_whitelist(self):
+        """files of mtio-whitelist.json are whitelisted, and others aren't"""
+        self.assertTrue(self.whitelist.load(mainthreadio.WHITELIST_FILENAME))
+        filenames = [real_path(entry) for entry in self.entries if entry.lower() not in UNREACHABLE]
+        self.assertEqual(self.whitelist.check(self.data(filenames), mainthreadio.TUPLE_FILENAME_INDEX), {})
+
+        unexpected = ['C:\\Windows\\System32\\evil.dll', real_path('{profile}\\sessionstore.js')]
+        errors = self.whitelist.check(self.data(filenames + unexpected), mainthreadio.TUPLE_FILENAME_INDEX)
+        self.assertEqual(sorted(errors.keys()), ['c:\\windows\\system32\\evil.dll', '{profile}\\sessionstore.js'])
+
+    def test_sanitize_is_pure(self):
+        """sanitizing file names doesn't change the whitelist"""
+        self.whitelist.load(mainthreadio.WHITELIST_FILENAME)
+        listmap = dict(self.whitelist.listmap)
+        filenames = [real_path(entry) for entry in self.entries]
+        first = [self.whitelist.sanitize_filename(filename) for filename in filenames]
+        self.assertEqual(self.whitelist.listmap, listmap)
+        self.assertEqual([self.whitelist.sanitize_filename(filename) for filename in filenames], first)
+        # a fresh whitelist with an empty cache agrees
+        self.assertEqual([self.create().sanitize_filename(filename) for filename in filenames], first)
+
+    def test_x86(self):
+        """'program files (x86)' matches 'program files'"""
+        self.assertEqual(self.whitelist.sanitize_filename('C:\\Program Files (x86)\\Windows Media Player\\wmp.dll'),
+                         'c:\\program files\\{media_player}')
+
+    def test_profile_dirs(self):
+        """the directories above the profile are found from the most common profile location"""
+        profile = DIRS[0][1]
+        filenames = [profile + '\\prefs.js', profile + '\\places.sqlite',
+                     'C:\\Users\\cltbld\\AppData\\Roaming\\Mozilla\\Firefox\\profiles.ini']
+        expected = {'{appdata}\\local\\temp\\tmpk2rxyz': {},
+                    '{appdata}\\local': {},
+                    '{appdata}\\local\\temp': {}}
+        self.assertEqual(self.whitelist.profile_dirs(filenames), expected)
+        self.assertEqual(self.whitelist.profile_dirs(reversed(filenames)), expected)
+        self.assertEqual(self.whitelist.profile_dirs(['C:\\Windows\\System32\\ntdll.dll']), {})
+
+        self.whitelist.load(mainthreadio.WHITELIST_FILENAME)
+        data = self.data(filenames[:2] + ['C:\\Users\\cltbld\\AppData\\Local\\Temp\\tmpk2rxyz'])
+        self.assertEqual(self.whitelist.check(data, mainthreadio.TUPLE_FILENAME_INDEX).keys(),
+                         ['{appdata}\\local\\temp\\tmpk2rxyz'])
+        self.whitelist.allow_profile_dirs(data, mainthreadio.TUPLE_FILENAME_INDEX)
+        self.assertEqual(self.whitelist.check(data, mainthreadio.TUPLE_FILENAME_INDEX), {})
+
+    def test_baseline(self):
+        """a baseline ignores every file that was accessed"""
+        filenames = [real_path('{profile}\\prefs.js'), real_path('{xre}\\omni.ja'), 'C:\\Windows\\Prefetch\\PLUGIN-CONTAINER.EXE-1234.pf']
+        data = self.data(filenames)
+        expected = {'{profile}\\prefs.js': {'ignore': True},
+                    '{xre}\\omni.ja': {'ignore': True},
+                    'c:\\windows\\{prefetch}': {'ignore': True}}
+        self.assertEqual(self.whitelist.build_baseline(data, mainthreadio.TUPLE_FILENAME_INDEX), expected)
+
+        baseline = os.path.join(self.xre_path, 'baseline.json')
+        self.whitelist.save_baseline(data, mainthreadio.TUPLE_FILENAME_INDEX, baseline)
+        self.assertEqual(self.whitelist.listmap, {})
+        with open(baseline) as f:
+            self.assertEqual(json.load(f), expected)
+
+if __name__ == '__main__':
+    unittest.main()
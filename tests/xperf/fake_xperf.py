@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+a stand-in for xperf's trace processing, where traces are CSV exports:
+
+  fake_xperf.py -merge <trace> [<trace> ...] <output>
+    concatenates the traces into <output>
+  fake_xperf.py -i <trace> [-o <output>]
+    copies <trace> to <output>, or to the standard output
+  fake_xperf.py -stop [...]
+    does nothing, the traces being there already
+"""
+
+import shutil
+import sys
+
+def main(args=sys.argv[1:]):
+    if args[0] == '-merge':
+        with open(args[-1], 'wb') as output:
+            for trace in args[1:-1]:
+                with open(trace, 'rb') as f:
+                    shutil.copyfileobj(f, output)
+    elif args[0] == '-i':
+        with open(args[1], 'rb') as f:
+            if '-o' in args:
+                with open(args[args.index('-o') + 1], 'wb') as output:
+                    shutil.copyfileobj(f, output)
+            else:
+                output = getattr(sys.stdout, 'buffer', sys.stdout)
+                shutil.copyfileobj(f, output)
+    elif args[0] == '-stop':
+        pass
+    else:
+        sys.exit("unsupported arguments: %s" % ' '.join(args))
+
+if __name__ == '__main__':
+    main()